@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+"""
+Shared Airtable REST client used by the uploader and fetcher.
+
+Requests go through one pooled keep-alive requests.Session. The async client
+runs them on worker threads, gated by a token bucket tuned to Airtable's
+per-base quota (5 requests/sec) and a bound on in-flight requests, so
+throughput is limited by the API quota rather than by fixed sleeps.
+"""
+import asyncio
+import os
+import random
+import time
+from urllib.parse import quote
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# Overridable so every command can be pointed at a local mock (see mock_airtable_server.py)
+AIRTABLE_API_URL = os.environ.get("AIRTABLE_API_URL", "https://api.airtable.com/v0")
+AIRTABLE_BATCH_SIZE = 10  # Max records per create/update/delete request
+AIRTABLE_REQUESTS_PER_SECOND = 5  # Per-base rate limit
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+# A POST that timed out or got a 5xx may still have created its records, so only a 429 (never applied) is retried
+POST_RETRY_STATUS_CODES = {429}
+REQUEST_TIMEOUT = (10, 60)  # (connect, read) seconds, so a stalled connection is retried instead of hanging
+
+
+def make_session(api_key, pool_size=10):
+    """Returns a requests.Session with auth headers and a keep-alive pool."""
+    session = requests.Session()
+    session.headers.update({
+        "Authorization": f"Bearer {api_key}",
+        "Content-Type": "application/json",
+    })
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def table_url(base_id, table_name, api_url=None):
+    return f"{(api_url or AIRTABLE_API_URL).rstrip('/')}/{base_id}/{quote(table_name, safe='')}"
+
+
+def formula_string(value):
+    """Quotes a value for use inside an Airtable formula."""
+    return "'" + str(value).replace("\\", "\\\\").replace("'", "\\'") + "'"
+
+
+def retry_delay(attempt, response=None, base_delay=1.0, max_delay=60.0):
+    """Seconds to wait before retry number `attempt` (0-based).
+
+    Honors a Retry-After header when the server sends one; otherwise uses
+    exponential backoff with full jitter.
+    """
+    if response is not None:
+        retry_after = response.headers.get("Retry-After")
+        if retry_after:
+            try:
+                return max(0.0, float(retry_after))
+            except ValueError:
+                pass
+    return random.uniform(0, min(max_delay, base_delay * (2 ** attempt)))
+
+
+def batched(items, size=AIRTABLE_BATCH_SIZE):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+class TokenBucket:
+    """Async token bucket: allows `rate` acquisitions per second with bursts up to `capacity`."""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or 1
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class AsyncAirtableClient:
+    """Rate-limited async access to one Airtable base.
+
+    At most `max_in_flight` requests run at once, and request starts are
+    spread by a token bucket at `requests_per_second`.
+    """
+
+    def __init__(self, api_key, base_id, requests_per_second=AIRTABLE_REQUESTS_PER_SECOND,
+                 max_in_flight=4, api_url=None, max_retries=5, timeout=REQUEST_TIMEOUT):
+        self.base_id = base_id
+        self.api_url = api_url
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self.session = make_session(api_key, pool_size=max_in_flight)
+        self._bucket = TokenBucket(requests_per_second)
+        self._in_flight = asyncio.Semaphore(max_in_flight)
+        self.request_count = 0
+        self.retry_count = 0
+
+    async def request(self, method, table_name, json=None, params=None):
+        """Sends one request and returns the decoded JSON body.
+
+        Rate-limit (429) and server (5xx) responses, connection errors and
+        timeouts are retried up to max_retries times with backoff; the wait happens outside
+        the in-flight slot so other requests keep going. POST (create) is not
+        idempotent and is only retried on 429; other failures are raised for
+        the caller to reconcile.
+        """
+        url = table_url(self.base_id, table_name, self.api_url)
+        retry_status_codes = POST_RETRY_STATUS_CODES if method == "POST" else RETRY_STATUS_CODES
+        attempt = 0
+        while True:
+            response = None
+            try:
+                async with self._in_flight:
+                    await self._bucket.acquire()
+                    self.request_count += 1
+                    response = await asyncio.to_thread(self.session.request, method, url, json=json, params=params,
+                                                      timeout=self.timeout)
+                if response.status_code not in retry_status_codes:
+                    response.raise_for_status()
+                    return response.json()
+                if attempt >= self.max_retries:
+                    response.raise_for_status()
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                if attempt >= self.max_retries or method == "POST":
+                    raise
+                reason = "timeout" if isinstance(e, requests.exceptions.Timeout) else "connection error"
+            delay = retry_delay(attempt, response)
+            if response is not None:
+                reason = f"HTTP {response.status_code}"
+            print(f"Retrying {method} {table_name} after {reason} in {delay:.1f}s "
+                  f"(attempt {attempt + 1}/{self.max_retries})")
+            self.retry_count += 1
+            attempt += 1
+            await asyncio.sleep(delay)
+
+    async def iter_pages(self, table_name, fields=None, filter_formula=None, page_size=100, offset=None):
+        """Yields (records, next_offset) per page; next_offset is None on the last page.
+
+        Passing a saved offset continues an earlier listing from that page.
+        """
+        params = [("pageSize", page_size)]
+        params += [("fields[]", field) for field in fields or []]
+        if filter_formula:
+            params.append(("filterByFormula", filter_formula))
+        while True:
+            page = await self.request("GET", table_name, params=params + ([("offset", offset)] if offset else []))
+            offset = page.get("offset")
+            yield page.get("records", []), offset
+            if not offset:
+                return
+
+    async def list_records(self, table_name, fields=None, filter_formula=None, page_size=100):
+        """Returns every record of a table, following offset pagination.
+
+        `fields` limits the response to the named fields.
+        """
+        records = []
+        async for page, _ in self.iter_pages(table_name, fields, filter_formula, page_size):
+            records.extend(page)
+        return records
+
+    async def find_first(self, table_name, field_name, value):
+        """Returns the first record whose field equals value, or None."""
+        params = {"filterByFormula": f"{{{field_name}}}={formula_string(value)}", "maxRecords": 1}
+        records = (await self.request("GET", table_name, params=params)).get("records", [])
+        return records[0] if records else None
+
+    async def create(self, table_name, fields_list, typecast=False):
+        """Creates up to AIRTABLE_BATCH_SIZE records; returns the created records."""
+        body = {"records": [{"fields": fields} for fields in fields_list], "typecast": typecast}
+        return (await self.request("POST", table_name, json=body)).get("records", [])
+
+    async def update(self, table_name, records, typecast=False):
+        """PATCHes up to AIRTABLE_BATCH_SIZE records given as {"id": ..., "fields": {...}}."""
+        body = {"records": records, "typecast": typecast}
+        return (await self.request("PATCH", table_name, json=body)).get("records", [])
+
+    async def delete(self, table_name, record_ids):
+        """Deletes up to AIRTABLE_BATCH_SIZE records by ID."""
+        params = [("records[]", record_id) for record_id in record_ids]
+        return (await self.request("DELETE", table_name, params=params)).get("records", [])
+
+    def close(self):
+        self.session.close()
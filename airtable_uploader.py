@@ -1,9 +1,19 @@
 #!/usr/bin/env python3
 import json
 import os
+import sys
 import argparse
+import asyncio
+import hashlib
 import time
-from airtable import Airtable
+
+from airtable_api import AIRTABLE_REQUESTS_PER_SECOND, AsyncAirtableClient, batched
+from corpus_scanner import SEGMENT_FILE_SUFFIXES
+from json_stream import NDJSON_SUFFIXES, iter_records
+from segment_model import expand_segment
+
+SYNC_STATE_FILENAME = ".airtable_sync_state.json"
+JOURNAL_FILENAME = ".airtable_upload_journal.jsonl"
 
 # Helper function to handle potentially long text fields for Airtable
 # Airtable has a limit of 100,000 characters for long text fields.
@@ -16,136 +26,528 @@ def truncate_text(text, limit=99900):
 # Or ensure it's a list for multi-select
 def format_for_airtable(value):
     if isinstance(value, list):
-        # For multi-select fields, Airtable Python wrapper expects a list of strings
+        # For multi-select fields, Airtable expects a list of strings
         return [str(v) for v in value]
     return value
 
-def upload_to_airtable(api_key, base_id, chapters_table_name, segments_table_name, staging_dir):
-    """Uploads segmented chapter data to Airtable."""
-    
-    airtable_chapters = Airtable(base_id, chapters_table_name, api_key)
-    airtable_segments = Airtable(base_id, segments_table_name, api_key)
-    
-    processed_chapters = 0
-    processed_segments = 0
+def staging_files(staging_dir):
+    """Returns the segmented chapter files in a staging directory, in upload order.
 
-    print(f"Starting upload from {staging_dir}...")
+    Both staging files (*_segmented_granular.json) and segmenter output
+    (*_segments.json, *_segments.ndjson) are picked up.
+    """
+    return [os.path.join(staging_dir, filename) for filename in sorted(os.listdir(staging_dir))
+            if filename.endswith(SEGMENT_FILE_SUFFIXES)]
+
+def build_chapter_fields(data):
+    """Builds the Chapters table record for a segmented chapter file."""
+    chapter_id_from_file = data.get("ChapterID", "UnknownChapter")
+    chapter_number_str = chapter_id_from_file.replace("CH", "")
+    try:
+        chapter_number = int(chapter_number_str)
+    except ValueError:
+        chapter_number = 0 # Or handle error appropriately
+        print(f"Warning: Could not parse chapter number from {chapter_id_from_file}")
+
+    # Calculate total word count for the chapter from its segments
+    chapter_word_count = 0
+    if data.get("Segments"):
+        for seg in data["Segments"]:
+            chapter_word_count += len(seg.get("SegmentText", "").split())
+
+    return {
+        "Chapter ID": chapter_id_from_file,
+        "Chapter Number": chapter_number,
+        "Chapter Title": f"Chapter {chapter_number_str} (Title Placeholder)", # Placeholder
+        "Chapter Status": "Uploaded to Airtable",
+        "Word Count": chapter_word_count,
+        # "Synopsis": "Synopsis placeholder...", # Add if available
+        # "CharactersAppearing": [], # Link to Characters table - requires existing character records
+        # "PrimaryThemes": [], # Link to Themes table
+    }
+
+def build_segment_fields(seg_data, chapter_record_id):
+    """Maps a segment from the segmenter output (full or compact) to Text Segments table fields."""
+    seg_data = expand_segment(seg_data)
+    airtable_segment_data = {
+        "Segment ID": seg_data.get("SegmentID"),
+        "Chapter Link": [chapter_record_id], # Link to the chapter record
+        "Segment Order": seg_data.get("SegmentOrder"),
+        "Segment Text": truncate_text(seg_data.get("SegmentText")),
+        "Narrative Mode": seg_data.get("PrimaryNarrativeMode"),
+        "SecondaryNarrativeModes": format_for_airtable(seg_data.get("SecondaryNarrativeModes")),
+        # "DialogueSpeaker": [], # Link to Characters - needs existing record ID
+        # "DialogueAddressees": [], # Link to Characters
+        "DialogueContext": seg_data.get("DialogueContext"),
+        "DialogueTone": format_for_airtable(seg_data.get("DialogueTone")),
+        "PlotFunctionTags": format_for_airtable(seg_data.get("PlotFunctionTags")),
+        "MysteryTags": format_for_airtable(seg_data.get("MysteryTags")),
+        "CharacterArcTags": format_for_airtable(seg_data.get("CharacterArcTags")),
+        "WorldBuildingTags": format_for_airtable(seg_data.get("WorldBuildingTags")),
+        "StructuralOntologyTags": format_for_airtable(seg_data.get("StructuralOntologyTags")),
+        "AuthorialIntentTags": format_for_airtable(seg_data.get("AuthorialIntentTags")),
+        "ThematicKeywordsRaw": seg_data.get("ThematicKeywordsRaw"),
+        # "CharactersInSegment": [], # Link to Characters
+        # "CharacterPOVHolder": [], # Link to Characters
+        "LocationInSegment": seg_data.get("LocationInSegment"), # Assumes text for now
+        "TimeReferenceInSegment": seg_data.get("TimeReferenceInSegment"),
+        # "ClueReferenceInSegment": [], # Link to Clues
+        "SegmentNotes": truncate_text(seg_data.get("SegmentNotes") or ""),
+    }
+
+    # Filter out None values, as Airtable API might not like them for certain field types
+    # For linked records, empty lists are fine. For single/multi-select, None might be an issue.
+    # It's safer to omit the key if the value is None and the field is not required.
+    return {k: v for k, v in airtable_segment_data.items() if v is not None and v != []}
+
+def load_chapter_file(filepath):
+    """Reads a segmented chapter file, or returns None (after reporting) if it cannot be read."""
+    try:
+        if str(filepath).endswith(NDJSON_SUFFIXES):
+            # Streamed segmenter output has no header; the chapter comes from the SegmentIDs
+            segments = list(iter_records(filepath))
+            data = {"Segments": segments}
+            if segments:
+                data["ChapterID"] = segments[0]["SegmentID"].split("_SEG")[0]
+        else:
+            with open(filepath, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+    except Exception as e:
+        print(f"Error reading {os.path.basename(filepath)}: {e}")
+        return None
+    # Segments stay as loaded; compact ones are expanded one at a time by build_segment_fields
+    return data
+
+class UploadJournal:
+    """Append-only JSON-lines log of segment batches and their outcome.
+
+    Every batch is logged as "pending" before it is sent and as "done" or
+    "failed" afterwards, so a crash leaves an honest record. On resume, the
+    segments of batches that reached "done" are skipped; everything else is
+    sent again. Segments of batches that never reached "done" are kept in
+    `unconfirmed`: their create may have gone through anyway, so they are
+    checked against Airtable before being sent again.
+    """
+
+    def __init__(self, path, resume=False):
+        self.path = path
+        self.completed = set()
+        self.unconfirmed = set()
+        self._batch_number = 0
+        if resume and os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue  # A torn last line from an interrupted run
+                    if entry.get("Status") == "done":
+                        self.completed.update(entry.get("SegmentIDs", []))
+                    else:
+                        self.unconfirmed.update(entry.get("SegmentIDs", []))
+                    self._batch_number = max(self._batch_number, entry.get("Batch", 0))
+            self.unconfirmed -= self.completed
+        self._file = open(path, 'a' if resume else 'w', encoding='utf-8')
+
+    def next_batch(self):
+        self._batch_number += 1
+        return self._batch_number
+
+    def record(self, batch_number, chapter_id, segment_ids, status, **details):
+        entry = {"Batch": batch_number, "ChapterID": chapter_id, "SegmentIDs": segment_ids,
+                 "Status": status, "Time": round(time.time(), 3)}
+        entry.update(details)
+        self._file.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+async def fetch_chapter_index(client, chapters_table_name):
+    """Fetches the full Chapter ID -> record ID map in one paginated, projected list call."""
+    records = await client.list_records(chapters_table_name, fields=["Chapter ID"])
+    return {record["fields"]["Chapter ID"]: record["id"]
+            for record in records if record.get("fields", {}).get("Chapter ID")}
+
+async def reconcile_unconfirmed_segments(client, segments_table_name, journal):
+    """Marks journaled segments whose batch failed but which exist in Airtable (by Segment ID) as completed."""
+    if not journal.unconfirmed:
+        return 0
+    existing = {record.get("fields", {}).get("Segment ID")
+                for record in await client.list_records(segments_table_name, fields=["Segment ID"])}
+    found = journal.unconfirmed & existing
+    if found:
+        journal.record(journal.next_batch(), None, sorted(found), "done", Reconciled=True)
+    journal.completed |= found
+    journal.unconfirmed -= found
+    return len(found)
+
+async def resolve_chapter_record(client, chapters_table_name, chapter_data, chapter_index=None):
+    """Returns the record ID of the chapter, creating the record if it does not exist yet.
+
+    With a prefetched chapter_index (Chapter ID -> record ID), no lookup request is
+    made and newly created chapters are added to the index.
+    """
+    chapter_id_from_file = chapter_data["Chapter ID"]
+    # For simplicity, chapter records are identified uniquely by ChapterID and never updated.
+    if chapter_index is not None:
+        if chapter_id_from_file in chapter_index:
+            return chapter_index[chapter_id_from_file]
+    else:
+        existing_chapter = await client.find_first(chapters_table_name, "Chapter ID", chapter_id_from_file)
+        if existing_chapter:
+            print(f"Chapter {chapter_id_from_file} already exists. Record ID: {existing_chapter['id']}. Skipping chapter creation.")
+            return existing_chapter['id']
+    created_chapter = (await client.create(chapters_table_name, [chapter_data]))[0]
+    print(f"Created Chapter record for {chapter_id_from_file}: {created_chapter['id']}")
+    if chapter_index is not None:
+        chapter_index[chapter_id_from_file] = created_chapter['id']
+    return created_chapter['id']
+
+async def upload_chapter_file(client, filepath, chapters_table_name, segments_table_name, totals, chapter_index=None,
+                              journal=None):
+    """Uploads one chapter file: finds or creates its chapter record, then sends all segment batches concurrently.
+
+    With a journal, every batch outcome is logged and segments already
+    journaled as uploaded are skipped.
+    """
+    print(f"Processing file: {filepath}")
+    data = load_chapter_file(filepath)
+    if data is None:
+        totals["failed_files"] += 1
+        return
+    chapter_data = build_chapter_fields(data)
+    chapter_id_from_file = chapter_data["Chapter ID"]
+
+    # 1. Create/Update Chapter Record
+    try:
+        chapter_record_id = await resolve_chapter_record(client, chapters_table_name, chapter_data, chapter_index)
+        totals["chapters"] += 1
+    except Exception as e:
+        print(f"Error creating/finding chapter record for {chapter_id_from_file}: {e}")
+        totals["failed"] += len(data.get("Segments", []))
+        return # Skip segments if chapter creation failed
+
+    # 2. Create Segment Records, batches in flight together (bounded by the client)
+    segment_records = [build_segment_fields(seg_data, chapter_record_id) for seg_data in data.get("Segments", [])]
+    if journal is not None and journal.completed:
+        remaining = [fields for fields in segment_records if fields.get("Segment ID") not in journal.completed]
+        if len(remaining) < len(segment_records):
+            print(f"Skipping {len(segment_records) - len(remaining)} segments of {chapter_id_from_file} "
+                  f"already uploaded.")
+        segment_records = remaining
+
+    async def upload_batch(batch):
+        segment_ids = [fields.get("Segment ID") for fields in batch]
+        batch_number = None
+        if journal is not None:
+            batch_number = journal.next_batch()
+            journal.record(batch_number, chapter_id_from_file, segment_ids, "pending")
+        try:
+            created = await client.create(segments_table_name, batch)
+        except Exception as e:
+            print(f"Error batch inserting segments for {chapter_id_from_file}: {e}")
+            totals["failed"] += len(batch)
+            if journal is not None:
+                journal.record(batch_number, chapter_id_from_file, segment_ids, "failed", Error=str(e))
+            return
+        print(f"Uploaded batch of {len(batch)} segments for {chapter_id_from_file}.")
+        totals["segments"] += len(batch)
+        if journal is not None:
+            journal.record(batch_number, chapter_id_from_file, segment_ids, "done",
+                           RecordIDs=[record.get("id") for record in created])
+
+    await asyncio.gather(*(upload_batch(batch) for batch in batched(segment_records)))
+
+# --- Sync mode ---
+# A local state file maps each SegmentID to its Airtable record ID and a hash of
+# every field last sent. Re-uploading then sends only creates, PATCHes of the
+# changed fields, and deletes of segments that disappeared from the chapter (or
+# whose chapter file was removed). Without a state, segments already in
+# Airtable are adopted by Segment ID first, so nothing is created twice. Segments
+# whose create failed are listed under "Unconfirmed" (the records may exist
+# anyway) and the next sync adopts them by Segment ID the same way.
+
+def field_hash(value):
+    return hashlib.sha1(json.dumps(value, sort_keys=True, ensure_ascii=False).encode('utf-8')).hexdigest()[:16]
 
-    for filename in sorted(os.listdir(staging_dir)):
-        if filename.endswith("_segmented_granular.json"):
-            filepath = os.path.join(staging_dir, filename)
-            print(f"Processing file: {filepath}")
-            
+def load_sync_state(state_file, base_id):
+    """Loads the sync state for a base; a missing file or a different base starts fresh."""
+    state = {"BaseID": base_id, "Chapters": {}, "Segments": {}, "Files": {}, "Unconfirmed": []}
+    if state_file and os.path.exists(state_file):
+        with open(state_file, 'r', encoding='utf-8') as f:
+            saved = json.load(f)
+        if saved.get("BaseID") == base_id:
+            state.update(saved)
+    return state
+
+def save_sync_state(state, state_file):
+    tmp_file = state_file + ".tmp"
+    with open(tmp_file, 'w', encoding='utf-8') as f:
+        json.dump(state, f, ensure_ascii=False)
+    os.replace(tmp_file, state_file)
+
+async def adopt_existing_segments(client, segments_table_name, state, chapter_index):
+    """Adds the segments already in Airtable but missing from the sync state; returns (segment_id, record_id) duplicates.
+
+    Records are matched by Segment ID, so a sync after a plain upload, with a
+    lost state file or after failed creates updates them instead of creating
+    them again. Their field hashes are unknown, so every field is sent on the
+    next sync. When several records share a Segment ID the one in the state
+    (or else the first one) is kept.
+    """
+    chapter_ids = {record_id: chapter_id for chapter_id, record_id in chapter_index.items()}
+    duplicates = []
+    for record in await client.list_records(segments_table_name, fields=["Segment ID", "Chapter Link"]):
+        fields = record.get("fields", {})
+        segment_id = fields.get("Segment ID")
+        if not segment_id:
+            continue
+        if segment_id in state["Segments"]:
+            if state["Segments"][segment_id]["id"] != record["id"]:
+                duplicates.append((segment_id, record["id"]))
+            continue
+        links = fields.get("Chapter Link") or []
+        state["Segments"][segment_id] = {"id": record["id"], "chapter": chapter_ids.get(links[0]) if links else None,
+                                         "fields": {}}
+    return duplicates
+
+async def delete_segment_batch(client, segments_table_name, batch, state, totals, label, forget=True):
+    """Deletes a batch of (segment_id, record_id); with forget, the segments are also dropped from the state."""
+    try:
+        await client.delete(segments_table_name, [record_id for _, record_id in batch])
+    except Exception as e:
+        print(f"Error deleting segments for {label}: {e}")
+        totals["failed"] += len(batch)
+        return
+    if forget:
+        for segment_id, _ in batch:
+            del state["Segments"][segment_id]
+    totals["deleted"] += len(batch)
+
+def plan_segment_sync(segment_records, chapter_id, state):
+    """Splits a chapter's segment records into (creates, updates, deletes) against the sync state.
+
+    Updates carry only the fields whose hash changed; fields no longer present
+    are cleared with None. Deletes are record IDs of segments that are in the
+    state for this chapter but no longer in the file.
+    """
+    creates, updates = [], []
+    seen = set()
+    for fields in segment_records:
+        segment_id = fields.get("Segment ID")
+        if not segment_id:
+            print(f"Warning: Skipping a segment without Segment ID in {chapter_id}")
+            continue
+        seen.add(segment_id)
+        hashes = {name: field_hash(value) for name, value in fields.items()}
+        synced = state["Segments"].get(segment_id)
+        if synced is None:
+            creates.append((segment_id, fields, hashes))
+            continue
+        changed = {name: value for name, value in fields.items() if synced["fields"].get(name) != hashes[name]}
+        for name in synced["fields"]:
+            if name not in fields:
+                changed[name] = None
+        if changed:
+            updates.append((segment_id, {"id": synced["id"], "fields": changed}, hashes))
+    deletes = [(segment_id, synced["id"]) for segment_id, synced in state["Segments"].items()
+               if synced.get("chapter") == chapter_id and segment_id not in seen]
+    return creates, updates, deletes
+
+async def sync_chapter_file(client, filepath, chapters_table_name, segments_table_name, state, totals, chapter_index):
+    """Brings Airtable in line with one chapter file, sending only what changed since the last sync.
+
+    Returns the chapter ID, or None if the file could not be read or its chapter record resolved.
+    """
+    print(f"Syncing file: {filepath}")
+    data = load_chapter_file(filepath)
+    if data is None:
+        totals["failed_files"] += 1
+        return None
+    chapter_data = build_chapter_fields(data)
+    chapter_id_from_file = chapter_data["Chapter ID"]
+    try:
+        chapter_record_id = await resolve_chapter_record(client, chapters_table_name, chapter_data, chapter_index)
+        state["Chapters"][chapter_id_from_file] = chapter_record_id
+        state["Files"][chapter_id_from_file] = os.path.abspath(filepath)
+        totals["chapters"] += 1
+    except Exception as e:
+        print(f"Error creating/finding chapter record for {chapter_id_from_file}: {e}")
+        totals["failed"] += len(data.get("Segments", []))
+        return None
+
+    segment_records = [build_segment_fields(seg_data, chapter_record_id) for seg_data in data.get("Segments", [])]
+    creates, updates, deletes = plan_segment_sync(segment_records, chapter_id_from_file, state)
+
+    async def create_batch(batch):
+        try:
+            created = await client.create(segments_table_name, [fields for _, fields, _ in batch])
+        except Exception as e:
+            print(f"Error creating segments for {chapter_id_from_file}: {e}")
+            totals["failed"] += len(batch)
+            state["Unconfirmed"].extend(segment_id for segment_id, _, _ in batch)
+            return
+        for (segment_id, _, hashes), record in zip(batch, created):
+            state["Segments"][segment_id] = {"id": record["id"], "chapter": chapter_id_from_file, "fields": hashes}
+        totals["created"] += len(batch)
+
+    async def update_batch(batch):
+        try:
+            await client.update(segments_table_name, [record for _, record, _ in batch])
+        except Exception as e:
+            print(f"Error updating segments for {chapter_id_from_file}: {e}")
+            totals["failed"] += len(batch)
+            return
+        for segment_id, _, hashes in batch:
+            state["Segments"][segment_id]["fields"] = hashes
+        totals["updated"] += len(batch)
+
+    await asyncio.gather(*[create_batch(batch) for batch in batched(creates)],
+                         *[update_batch(batch) for batch in batched(updates)],
+                         *[delete_segment_batch(client, segments_table_name, batch, state, totals, chapter_id_from_file)
+                           for batch in batched(deletes)])
+    print(f"Synced {chapter_id_from_file}: {len(creates)} created, {len(updates)} updated, "
+          f"{len(deletes)} deleted, {len(segment_records) - len(creates) - len(updates)} unchanged.")
+    return chapter_id_from_file
+
+async def delete_removed_chapters(client, segments_table_name, state, totals, synced):
+    """Deletes the segments of chapters whose file was synced before but no longer exists."""
+    for chapter_id, path in list(state["Files"].items()):
+        if chapter_id in synced or os.path.exists(path):
+            continue
+        deletes = [(segment_id, synced_segment["id"]) for segment_id, synced_segment in state["Segments"].items()
+                   if synced_segment.get("chapter") == chapter_id]
+        print(f"Chapter file of {chapter_id} was removed; deleting its {len(deletes)} segments.")
+        await asyncio.gather(*(delete_segment_batch(client, segments_table_name, batch, state, totals, chapter_id)
+                               for batch in batched(deletes)))
+        if not any(synced_segment.get("chapter") == chapter_id for synced_segment in state["Segments"].values()):
+            del state["Files"][chapter_id]
+            state["Chapters"].pop(chapter_id, None)
+
+async def sync_files_async(api_key, base_id, chapters_table_name, segments_table_name, files, state_file,
+                           max_in_flight=4, max_chapters=4, requests_per_second=AIRTABLE_REQUESTS_PER_SECOND,
+                           max_retries=5, api_url=None):
+    """Syncs chapter files against the state file; returns the totals dict, or None if the sync could not start.
+
+    totals["failed"] counts segment creates, updates and deletes that did not
+    go through and totals["failed_files"] unreadable chapter files. Segments of chapters whose previously synced file is gone are deleted.
+    """
+    state = load_sync_state(state_file, base_id)
+    client = AsyncAirtableClient(api_key, base_id, requests_per_second=requests_per_second,
+                                 max_in_flight=max_in_flight, max_retries=max_retries, api_url=api_url)
+    totals = {"chapters": 0, "created": 0, "updated": 0, "deleted": 0, "failed": 0, "failed_files": 0}
+    chapter_slots = asyncio.Semaphore(max_chapters)
+
+    async def sync_with_slot(filepath):
+        async with chapter_slots:
+            chapter_id = await sync_chapter_file(client, filepath, chapters_table_name, segments_table_name, state,
+                                                 totals, chapter_index)
+            # Persist after every chapter so an interrupted run loses at most one chapter's progress
+            save_sync_state(state, state_file)
+            return chapter_id
+
+    try:
+        try:
+            chapter_index = await fetch_chapter_index(client, chapters_table_name)
+        except Exception as e:
+            print(f"Error fetching existing chapters: {e}")
+            return None
+        if not state["Segments"] or state["Unconfirmed"]:
+            known = len(state["Segments"])
             try:
-                with open(filepath, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
+                duplicates = await adopt_existing_segments(client, segments_table_name, state, chapter_index)
             except Exception as e:
-                print(f"Error reading {filename}: {e}")
-                continue
+                print(f"Error fetching existing segments: {e}")
+                return None
+            state["Unconfirmed"] = []
+            print(f"Adopted {len(state['Segments']) - known} segments already in Airtable.")
+            if duplicates:
+                print(f"Deleting {len(duplicates)} duplicate segment records.")
+                await asyncio.gather(*(delete_segment_batch(client, segments_table_name, batch, state, totals,
+                                                            "duplicates", forget=False)
+                                       for batch in batched(duplicates)))
+        synced = set(await asyncio.gather(*(sync_with_slot(filepath) for filepath in files)))
+        await delete_removed_chapters(client, segments_table_name, state, totals, synced)
+    finally:
+        client.close()
+        save_sync_state(state, state_file)
+    print(f"Sync complete. {totals['chapters']} chapters: {totals['created']} created, {totals['updated']} updated, "
+          f"{totals['deleted']} deleted in {client.request_count} requests.")
+    if totals["failed"] or totals["failed_files"]:
+        print(f"{totals['failed']} segments and {totals['failed_files']} chapter files failed to sync. "
+              f"Re-run the sync to retry them.")
+    return totals
 
-            chapter_id_from_file = data.get("ChapterID", "UnknownChapter")
-            chapter_number_str = chapter_id_from_file.replace("CH", "")
-            try:
-                chapter_number = int(chapter_number_str)
-            except ValueError:
-                chapter_number = 0 # Or handle error appropriately
-                print(f"Warning: Could not parse chapter number from {chapter_id_from_file}")
-
-            # 1. Create/Update Chapter Record
-            # For simplicity, this script assumes chapter records are new or can be identified uniquely by ChapterID.
-            # A more robust solution would check if a record with ChapterID exists and update it.
-            
-            # Calculate total word count for the chapter from its segments
-            chapter_word_count = 0
-            if data.get("Segments"):
-                for seg in data["Segments"]:
-                    chapter_word_count += len(seg.get("SegmentText", "").split())
-
-            chapter_data = {
-                "Chapter ID": chapter_id_from_file,
-                "Chapter Number": chapter_number,
-                "Chapter Title": f"Chapter {chapter_number_str} (Title Placeholder)", # Placeholder
-                "Chapter Status": "Uploaded to Airtable",
-                "Word Count": chapter_word_count,
-                # "Synopsis": "Synopsis placeholder...", # Add if available
-                # "CharactersAppearing": [], # Link to Characters table - requires existing character records
-                # "PrimaryThemes": [], # Link to Themes table
-            }
-            
+def sync_files(api_key, base_id, chapters_table_name, segments_table_name, files, state_file, **options):
+    """Synchronous entry point for sync_files_async."""
+    return asyncio.run(sync_files_async(api_key, base_id, chapters_table_name, segments_table_name, files,
+                                        state_file, **options))
+
+async def upload_files_async(api_key, base_id, chapters_table_name, segments_table_name, files,
+                             max_in_flight=4, max_chapters=4, requests_per_second=AIRTABLE_REQUESTS_PER_SECOND,
+                             journal_file=None, resume=False, max_retries=5, api_url=None):
+    """Uploads chapter files concurrently; returns the totals dict, or None if the upload could not start.
+
+    totals["failed"] counts segments that were not uploaded and
+    totals["failed_files"] chapter files that could not be read. With journal_file, batch outcomes are journaled there; resume continues a
+    previous journal and only sends segments whose batch never completed.
+    """
+    client = AsyncAirtableClient(api_key, base_id, requests_per_second=requests_per_second,
+                                 max_in_flight=max_in_flight, max_retries=max_retries, api_url=api_url)
+    journal = UploadJournal(journal_file, resume=resume) if journal_file else None
+    if journal is not None and resume:
+        print(f"Resuming from {journal_file}: {len(journal.completed)} segments already uploaded.")
+    totals = {"chapters": 0, "segments": 0, "failed": 0, "failed_files": 0}
+    # Bounds how many chapter files are loaded and pipelined at once
+    chapter_slots = asyncio.Semaphore(max_chapters)
+
+    async def upload_with_slot(filepath):
+        async with chapter_slots:
+            await upload_chapter_file(client, filepath, chapters_table_name, segments_table_name, totals,
+                                      chapter_index, journal)
+
+    try:
+        # One projected list call replaces a lookup request per chapter
+        try:
+            chapter_index = await fetch_chapter_index(client, chapters_table_name)
+        except Exception as e:
+            print(f"Error fetching existing chapters: {e}")
+            return None
+        if journal is not None and journal.unconfirmed:
             try:
-                # Check if chapter exists
-                existing_chapter = airtable_chapters.match("Chapter ID", chapter_id_from_file)
-                if existing_chapter:
-                    print(f"Chapter {chapter_id_from_file} already exists. Record ID: {existing_chapter['id']}. Skipping chapter creation.")
-                    chapter_record_id = existing_chapter['id']
-                else:
-                    created_chapter = airtable_chapters.insert(chapter_data)
-                    print(f"Created Chapter record for {chapter_id_from_file}: {created_chapter['id']}")
-                    chapter_record_id = created_chapter['id']
-                processed_chapters += 1
+                found = await reconcile_unconfirmed_segments(client, segments_table_name, journal)
             except Exception as e:
-                print(f"Error creating/finding chapter record for {chapter_id_from_file}: {e}")
-                continue # Skip segments if chapter creation failed
-
-            # 2. Create Segment Records
-            segments_to_upload_batch = []
-            for seg_data in data.get("Segments", []):
-                airtable_segment_data = {
-                    "Segment ID": seg_data.get("SegmentID"),
-                    "Chapter Link": [chapter_record_id], # Link to the chapter record
-                    "Segment Order": seg_data.get("SegmentOrder"),
-                    "Segment Text": truncate_text(seg_data.get("SegmentText")),
-                    "Narrative Mode": seg_data.get("PrimaryNarrativeMode"),
-                    "SecondaryNarrativeModes": format_for_airtable(seg_data.get("SecondaryNarrativeModes")),
-                    # "DialogueSpeaker": [], # Link to Characters - needs existing record ID
-                    # "DialogueAddressees": [], # Link to Characters
-                    "DialogueContext": seg_data.get("DialogueContext"),
-                    "DialogueTone": format_for_airtable(seg_data.get("DialogueTone")),
-                    "PlotFunctionTags": format_for_airtable(seg_data.get("PlotFunctionTags")),
-                    "MysteryTags": format_for_airtable(seg_data.get("MysteryTags")),
-                    "CharacterArcTags": format_for_airtable(seg_data.get("CharacterArcTags")),
-                    "WorldBuildingTags": format_for_airtable(seg_data.get("WorldBuildingTags")),
-                    "StructuralOntologyTags": format_for_airtable(seg_data.get("StructuralOntologyTags")),
-                    "AuthorialIntentTags": format_for_airtable(seg_data.get("AuthorialIntentTags")),
-                    "ThematicKeywordsRaw": seg_data.get("ThematicKeywordsRaw"),
-                    # "CharactersInSegment": [], # Link to Characters
-                    # "CharacterPOVHolder": [], # Link to Characters
-                    "LocationInSegment": seg_data.get("LocationInSegment"), # Assumes text for now
-                    "TimeReferenceInSegment": seg_data.get("TimeReferenceInSegment"),
-                    # "ClueReferenceInSegment": [], # Link to Clues
-                    "SegmentNotes": truncate_text(seg_data.get("SegmentNotes")),
-                }
-                
-                # Filter out None values, as Airtable API might not like them for certain field types
-                # For linked records, empty lists are fine. For single/multi-select, None might be an issue.
-                # It's safer to omit the key if the value is None and the field is not required.
-                final_segment_data = {k: v for k, v in airtable_segment_data.items() if v is not None and v != []}
-                segments_to_upload_batch.append(final_segment_data)
-
-                if len(segments_to_upload_batch) == 10: # Airtable batch limit is 10
-                    try:
-                        airtable_segments.batch_insert(segments_to_upload_batch)
-                        print(f"Uploaded batch of {len(segments_to_upload_batch)} segments for {chapter_id_from_file}.")
-                        processed_segments += len(segments_to_upload_batch)
-                    except Exception as e:
-                        print(f"Error batch inserting segments for {chapter_id_from_file}: {e}")
-                        # Optionally, try inserting one by one for debugging
-                        # for single_seg_data in segments_to_upload_batch:
-                        #     try: airtable_segments.insert(single_seg_data)
-                        #     except Exception as e_single: print(f"Error single: {e_single}")
-                    segments_to_upload_batch = []
-                    time.sleep(1) # Basic rate limiting
-            
-            if segments_to_upload_batch: # Upload any remaining segments
-                try:
-                    airtable_segments.batch_insert(segments_to_upload_batch)
-                    print(f"Uploaded final batch of {len(segments_to_upload_batch)} segments for {chapter_id_from_file}.")
-                    processed_segments += len(segments_to_upload_batch)
-                except Exception as e:
-                    print(f"Error batch inserting final segments for {chapter_id_from_file}: {e}")
-                time.sleep(1)
-
-    print(f"Upload complete. Processed {processed_chapters} chapters and {processed_segments} segments.")
+                print(f"Error checking segments of failed batches: {e}")
+                return None
+            print(f"{found} of {found + len(journal.unconfirmed)} segments from failed batches were created anyway; "
+                  f"they will not be sent again.")
+        await asyncio.gather(*(upload_with_slot(filepath) for filepath in files))
+    finally:
+        client.close()
+        if journal is not None:
+            journal.close()
+    print(f"Upload complete. Processed {totals['chapters']} chapters and {totals['segments']} segments "
+          f"in {client.request_count} requests ({client.retry_count} retried).")
+    if totals["failed_files"]:
+        print(f"{totals['failed_files']} chapter files could not be read.")
+    if totals["failed"]:
+        print(f"{totals['failed']} segments failed to upload."
+              + (" Re-run with --resume to send only those." if journal is not None else ""))
+    return totals
+
+def upload_files(api_key, base_id, chapters_table_name, segments_table_name, files, **options):
+    """Synchronous entry point for upload_files_async."""
+    return asyncio.run(upload_files_async(api_key, base_id, chapters_table_name, segments_table_name, files, **options))
+
+def upload_to_airtable(api_key, base_id, chapters_table_name, segments_table_name, staging_dir, **options):
+    """Uploads segmented chapter data to Airtable."""
+    print(f"Starting upload from {staging_dir}...")
+    files = staging_files(staging_dir)
+    if not files:
+        print(f"Error: No segment files found in {staging_dir}")
+        return None
+    return upload_files(api_key, base_id, chapters_table_name, segments_table_name, files, **options)
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Upload segmented novel data to Airtable.")
@@ -153,12 +555,32 @@ if __name__ == "__main__":
     parser.add_argument("--base_id", required=True, help="Airtable Base ID")
     parser.add_argument("--chapters_table", required=True, help="Name of the Chapters table in Airtable")
     parser.add_argument("--segments_table", required=True, help="Name of the Text Segments table in Airtable")
-    parser.add_argument("--staging_dir", default="/home/ubuntu/novel_project/airtable_staging/", help="Directory containing the _segmented_granular.json files")
-    
+    parser.add_argument("--staging_dir", default="/home/ubuntu/novel_project/airtable_staging/", help="Directory containing the _segmented_granular.json or _segments.json/.ndjson files")
+    parser.add_argument("--max_in_flight", type=int, default=4, help="Maximum concurrent API requests")
+    parser.add_argument("--max_chapters", type=int, default=4, help="Maximum chapters uploaded concurrently")
+    parser.add_argument("--requests_per_second", type=float, default=AIRTABLE_REQUESTS_PER_SECOND, help="Per-base request rate limit")
+    parser.add_argument("--sync", action="store_true", help="Only send creates, changed fields and deletes since the last sync")
+    parser.add_argument("--state_file", help="Sync state file (default: .airtable_sync_state.json in the staging directory)")
+    parser.add_argument("--api_url", help="Airtable API base URL (default: $AIRTABLE_API_URL or the public API)")
+    parser.add_argument("--max_retries", type=int, default=5, help="Retries per request on rate-limit (429) and server (5xx) errors")
+    parser.add_argument("--journal_file", help="Upload journal (default: .airtable_upload_journal.jsonl in the staging directory)")
+    parser.add_argument("--resume", action="store_true", help="Continue the journaled upload, sending only batches that did not complete")
+
     args = parser.parse_args()
-    
-    # It's good practice to ensure the Airtable library is installed.
-    # This script assumes it is. If not: pip install airtable-python-wrapper
-    
-    upload_to_airtable(args.api_key, args.base_id, args.chapters_table, args.segments_table, args.staging_dir)
+    options = {"max_in_flight": args.max_in_flight, "max_chapters": args.max_chapters,
+               "requests_per_second": args.requests_per_second, "max_retries": args.max_retries,
+               "api_url": args.api_url}
+
+    if not staging_files(args.staging_dir):
+        parser.exit(1, f"Error: No segment files found in {args.staging_dir}\n")
 
+    if args.sync:
+        state_file = args.state_file or os.path.join(args.staging_dir, SYNC_STATE_FILENAME)
+        totals = sync_files(args.api_key, args.base_id, args.chapters_table, args.segments_table,
+                            staging_files(args.staging_dir), state_file, **options)
+    else:
+        journal_file = args.journal_file or os.path.join(args.staging_dir, JOURNAL_FILENAME)
+        totals = upload_to_airtable(args.api_key, args.base_id, args.chapters_table, args.segments_table,
+                                    args.staging_dir, journal_file=journal_file, resume=args.resume, **options)
+    if totals is None or totals["failed"] or totals["failed_files"]:
+        sys.exit(1)
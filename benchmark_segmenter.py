@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+"""
+Segmentation benchmark with a synthetic manuscript generator.
+
+Generates chapters of configurable size and composition, then times paragraph
+splitting, tagging and serialization separately. Results (paragraphs/sec,
+MB/sec, peak RSS) are written to a JSON file that can be compared against a
+previous run to catch regressions:
+
+    python benchmark_segmenter.py --sizes 1000,10000 -o bench.json
+    python benchmark_segmenter.py --sizes 1000,10000 --compare bench.json
+"""
+import argparse
+import io
+import json
+import platform
+import random
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+import segmenter_script
+from segment_model import dump_chapter
+
+FILLER_WORDS = ["the", "a", "of", "and", "to", "in", "was", "that", "with", "on", "at", "from",
+                "corridor", "window", "light", "door", "street", "paper", "hand", "voice", "city",
+                "slowly", "quietly", "across", "under", "toward", "without", "again", "still"]
+
+KEYWORD_POOL = (segmenter_script.DIALOGUE_VERBS + segmenter_script.INTERIOR_STATE_VERBS +
+                segmenter_script.DESCRIPTION_ADJECTIVES + segmenter_script.SATIRICAL_KEYWORDS +
+                segmenter_script.HUMOROUS_KEYWORDS + segmenter_script.CLUE_KEYWORDS +
+                segmenter_script.DEDUCTION_KEYWORDS + segmenter_script.CAUSAL_MARKERS +
+                segmenter_script.FLASHBACK_MARKERS + segmenter_script.TIME_MARKERS +
+                segmenter_script.WORLD_LOCATIONS)
+
+
+def generate_synthetic_chapter(paragraphs, dialogue_ratio=0.3, character_density=0.05,
+                               keyword_rate=0.03, words_per_paragraph=60, characters=None, seed=0):
+    """Returns chapter text with the requested number of paragraphs.
+
+    dialogue_ratio is the share of paragraphs written as quoted speech;
+    character_density and keyword_rate are the per-word probabilities of a
+    character name or a tagging keyword.
+    """
+    rng = random.Random(seed)
+    characters = characters or segmenter_script.KNOWN_CHARACTERS
+    chapter = []
+    for _ in range(paragraphs):
+        length = max(3, int(rng.gauss(words_per_paragraph, words_per_paragraph / 3)))
+        words = []
+        for _ in range(length):
+            roll = rng.random()
+            if roll < character_density:
+                words.append(rng.choice(characters))
+            elif roll < character_density + keyword_rate:
+                words.append(rng.choice(KEYWORD_POOL))
+            else:
+                words.append(rng.choice(FILLER_WORDS))
+        sentence = " ".join(words)
+        if rng.random() < dialogue_ratio:
+            speaker = rng.choice(characters)
+            verb = rng.choice(segmenter_script.DIALOGUE_VERBS)
+            chapter.append(f'"{sentence[0].upper()}{sentence[1:]}," {speaker} {verb}.')
+        else:
+            chapter.append(f"{sentence[0].upper()}{sentence[1:]}.")
+    return "\n\n".join(chapter) + "\n"
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MB, or None when unavailable."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def _best_time(func, repeat):
+    best = None
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def benchmark_size(paragraphs, repeat=3, **generator_options):
+    """Benchmarks one synthetic chapter size and returns its result record."""
+    text = generate_synthetic_chapter(paragraphs, **generator_options)
+    megabytes = len(text.encode('utf-8')) / 1e6
+    chapter_id = "CH001"
+    character_index = segmenter_script.DEFAULT_CHARACTER_INDEX
+
+    split_seconds, paragraph_list = _best_time(lambda: segmenter_script.split_paragraphs(text), repeat)
+    tag_seconds, segments = _best_time(
+        lambda: list(segmenter_script.iter_segments(paragraph_list, chapter_id, character_index)), repeat)
+
+    def serialize(compact):
+        buffer = io.StringIO()
+        dump_chapter(chapter_id, segments, buffer, compact)
+        return buffer.getvalue()
+
+    serialize_seconds, full_output = _best_time(lambda: serialize(False), repeat)
+    compact_seconds, compact_output = _best_time(lambda: serialize(True), repeat)
+    total_seconds = split_seconds + tag_seconds + serialize_seconds
+
+    def rate(amount, seconds):
+        return round(amount / seconds, 2) if seconds else None
+
+    return {
+        "Paragraphs": paragraphs,
+        "Segments": len(segments),
+        "InputMB": round(megabytes, 4),
+        "SplitSeconds": round(split_seconds, 6),
+        "TagSeconds": round(tag_seconds, 6),
+        "SerializeSeconds": round(serialize_seconds, 6),
+        "CompactSerializeSeconds": round(compact_seconds, 6),
+        "TotalSeconds": round(total_seconds, 6),
+        "ParagraphsPerSecond": rate(len(segments), total_seconds),
+        "TagParagraphsPerSecond": rate(len(segments), tag_seconds),
+        "MBPerSecond": rate(megabytes, total_seconds),
+        "OutputMB": round(len(full_output.encode('utf-8')) / 1e6, 4),
+        "CompactOutputMB": round(len(compact_output.encode('utf-8')) / 1e6, 4),
+        "PeakRSSMB": round(peak_rss_mb(), 2) if resource else None,
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+def compare_results(current, previous, threshold):
+    """Prints per-size throughput changes; returns True if any size regressed beyond threshold (%)."""
+    previous_by_size = {r["Paragraphs"]: r for r in previous.get("Results", [])}
+    regressed = False
+    print(f"\nComparison against {previous.get('Commit') or 'previous run'}:")
+    for result in current["Results"]:
+        before = previous_by_size.get(result["Paragraphs"])
+        if not before or not before.get("ParagraphsPerSecond") or not result["ParagraphsPerSecond"]:
+            continue
+        change = (result["ParagraphsPerSecond"] / before["ParagraphsPerSecond"] - 1) * 100
+        flag = ""
+        if change < -threshold:
+            flag = "  <-- REGRESSION"
+            regressed = True
+        print(f"  {result['Paragraphs']:>8} paragraphs: {before['ParagraphsPerSecond']:>10.0f} -> "
+              f"{result['ParagraphsPerSecond']:>10.0f} paragraphs/s ({change:+.1f}%){flag}")
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark segment_chapter on synthetic chapters.")
+    parser.add_argument("--sizes", default="100,1000,10000", help="Comma-separated paragraph counts")
+    parser.add_argument("--dialogue_ratio", type=float, default=0.3, help="Share of dialogue paragraphs")
+    parser.add_argument("--character_density", type=float, default=0.05, help="Per-word probability of a character name")
+    parser.add_argument("--keyword_rate", type=float, default=0.03, help="Per-word probability of a tagging keyword")
+    parser.add_argument("--words_per_paragraph", type=int, default=60, help="Mean paragraph length in words")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per phase; the fastest is reported")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed for the generator")
+    parser.add_argument("-o", "--output", default="benchmark_results.json", help="JSON results file")
+    parser.add_argument("--compare", help="Previous results file to compare against (may be the --output file; it is read first)")
+    parser.add_argument("--threshold", type=float, default=10.0, help="Regression threshold in percent")
+    args = parser.parse_args()
+
+    # Read the baseline before anything runs: --output may be the same file and is overwritten below
+    previous = None
+    if args.compare:
+        try:
+            with open(args.compare, 'r', encoding='utf-8') as f:
+                previous = json.load(f)
+        except (OSError, ValueError) as e:
+            parser.error(f"cannot read --compare file {args.compare}: {e}")
+
+    generator_options = {
+        "dialogue_ratio": args.dialogue_ratio,
+        "character_density": args.character_density,
+        "keyword_rate": args.keyword_rate,
+        "words_per_paragraph": args.words_per_paragraph,
+        "seed": args.seed,
+    }
+    # Ascending sizes keep the (process-wide) peak RSS meaningful per size
+    sizes = sorted(int(size) for size in args.sizes.split(","))
+
+    report = {
+        "Commit": git_commit(),
+        "GeneratedOn": datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        "Python": platform.python_version(),
+        "Platform": platform.platform(),
+        "Generator": generator_options,
+        "Results": [],
+    }
+    for size in sizes:
+        result = benchmark_size(size, repeat=args.repeat, **generator_options)
+        report["Results"].append(result)
+        print(f"{size:>8} paragraphs: split {result['SplitSeconds']:.3f}s  tag {result['TagSeconds']:.3f}s  "
+              f"serialize {result['SerializeSeconds']:.3f}s  | {result['ParagraphsPerSecond']:>9.0f} paragraphs/s  "
+              f"{result['MBPerSecond']:.2f} MB/s  peak RSS {result['PeakRSSMB']} MB")
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=4)
+    print(f"Results saved to {args.output}")
+
+    if previous is not None and compare_results(report, previous, args.threshold):
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,68 +1,346 @@
 import json
 import argparse
+import hashlib
+import os
+from pathlib import Path
 
-def get_chapter_segments(chapter_id_to_find, chapters_file, segments_file):
-    """Extracts and orders segments for a specific chapter."""
-    try:
-        with open(chapters_file, 'r') as f:
-            chapters_data = json.load(f)
-        with open(segments_file, 'r') as f:
-            segments_data = json.load(f)
-    except FileNotFoundError:
-        print(f"Error: One or both data files not found ({chapters_file}, {segments_file})")
-        return None, None, 0, 0
-    except json.JSONDecodeError:
-        print(f"Error: Could not decode JSON from one or both data files.")
-        return None, None, 0, 0
-
-    target_chapter_record_id = None
-    chapter_title = "Unknown Chapter"
-    current_word_count = 0
-
-    for chapter in chapters_data:
-        if chapter.get('fields', {}).get('Chapter ID') == chapter_id_to_find:
-            target_chapter_record_id = chapter.get('id')
-            chapter_title = chapter.get('fields', {}).get('Chapter Title', chapter_id_to_find)
-            current_word_count = chapter.get('fields', {}).get('Word Count', 0)
-            break
-
-    if not target_chapter_record_id:
+import manuscript_db
+from json_stream import iter_records
+
+# The only fields assembly reads; everything else is dropped while loading
+CHAPTER_FIELDS = ["Chapter ID", "Chapter Number", "Chapter Title", "Word Count"]
+SEGMENT_FIELDS = ["Segment ID", "Chapter Link", "Segment Order", "Segment Text"]
+
+DEFAULT_CACHE_DIRNAME = ".chapter_cache"
+DEFAULT_CACHE_BYTES = 64 * 1024 * 1024
+
+def segments_hash(segments):
+    """Content hash of a chapter's ordered (segment ID, text) pairs."""
+    digest = hashlib.sha256()
+    for segment_id, text in segments:
+        for part in (str(segment_id), text or ''):
+            data = part.encode('utf-8')
+            digest.update(len(data).to_bytes(8, 'little'))
+            digest.update(data)
+    return digest.hexdigest()
+
+class ChapterCache:
+    """Size-bounded LRU cache of rendered chapters on disk, keyed by content.
+
+    Keys (see key) combine a chapter's segments_hash with everything else the
+    rendering depends on, so an edited, added or reordered segment is a miss
+    and stale text is never served. index.json lists entries from least to
+    most recently used; the oldest are evicted once max_bytes is exceeded.
+    """
+    INDEX_FILENAME = "index.json"
+
+    def __init__(self, directory, max_bytes=DEFAULT_CACHE_BYTES):
+        self.directory = Path(directory)
+        self.index_file = self.directory / self.INDEX_FILENAME
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.dirty = False
+        try:
+            with open(self.index_file, 'r', encoding='utf-8') as f:
+                self.entries = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            self.entries = {}
+
+    @staticmethod
+    def key(content_hash, *variant):
+        """Cache key for a chapter's content rendered with the given variant (format, title, ...)."""
+        return hashlib.sha256(json.dumps([content_hash, *variant], ensure_ascii=False).encode('utf-8')).hexdigest()
+
+    def _path(self, key):
+        return self.directory / f"{key}.txt"
+
+    def get(self, key):
+        """Returns (text, info) and marks the entry most recently used, or None on a miss."""
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            try:
+                text = self._path(key).read_bytes().decode('utf-8')
+            except FileNotFoundError:
+                entry = None
+                self.dirty = True
+        if entry is None:
+            self.misses += 1
+            return None
+        self.entries[key] = entry
+        self.hits += 1
+        self.dirty = True
+        return text, entry
+
+    def put(self, key, text, chapter_id=None, **info):
+        """Stores rendered text (plus info such as segment and word counts), then evicts down to max_bytes."""
+        data = text.encode('utf-8')
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._path(key).write_bytes(data)
+        self.entries.pop(key, None)
+        self.entries[key] = {"Chapter": chapter_id, "Bytes": len(data), **info}
+        self.dirty = True
+        total = self.size()
+        while total > self.max_bytes and self.entries:
+            oldest = next(iter(self.entries))
+            total -= self.entries.pop(oldest)["Bytes"]
+            self._path(oldest).unlink(missing_ok=True)
+
+    def size(self):
+        return sum(entry["Bytes"] for entry in self.entries.values())
+
+    def invalidate(self, chapter_ids=None):
+        """Drops the cached output of the given chapters (every chapter by default); returns the entries removed."""
+        keys = [key for key, entry in self.entries.items()
+                if chapter_ids is None or entry.get("Chapter") in chapter_ids]
+        for key in keys:
+            del self.entries[key]
+            self._path(key).unlink(missing_ok=True)
+        if chapter_ids is None and self.directory.exists():
+            for path in self.directory.glob("*.txt"):
+                path.unlink()
+        self.dirty = True
+        return len(keys)
+
+    def save(self):
+        """Writes the index (atomically) if anything changed."""
+        if not self.dirty:
+            return
+        self.directory.mkdir(parents=True, exist_ok=True)
+        temp_file = self.index_file.with_suffix(".tmp")
+        with open(temp_file, 'w', encoding='utf-8') as f:
+            json.dump(self.entries, f)
+        os.replace(temp_file, self.index_file)
+        self.dirty = False
+
+class ManuscriptIndex:
+    """Chapter record ID -> ordered segments, built in one pass over the fetched data.
+
+    Assembling any number of chapters (or the whole book) is then a lookup per
+    chapter instead of a scan of every segment.
+    """
+
+    def __init__(self, chapters_data, segments_data):
+        self.by_chapter_id = {}
+        self.segments_by_record = {}
+        for chapter in chapters_data:
+            chapter_id = chapter.get('fields', {}).get('Chapter ID')
+            if chapter_id is not None:
+                self.by_chapter_id.setdefault(chapter_id, chapter)
+        for segment in segments_data:
+            fields = segment.get('fields', {})
+            segment_id = fields.get('Segment ID') or segment.get('id')
+            for record_id in dict.fromkeys(fields.get('Chapter Link') or []):
+                self.segments_by_record.setdefault(record_id, []).append(
+                    (fields.get('Segment Order', float('inf')), segment_id, fields.get('Segment Text', '')))
+        for segments in self.segments_by_record.values():
+            segments.sort(key=lambda s: s[0])
+
+    @classmethod
+    def from_files(cls, chapters_file, segments_file):
+        """Loads fetched table files (JSON arrays or NDJSON), one record at a time."""
+        return cls(iter_records(chapters_file, CHAPTER_FIELDS), iter_records(segments_file, SEGMENT_FIELDS))
+
+    @classmethod
+    def from_db(cls, conn):
+        """Builds the index from the SQLite mirror (see manuscript_db)."""
+        chapters_data = []
+        segments_data = []
+        for row in manuscript_db.chapters(conn):
+            record_id = row['record_id'] or row['chapter_id']
+            chapters_data.append({'id': record_id, 'fields': {
+                'Chapter ID': row['chapter_id'], 'Chapter Number': row['chapter_number'],
+                'Chapter Title': row['title'] or row['chapter_id'], 'Word Count': row['word_count'] or 0}})
+            for segment in manuscript_db.chapter_segments(conn, row['chapter_id']):
+                fields = {'Segment ID': segment['segment_id'], 'Chapter Link': [record_id],
+                          'Segment Text': segment['text'] or ''}
+                if segment['segment_order'] is not None:
+                    fields['Segment Order'] = segment['segment_order']
+                segments_data.append({'fields': fields})
+        return cls(chapters_data, segments_data)
+
+    def chapter_ids(self):
+        """Chapter IDs in Chapter Number order."""
+        def number(chapter):
+            value = chapter.get('fields', {}).get('Chapter Number')
+            return (value is None, value if value is not None else 0)
+        ordered = sorted(self.by_chapter_id.values(), key=number)
+        return [chapter['fields']['Chapter ID'] for chapter in ordered]
+
+    def chapter_segments(self, chapter_id):
+        """Returns (title, ordered segment texts, word count, found) for a chapter."""
+        chapter = self.by_chapter_id.get(chapter_id)
+        if chapter is None:
+            return None, [], 0, False
+        fields = chapter.get('fields', {})
+        texts = [text for _, _, text in self.segments_by_record.get(chapter.get('id'), [])]
+        return fields.get('Chapter Title', chapter_id), texts, fields.get('Word Count', 0), True
+
+    def content_hash(self, chapter_id):
+        """segments_hash of a chapter's ordered segments, or None if the chapter is unknown."""
+        chapter = self.by_chapter_id.get(chapter_id)
+        if chapter is None:
+            return None
+        return segments_hash((segment_id, text) for _, segment_id, text
+                             in self.segments_by_record.get(chapter.get('id'), []))
+
+    def render(self, chapter_id, cache=None):
+        """Returns (render_chapter Markdown, segment count), or (None, 0) if not found.
+
+        With a ChapterCache, chapters whose segments are unchanged are served from it.
+        """
+        title, texts, words, found = self.chapter_segments(chapter_id)
+        if not found:
+            return None, 0
+        key = None
+        if cache is not None:
+            key = cache.key(self.content_hash(chapter_id), "chapter", title, words)
+            cached = cache.get(key)
+            if cached is not None:
+                return cached[0], len(texts)
+        text = render_chapter(title, "\n\n".join(texts), words, len(texts))
+        if key is not None:
+            cache.put(key, text, chapter_id)
+        return text, len(texts)
+
+    def assemble(self, chapter_id):
+        """Returns (title, text, word count, segment count), or (None, None, 0, 0) if not found."""
+        title, texts, words, found = self.chapter_segments(chapter_id)
+        if not found:
+            return None, None, 0, 0
+        return title, "\n\n".join(texts), words, len(texts)
+
+    def iter_chapters(self, chapter_ids=None):
+        """Yields (chapter_id, title, word count, segment count, segment texts, content hash) for export_manuscript."""
+        for chapter_id in chapter_ids or self.chapter_ids():
+            title, texts, words, found = self.chapter_segments(chapter_id)
+            if found:
+                yield chapter_id, title, words, len(texts), texts, self.content_hash(chapter_id)
+
+    def assemble_all(self, chapter_ids=None):
+        """Yields (chapter_id, title, text, word count, segment count) for the given chapters, or the whole book."""
+        for chapter_id in chapter_ids or self.chapter_ids():
+            yield (chapter_id,) + self.assemble(chapter_id)
+
+def iter_db_chapters(conn, content_hashes=False):
+    """Like ManuscriptIndex.iter_chapters, but streams each chapter's segment texts from the SQLite mirror.
+
+    The content hash costs an extra pass over each chapter's rows, so it is
+    only computed (otherwise None) when content_hashes is set.
+    """
+    for row in manuscript_db.chapters(conn):
+        num_segments = conn.execute("SELECT COUNT(*) FROM segments WHERE chapter_id = ?",
+                                    (row['chapter_id'],)).fetchone()[0]
+        content_hash = None
+        if content_hashes:
+            content_hash = segments_hash(conn.execute(
+                "SELECT segment_id, text FROM segments WHERE chapter_id = ? ORDER BY segment_order",
+                (row['chapter_id'],)))
+        texts = (text or '' for (text,) in conn.execute(
+            "SELECT text FROM segments WHERE chapter_id = ? ORDER BY segment_order", (row['chapter_id'],)))
+        yield (row['chapter_id'], row['title'] or row['chapter_id'], row['word_count'] or 0, num_segments, texts,
+               content_hash)
+
+def export_manuscript(chapters, f, text_format="md", front_matter=False, book_title=None, cache=None):
+    """Streams chapters to f in order, one segment at a time; returns (chapters, segments, words).
+
+    chapters yields (chapter_id, title, word count, segment count, segment
+    texts, content hash), e.g. from ManuscriptIndex.iter_chapters or
+    iter_db_chapters. text_format is "md" or "txt"; front_matter adds each
+    chapter's word and segment counts under its heading. With a ChapterCache,
+    chapters with a content hash are rendered once and then served from it.
+    """
+    def heading(text, level):
+        if text_format == "md":
+            return f"{'#' * level} {text}\n\n"
+        return f"{text}\n{('=' if level == 1 else '-') * len(text)}\n\n"
+
+    totals = [0, 0, 0]
+    if book_title:
+        f.write(heading(book_title, 1))
+    chapter_level = 2 if book_title else 1
+    for chapter_id, title, words, num_segments, texts, content_hash in chapters:
+        if cache is not None and content_hash is not None:
+            key = cache.key(content_hash, "export", text_format, front_matter, chapter_level, title, words)
+            cached = cache.get(key)
+            if cached is None:
+                parts = [heading(title, chapter_level)]
+                if front_matter:
+                    parts.append(f"Word Count (Airtable): {words}\nSegments: {num_segments}\n\n")
+                texts = list(texts)
+                parts.append("\n\n".join(texts))
+                parts.append("\n\n")
+                cached = "".join(parts), {"Segments": len(texts), "Words": sum(len(text.split()) for text in texts)}
+                cache.put(key, cached[0], chapter_id, **cached[1])
+            f.write(cached[0])
+            totals[0] += 1
+            totals[1] += cached[1]["Segments"]
+            totals[2] += cached[1]["Words"]
+            continue
+        f.write(heading(title, chapter_level))
+        if front_matter:
+            f.write(f"Word Count (Airtable): {words}\nSegments: {num_segments}\n\n")
+        for i, text in enumerate(texts):
+            if i:
+                f.write("\n\n")
+            f.write(text)
+            totals[1] += 1
+            totals[2] += len(text.split())
+        f.write("\n\n")
+        totals[0] += 1
+    return tuple(totals)
+
+def render_chapter(title, text, words, num_segments):
+    """Markdown for one assembled chapter."""
+    return f"# {title}\n\nWord Count (Airtable): {words}\nSegments: {num_segments}\n\n{text}"
+
+def get_chapter_segments(chapter_id_to_find, chapters_file, segments_file, index=None):
+    """Extracts and orders segments for a specific chapter.
+
+    Pass a ManuscriptIndex to assemble several chapters without reloading the files.
+    """
+    if index is None:
+        try:
+            index = ManuscriptIndex.from_files(chapters_file, segments_file)
+        except FileNotFoundError:
+            print(f"Error: One or both data files not found ({chapters_file}, {segments_file})")
+            return None, None, 0, 0
+        except json.JSONDecodeError:
+            print(f"Error: Could not decode JSON from one or both data files.")
+            return None, None, 0, 0
+
+    title, text, words, num_segments = index.assemble(chapter_id_to_find)
+    if title is None:
         print(f"Error: Chapter with ID '{chapter_id_to_find}' not found in {chapters_file}")
-        return None, None, 0, 0
-
-    chapter_segments = []
-    for segment in segments_data:
-        if segment.get('fields', {}).get('Chapter Link') and target_chapter_record_id in segment.get('fields', {}).get('Chapter Link'):
-            chapter_segments.append(segment)
-    
-    chapter_segments.sort(key=lambda s: s.get('fields', {}).get('Segment Order', float('inf')))
-    
-    full_text = "\n\n".join([s.get('fields', {}).get('Segment Text', '') for s in chapter_segments])
-    
-    return chapter_title, full_text, current_word_count, len(chapter_segments)
+    return title, text, words, num_segments
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description="Assemble chapter text from Airtable data.")
-    parser.add_argument("-c", "--chapter_id", type=str, default="CH001", help="Chapter ID to assemble (e.g., CH001)")
+    parser.add_argument("-c", "--chapter_id", type=str, action="append", help="Chapter ID to assemble (e.g., CH001); repeat for several (default: CH001)")
+    parser.add_argument("--all", action="store_true", help="Assemble every chapter")
     args = parser.parse_args()
 
-    chapter_id_to_assemble = args.chapter_id
     chapters_json_path = '/home/ubuntu/novel_project/airtable_chapters_data.json'
     segments_json_path = '/home/ubuntu/novel_project/airtable_segments_data.json'
     output_dir = "/home/ubuntu/novel_project/"
 
-    title, text, words, num_segments = get_chapter_segments(chapter_id_to_assemble, chapters_json_path, segments_json_path)
-    
-    if title and text is not None: # Ensure text is not None, even if empty
-        print(f"--- Chapter: {title} ---")
-        print(f"Current Word Count (from Airtable): {words}")
-        print(f"Number of Segments: {num_segments}")
-        
-        output_filename = f"{output_dir}{chapter_id_to_assemble}_current_text.md"
-        with open(output_filename, "w") as f_out:
-            f_out.write(f"# {title}\n\nWord Count (Airtable): {words}\nSegments: {num_segments}\n\n")
-            f_out.write(text)
-        print(f"Saved current text of {chapter_id_to_assemble} to {output_filename}")
-    else:
-        print(f"Could not retrieve text for {chapter_id_to_assemble}")
+    try:
+        manuscript_index = ManuscriptIndex.from_files(chapters_json_path, segments_json_path)
+    except (FileNotFoundError, json.JSONDecodeError) as e:
+        print(f"Error: Could not load data files: {e}")
+        raise SystemExit(1)
+    chapter_ids = None if args.all else (args.chapter_id or ["CH001"])
+
+    for chapter_id_to_assemble, title, text, words, num_segments in manuscript_index.assemble_all(chapter_ids):
+        if title and text is not None: # Ensure text is not None, even if empty
+            print(f"--- Chapter: {title} ---")
+            print(f"Current Word Count (from Airtable): {words}")
+            print(f"Number of Segments: {num_segments}")
 
+            output_filename = f"{output_dir}{chapter_id_to_assemble}_current_text.md"
+            with open(output_filename, "w") as f_out:
+                f_out.write(render_chapter(title, text, words, num_segments))
+            print(f"Saved current text of {chapter_id_to_assemble} to {output_filename}")
+        else:
+            print(f"Error: Chapter with ID '{chapter_id_to_assemble}' not found in {chapters_json_path}")
+            print(f"Could not retrieve text for {chapter_id_to_assemble}")
@@ -0,0 +1,47 @@
+"""
+Shared pytest fixtures: a local mock of the Airtable API (mock_airtable_server.py)
+on a free port, and synthetic segmented chapter files to send to it.
+"""
+import json
+
+import pytest
+
+import airtable_api
+from mock_airtable_server import MockAirtable, MockAirtableServer
+
+BASE_ID = "appTest"
+CHAPTERS_TABLE = "Chapters"
+SEGMENTS_TABLE = "Text Segments"
+
+
+@pytest.fixture
+def airtable(monkeypatch):
+    """Starts MockAirtableServers with the given MockAirtable options; retries do not wait."""
+    monkeypatch.setattr(airtable_api, "retry_delay", lambda attempt, response=None: 0)
+    servers = []
+
+    def start(**options):
+        options.setdefault("rate_limit", None)
+        options.setdefault("seed", 1)
+        server = MockAirtableServer(port=0, mock=MockAirtable(**options)).start()
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.stop()
+
+
+def segment_records(server, table_name=SEGMENTS_TABLE):
+    """The records currently stored in a table of the mock."""
+    return list(server.mock.table(BASE_ID, table_name).values())
+
+
+def write_chapter(directory, number, count, text="Segment text {order}."):
+    """Writes a staging file with `count` segments for chapter CH<number>; returns its path."""
+    segments = [{"SegmentID": f"CH{number}_SEG{order:05d}", "SegmentOrder": order,
+                 "SegmentText": text.format(order=order), "MysteryTags": ["Clue Introduction"]}
+                for order in range(1, count + 1)]
+    path = directory / f"chapter_{number}_segmented_granular.json"
+    path.write_text(json.dumps({"ChapterID": f"CH{number}", "Segments": segments}), encoding="utf-8")
+    return path
@@ -0,0 +1,360 @@
+#!/usr/bin/env python3
+"""
+Single-pass scanning of segmented chapter files.
+
+scan_corpus reads each chapter file once and feeds every segment to a set of
+aggregators, so the summary analytics, the multi-select option report and
+any further report share one pass over the corpus:
+
+    tags = TagCounts(multi_fields=["MysteryTags"])
+    stats = ChapterStats()
+    scan_corpus(staging_files("airtable_staging/"), [tags, stats])
+
+Aggregators declare the segment fields they read (None for all), so only
+those are kept while decoding, and are mergeable: each chapter is read into
+fresh partials (aggregator.partial(chapter_id)) that are merged into the
+aggregator in file order once the whole file has been read. A file that
+fails to parse therefore contributes nothing, and merged totals (including
+Counter insertion order, which decides most_common ties) are the same as
+counting everything in one loop.
+
+With incremental=True each chapter's partials are also saved next to its
+file (.<filename>.aggregates), keyed by the file's SHA-256, and reused on
+later scans while the file is unchanged: after editing one chapter only
+that chapter is decoded again, and the rest is a merge.
+
+With workers > 1 the files are mapped across a process pool; each worker
+returns a chapter's compact partials and the parent reduces them in file
+order, so the results are identical to a serial scan.
+"""
+import copy
+import hashlib
+import json
+import os
+from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor
+
+from json_stream import iter_records
+
+STAGING_SUFFIX = "_segmented_granular.json"
+# Segmenter output written by `manuscript segment`, in addition to staging files
+SEGMENT_FILE_SUFFIXES = (STAGING_SUFFIX, "_segments.json", "_segments.ndjson")
+
+# Bump when aggregator logic changes, so partials saved by older code are recomputed
+PARTIALS_VERSION = 1
+
+# Keys in the segment JSON that correspond to multi-select fields in Airtable
+MULTI_SELECT_FIELDS = [
+    "SecondaryNarrativeModes",
+    "DialogueTone",
+    "PlotFunctionTags",
+    "MysteryTags",
+    "CharacterArcTags",
+    "WorldBuildingTags",
+    "StructuralOntologyTags",
+    "AuthorialIntentTags"
+]
+
+
+def chapter_id_from_filename(filename, suffix=STAGING_SUFFIX):
+    """chapter_3_segmented_granular.json -> CH3, CH042_segments.json -> CH042."""
+    return filename.replace(suffix, "").replace("chapter_", "CH").upper()
+
+
+def staging_files(directory, suffixes=(STAGING_SUFFIX,)):
+    """Returns (chapter_id, path) for every chapter file in the directory, in filename order."""
+    files = []
+    for filename in sorted(os.listdir(directory)):
+        for suffix in suffixes:
+            if filename.endswith(suffix):
+                files.append((chapter_id_from_filename(filename, suffix), os.path.join(directory, filename)))
+                break
+    return files
+
+
+def multi_select_values(value):
+    """Stripped values of a multi-select field: a list, or a single string if not properly formatted in source."""
+    if isinstance(value, list):
+        return [item.strip() for item in value if item and isinstance(item, str)]
+    if isinstance(value, str) and value:
+        return [value.strip()]
+    return []
+
+
+class Aggregator:
+    """Base class for scan_corpus aggregators.
+
+    Subclasses set `fields` (the segment fields they read, None for all) and
+    implement partial(chapter_id), returning an empty aggregator with the
+    same configuration for one chapter, add(segment) and merge(partial).
+    dump() and load(state) convert a partial to and from JSON for the
+    incremental cache; signature() names the configuration it was built with.
+    """
+    fields = None
+
+    def partial(self, chapter_id):
+        raise NotImplementedError
+
+    def add(self, segment):
+        raise NotImplementedError
+
+    def merge(self, other):
+        raise NotImplementedError
+
+    def dump(self):
+        raise NotImplementedError
+
+    def load(self, state):
+        raise NotImplementedError
+
+    def signature(self):
+        return f"{type(self).__name__}:{json.dumps(self.fields)}"
+
+
+class TagCounts(Aggregator):
+    """Value counts per field: single-select fields count their value, multi-select fields each list item."""
+
+    def __init__(self, single_fields=(), multi_fields=()):
+        self.single_fields = list(single_fields)
+        self.multi_fields = list(multi_fields)
+        self.fields = self.single_fields + self.multi_fields
+        self.counts = {field: Counter() for field in self.fields}
+
+    def partial(self, chapter_id):
+        return TagCounts(self.single_fields, self.multi_fields)
+
+    def add(self, segment):
+        for field in self.single_fields:
+            value = segment.get(field)
+            if value:
+                self.counts[field][value] += 1
+        for field in self.multi_fields:
+            counter = self.counts[field]
+            for value in multi_select_values(segment.get(field)):
+                counter[value] += 1
+
+    def merge(self, other):
+        for field, counter in other.counts.items():
+            self.counts[field].update(counter)
+
+    def dump(self):
+        # (value, count) pairs keep insertion order and non-string values
+        return {field: [[value, count] for value, count in counter.items()] for field, counter in self.counts.items()}
+
+    def load(self, state):
+        for field, pairs in state.items():
+            self.counts[field] = Counter({value: count for value, count in pairs})
+
+
+class OptionSets(Aggregator):
+    """Distinct values of multi-select fields, keyed by field in the order fields are first seen."""
+
+    def __init__(self, fields=MULTI_SELECT_FIELDS):
+        self.fields = list(fields)
+        self.options = defaultdict(set)
+
+    def partial(self, chapter_id):
+        return type(self)(self.fields)
+
+    def add(self, segment):
+        for field in self.fields:
+            values = multi_select_values(segment.get(field))
+            if values:
+                self.options[field].update(values)
+
+    def merge(self, other):
+        for field, values in other.options.items():
+            self.options[field] |= values
+
+    def dump(self):
+        return [[field, sorted(values)] for field, values in self.options.items()]
+
+    def load(self, state):
+        for field, values in state:
+            self.options[field] = set(values)
+
+
+class ChapterStats(Aggregator):
+    """Segments (and optionally words of SegmentText) per chapter."""
+
+    def __init__(self, count_words=True):
+        self.count_words = count_words
+        self.fields = ["SegmentText"] if count_words else []
+        self.segments = {}
+        self.words = {}
+        self.chapter_id = None
+
+    def partial(self, chapter_id):
+        partial = ChapterStats(self.count_words)
+        partial.chapter_id = chapter_id
+        partial.segments[chapter_id] = 0
+        partial.words[chapter_id] = 0
+        return partial
+
+    def add(self, segment):
+        self.segments[self.chapter_id] += 1
+        if self.count_words:
+            self.words[self.chapter_id] += len((segment.get("SegmentText") or "").split())
+
+    def merge(self, other):
+        for chapter_id, count in other.segments.items():
+            self.segments[chapter_id] = self.segments.get(chapter_id, 0) + count
+            self.words[chapter_id] = self.words.get(chapter_id, 0) + other.words.get(chapter_id, 0)
+
+    def dump(self):
+        return [[chapter_id, count, self.words.get(chapter_id, 0)] for chapter_id, count in self.segments.items()]
+
+    def load(self, state):
+        for chapter_id, count, words in state:
+            self.segments[chapter_id] = count
+            self.words[chapter_id] = words
+
+    def signature(self):
+        return f"ChapterStats:{self.count_words}"
+
+    def total_segments(self):
+        return sum(self.segments.values())
+
+
+def scan_fields(aggregators):
+    """Union of the fields the aggregators read, or None if any of them reads every field."""
+    fields = {}
+    for aggregator in aggregators:
+        if aggregator.fields is None:
+            return None
+        fields.update(dict.fromkeys(aggregator.fields))
+    return list(fields)
+
+
+def scan_chapter(chapter_id, path, aggregators, fields=None):
+    """Reads one chapter file into fresh partials of the aggregators; raises if the file cannot be read."""
+    partials = [aggregator.partial(chapter_id) for aggregator in aggregators]
+    for segment in iter_records(path, fields=fields, key="Segments"):
+        for partial in partials:
+            partial.add(segment)
+    return partials
+
+
+def partials_path(path):
+    """Where a chapter file's saved partials live: a hidden file next to it."""
+    directory, filename = os.path.split(path)
+    return os.path.join(directory, f".{filename}.aggregates")
+
+
+def file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def cached_scan_chapter(chapter_id, path, aggregators):
+    """Like scan_chapter, but reuses the partials saved next to the file while its content is unchanged.
+
+    Size and mtime are checked first; the content hash is only recomputed
+    when they differ (so a touched but unchanged file is still a hit). Only
+    aggregators without a saved partial are scanned, and the cache file is
+    rewritten if anything was added.
+    """
+    cache_file = partials_path(path)
+    stat = os.stat(path)
+    try:
+        with open(cache_file, 'r', encoding='utf-8') as f:
+            cached = json.load(f)
+    except (OSError, ValueError):
+        cached = {}
+    stored = cached.get("Partials", {}) if cached.get("Version") == PARTIALS_VERSION else {}
+    digest = cached.get("SHA256")
+    changed = [cached.get("Size"), cached.get("MTime")] != [stat.st_size, stat.st_mtime_ns]
+    if changed:
+        new_digest = file_digest(path)
+        if new_digest != digest:
+            stored = {}
+        digest = new_digest
+
+    signatures = [aggregator.signature() for aggregator in aggregators]
+    missing = [aggregator for aggregator, signature in zip(aggregators, signatures) if signature not in stored]
+    scanned = {}
+    if missing:
+        for aggregator, partial in zip(missing, scan_chapter(chapter_id, path, missing, scan_fields(missing))):
+            scanned[aggregator.signature()] = partial
+            stored[aggregator.signature()] = partial.dump()
+    if missing or changed:
+        state = {"Version": PARTIALS_VERSION, "SHA256": digest, "Size": stat.st_size, "MTime": stat.st_mtime_ns,
+                 "Partials": stored}
+        try:
+            temp_file = cache_file + ".tmp"
+            with open(temp_file, 'w', encoding='utf-8') as f:
+                json.dump(state, f, ensure_ascii=False)
+            os.replace(temp_file, cache_file)
+        except OSError as e:
+            print(f"Warning: Could not save partial aggregates for {os.path.basename(path)}: {e}")
+
+    partials = []
+    for aggregator, signature in zip(aggregators, signatures):
+        partial = scanned.get(signature)
+        if partial is None:
+            partial = aggregator.partial(chapter_id)
+            partial.load(stored[signature])
+        partials.append(partial)
+    return partials, bool(missing)
+
+
+def _scan_file(chapter_id, path, aggregators, fields, incremental):
+    """Returns ((partials, decoded), None) for one file, or (None, error message) if it cannot be read."""
+    try:
+        if incremental:
+            return cached_scan_chapter(chapter_id, path, aggregators), None
+        return (scan_chapter(chapter_id, path, aggregators, fields), True), None
+    except Exception as e:
+        return None, str(e)
+
+# Per-process aggregator templates, set once by the pool initializer
+_worker_scan = None
+
+def _init_scan_worker(aggregators, fields, incremental):
+    global _worker_scan
+    _worker_scan = (aggregators, fields, incremental)
+
+def _scan_file_job(job):
+    chapter_id, path = job
+    return _scan_file(chapter_id, path, *_worker_scan)
+
+def _scan_results(files, aggregators, fields, incremental, workers):
+    """Yields _scan_file results in file order, from this process (workers=1) or a process pool."""
+    if workers == 1 or len(files) < 2:
+        for chapter_id, path in files:
+            yield _scan_file(chapter_id, path, aggregators, fields, incremental)
+        return
+    # Workers only need the aggregators' configuration; copy it before the parent starts merging into them
+    templates = copy.deepcopy(aggregators)
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_scan_worker,
+                             initargs=(templates, fields, incremental)) as pool:
+        yield from pool.map(_scan_file_job, files)
+
+
+def scan_corpus(files, aggregators, incremental=False, workers=1):
+    """Feeds every segment of the (chapter_id, path) files to the aggregators in one pass.
+
+    Files that cannot be read are reported and skipped. With
+    incremental=True, unchanged files are merged from their saved partials
+    instead of being read (see cached_scan_chapter). workers > 1 (None for
+    one per CPU) scans files in parallel processes. Returns (files read,
+    files decoded).
+    """
+    files = list(files)
+    fields = scan_fields(aggregators)
+    read = 0
+    decoded = 0
+    for (chapter_id, path), (result, error) in zip(files, _scan_results(files, aggregators, fields, incremental,
+                                                                         workers)):
+        if error is not None:
+            print(f"Error reading {os.path.basename(path)}: {error}")
+            continue
+        partials, rescanned = result
+        for aggregator, partial in zip(aggregators, partials):
+            aggregator.merge(partial)
+        read += 1
+        decoded += rescanned
+    return read, decoded
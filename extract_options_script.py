@@ -1,72 +1,40 @@
 #!/usr/bin/env python3
-import json
-import os
-from collections import defaultdict
+from corpus_scanner import MULTI_SELECT_FIELDS, OptionSets, scan_corpus, staging_files
 
-def extract_multiselect_options(staging_dir):
-    """Extracts all unique options for predefined multi-select fields from JSON files."""
-    
-    # These are the keys in the JSON that correspond to multi-select fields in Airtable
-    # as per the airtable_uploader.py script logic.
-    multi_select_fields = [
-        "SecondaryNarrativeModes",
-        "DialogueTone",
-        "PlotFunctionTags",
-        "MysteryTags",
-        "CharacterArcTags",
-        "WorldBuildingTags",
-        "StructuralOntologyTags",
-        "AuthorialIntentTags"
-    ]
-    
-    all_options = defaultdict(set)
+OPTIONS_REPORT_PATH = "/home/ubuntu/novel_project/required_airtable_multiselect_options.md"
+
+class MultiselectOptions(OptionSets):
+    """Unique options of the multi-select fields (as per the airtable_uploader.py script logic)."""
+
+    def __init__(self, fields=MULTI_SELECT_FIELDS):
+        super().__init__(fields)
+
+    def report(self):
+        """The Markdown report of options to create in Airtable."""
+        report_lines = ["# Required Options for Airtable Multiple Select Fields\n"]
+        report_lines.append("Please ensure the following options are created in your Airtable 'Text Segments' table for the respective Multiple Select fields:\n")
 
+        for field, options_set in self.options.items():
+            if options_set:
+                report_lines.append(f"## Field: {field}\n")
+                for option in sorted(list(options_set)):
+                    report_lines.append(f"- {option}\n")
+                report_lines.append("\n")
+            else:
+                report_lines.append(f"## Field: {field}\n")
+                report_lines.append("- (No options found in data for this field)\n\n")
+        return "\n".join(report_lines)
+
+def extract_multiselect_options(staging_dir, output_filepath=OPTIONS_REPORT_PATH, incremental=True, workers=1):
+    """Extracts all unique options for predefined multi-select fields from JSON files."""
     print(f"Scanning files in {staging_dir} for multi-select options...")
 
-    for filename in sorted(os.listdir(staging_dir)):
-        if filename.endswith("_segmented_granular.json"):
-            filepath = os.path.join(staging_dir, filename)
-            # print(f"Processing file: {filepath}")
-            
-            try:
-                with open(filepath, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-            except Exception as e:
-                print(f"Error reading {filename}: {e}")
-                continue
+    options = MultiselectOptions()
+    scan_corpus(staging_files(staging_dir), [options], incremental, workers)
 
-            segments = data.get("Segments", [])
-            for seg_data in segments:
-                for field_name in multi_select_fields:
-                    field_values = seg_data.get(field_name)
-                    if field_values:
-                        # Ensure it's a list, as some might be single strings if not properly formatted in source
-                        if isinstance(field_values, list):
-                            for value in field_values:
-                                if value and isinstance(value, str):
-                                    all_options[field_name].add(value.strip())
-                        elif isinstance(field_values, str): # Handle if it's a single string by mistake
-                             if field_values:
-                                all_options[field_name].add(field_values.strip())
-                                
-    # Prepare the output report
-    report_lines = ["# Required Options for Airtable Multiple Select Fields\n"]
-    report_lines.append("Please ensure the following options are created in your Airtable 'Text Segments' table for the respective Multiple Select fields:\n")
-    
-    for field, options_set in all_options.items():
-        if options_set:
-            report_lines.append(f"## Field: {field}\n")
-            for option in sorted(list(options_set)):
-                report_lines.append(f"- {option}\n")
-            report_lines.append("\n")
-        else:
-            report_lines.append(f"## Field: {field}\n")
-            report_lines.append("- (No options found in data for this field)\n\n")
-            
-    output_filepath = "/home/ubuntu/novel_project/required_airtable_multiselect_options.md"
     with open(output_filepath, 'w', encoding='utf-8') as f_out:
-        f_out.write("\n".join(report_lines))
-        
+        f_out.write(options.report())
+
     print(f"Successfully extracted options. Report saved to: {output_filepath}")
     return output_filepath
 
@@ -74,4 +42,3 @@ if __name__ == "__main__":
     staging_directory = "/home/ubuntu/novel_project/airtable_staging/"
     report_file = extract_multiselect_options(staging_directory)
     # The script will print the path to the report, which can then be used by the agent.
-
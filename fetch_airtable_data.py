@@ -1,61 +1,285 @@
 import os
+import argparse
+import asyncio
+import gzip
 import requests
 import json
 
-AIRTABLE_API_KEY = "patLp1BLsnVXKuiQq.73e184272c8f175f6b3383eb3e61ea6edb70dff2db38858f6b387266cc861868"
-AIRTABLE_BASE_ID = "appYaxSciZz3FHgaV"
+from airtable_api import (AIRTABLE_REQUESTS_PER_SECOND, REQUEST_TIMEOUT, AsyncAirtableClient, formula_string, make_session,
+                          table_url)
+
+AIRTABLE_API_KEY = os.getenv("AIRTABLE_API_KEY", "patLp1BLsnVXKuiQq.73e184272c8f175f6b3383eb3e61ea6edb70dff2db38858f6b387266cc861868")
+AIRTABLE_BASE_ID = os.getenv("AIRTABLE_BASE_ID", "appYaxSciZz3FHgaV")
 CHAPTERS_TABLE_NAME = "Chapters"
 TEXT_SEGMENTS_TABLE_NAME = "Text Segments"
 
 OUTPUT_CHAPTERS_FILE = "/home/ubuntu/novel_project/airtable_chapters_data.json"
 OUTPUT_SEGMENTS_FILE = "/home/ubuntu/novel_project/airtable_segments_data.json"
 
-headers = {
-    "Authorization": f"Bearer {AIRTABLE_API_KEY}",
+# Incremental fetch: each table needs a formula field with LAST_MODIFIED_TIME()
+LAST_MODIFIED_FIELD = "Last Modified"
+FETCH_STATE_FILENAME = ".airtable_fetch_state.json"
+
+# Fields each downstream consumer reads; fetching only these cuts bytes transferred
+CONSUMER_FIELDS = {
+    "assembler": {
+        CHAPTERS_TABLE_NAME: ["Chapter ID", "Chapter Number", "Chapter Title", "Word Count"],
+        TEXT_SEGMENTS_TABLE_NAME: ["Segment ID", "Chapter Link", "Segment Order", "Segment Text"],
+    },
 }
 
-def fetch_all_records(base_id, table_name):
+def fetch_all_records(base_id, table_name, api_key=None, api_url=None, filter_formula=None, fields=None,
+                      session=None, page_size=100):
+    """Lists a whole table synchronously; pass a session to reuse its keep-alive connections across calls."""
     records = []
-    url = f"https://api.airtable.com/v0/{base_id}/{table_name}"
-    params = {}
-
-    while True:
-        response = requests.get(url, headers=headers, params=params)
-        response.raise_for_status()  # Raise an exception for HTTP errors
-        data = response.json()
-        records.extend(data.get("records", []))
-        offset = data.get("offset")
-        if not offset:
-            break
-        params["offset"] = offset
+    url = table_url(base_id, table_name, api_url)
+    own_session = session is None
+    if own_session:
+        session = make_session(api_key or AIRTABLE_API_KEY, pool_size=1)
+    params = {"pageSize": page_size}
+    if filter_formula:
+        params["filterByFormula"] = filter_formula
+    if fields:
+        params["fields[]"] = list(fields)
+
+    try:
+        while True:
+            response = session.get(url, params=params, timeout=REQUEST_TIMEOUT)
+            response.raise_for_status()  # Raise an exception for HTTP errors
+            data = response.json()
+            records.extend(data.get("records", []))
+            offset = data.get("offset")
+            if not offset:
+                break
+            params["offset"] = offset
+    finally:
+        if own_session:
+            session.close()
     return records
 
-def main():
-    print(f"Fetching records from Chapters table: {CHAPTERS_TABLE_NAME}...")
+def consumer_fields(consumer, chapters_table=CHAPTERS_TABLE_NAME, segments_table=TEXT_SEGMENTS_TABLE_NAME):
+    """CONSUMER_FIELDS for a consumer, keyed by the actual table names; None fetches every field."""
+    if not consumer:
+        return None
+    projection = CONSUMER_FIELDS[consumer]
+    return {chapters_table: projection[CHAPTERS_TABLE_NAME], segments_table: projection[TEXT_SEGMENTS_TABLE_NAME]}
+
+def modified_since_formula(last_modified_field, timestamp):
+    """Matches records modified at or after timestamp; the boundary is refetched so none are missed."""
+    return f"NOT(IS_BEFORE({{{last_modified_field}}}, {formula_string(timestamp)}))"
+
+def high_water_mark(records, last_modified_field, previous=None):
+    """Latest last-modified value among records (server time, so no local clock skew)."""
+    stamps = [r["fields"][last_modified_field] for r in records if r.get("fields", {}).get(last_modified_field)]
+    if previous:
+        stamps.append(previous)
+    return max(stamps) if stamps else None
+
+def load_fetch_state(state_file, base_id):
+    state = {"BaseID": base_id, "Tables": {}}
+    if state_file and os.path.exists(state_file):
+        with open(state_file, 'r', encoding='utf-8') as f:
+            saved = json.load(f)
+        if saved.get("BaseID") == base_id:
+            state = saved
+    return state
+
+def save_fetch_state(state, state_file):
+    tmp_file = state_file + ".tmp"
+    with open(tmp_file, 'w', encoding='utf-8') as f:
+        json.dump(state, f, indent=4)
+    os.replace(tmp_file, state_file)
+
+def merge_records(cached_records, changed_records, live_ids):
+    """Applies changed records to the cache by record ID and drops records no longer live.
+
+    Cached order is kept; new records are appended. Returns (records, deleted count).
+    """
+    changed_by_id = {record["id"]: record for record in changed_records}
+    merged = []
+    deleted = 0
+    for record in cached_records:
+        if record["id"] not in live_ids:
+            deleted += 1
+            continue
+        merged.append(changed_by_id.pop(record["id"], record))
+    merged.extend(record for record in changed_by_id.values() if record["id"] in live_ids)
+    return merged, deleted
+
+def is_ndjson(path):
+    return str(path).endswith((".ndjson", ".ndjson.gz", ".jsonl", ".jsonl.gz"))
+
+async def stream_table_ndjson(client, table_name, output_file, fields=None, resume=False):
+    """Streams a table to an NDJSON file one page at a time; returns the record count.
+
+    A ".gz" file gets one gzip member per page (a valid multi-member gzip).
+    After every page, the next offset and the file size are saved to
+    <output_file>.progress, so with resume an interrupted fetch truncates any
+    partially written page and continues from that offset. The progress file
+    is removed once the table is complete.
+    """
+    compress = str(output_file).endswith(".gz")
+    progress_file = f"{output_file}.progress"
+    offset, count, size = None, 0, 0
+    if resume and os.path.exists(progress_file) and os.path.exists(output_file):
+        with open(progress_file, 'r', encoding='utf-8') as f:
+            progress = json.load(f)
+        if progress.get("Fields") == fields:
+            offset, count, size = progress["Offset"], progress["Records"], progress["Bytes"]
+            print(f"Resuming {table_name} after {count} records.")
     try:
-        chapter_records = fetch_all_records(AIRTABLE_BASE_ID, CHAPTERS_TABLE_NAME)
-        with open(OUTPUT_CHAPTERS_FILE, "w") as f:
-            json.dump(chapter_records, f, indent=4)
-        print(f"Successfully fetched {len(chapter_records)} records from Chapters table and saved to {OUTPUT_CHAPTERS_FILE}")
+        with open(output_file, "r+b" if size else "wb") as out:
+            out.truncate(size)
+            out.seek(size)
+            async for page, next_offset in client.iter_pages(table_name, fields, offset=offset):
+                data = "".join(json.dumps(record, ensure_ascii=False) + "\n" for record in page).encode('utf-8')
+                out.write(gzip.compress(data) if compress else data)
+                out.flush()
+                count += len(page)
+                if next_offset:
+                    with open(progress_file, 'w', encoding='utf-8') as f:
+                        json.dump({"Table": table_name, "Offset": next_offset, "Records": count,
+                                   "Bytes": out.tell(), "Fields": fields}, f)
     except requests.exceptions.HTTPError as e:
-        print(f"Error fetching Chapters data: {e}")
+        # Airtable offsets expire; start over rather than fail
+        if offset and e.response.status_code == 422:
+            print(f"Saved offset for {table_name} is no longer valid; fetching from the start.")
+            return await stream_table_ndjson(client, table_name, output_file, fields)
+        raise
+    if os.path.exists(progress_file):
+        os.remove(progress_file)
+    return count
+
+async def fetch_table_incremental(client, table_name, output_file, table_state, fields=None,
+                                  last_modified_field=LAST_MODIFIED_FIELD):
+    """Brings a cached table file up to date; returns the record count.
+
+    Only records modified since the stored high-water mark are downloaded,
+    while a listing projected to the (small) last-modified field gives the
+    live record IDs so deletions can be dropped from the cache. Without a
+    mark or a cache file, or when the field projection changed, the whole
+    table is fetched.
+    """
+    if fields and last_modified_field not in fields:
+        fields = list(fields) + [last_modified_field]
+    mark = table_state.get("HighWaterMark")
+    if mark and os.path.exists(output_file) and table_state.get("Fields") == fields:
+        with open(output_file, "r") as f:
+            cached_records = json.load(f)
+        changed, live_records = await asyncio.gather(
+            client.list_records(table_name, fields=fields,
+                                filter_formula=modified_since_formula(last_modified_field, mark)),
+            client.list_records(table_name, fields=[last_modified_field]))
+        records, deleted = merge_records(cached_records, changed, {r["id"] for r in live_records})
+        print(f"{table_name}: {len(changed)} changed since {mark}, {deleted} deleted.")
+    else:
+        changed = records = await client.list_records(table_name, fields=fields)
+    with open(output_file, "w") as f:
+        json.dump(records, f, indent=4)
+    new_mark = high_water_mark(changed, last_modified_field, mark)
+    if new_mark is None:
+        print(f"Warning: no '{last_modified_field}' values in {table_name}; the next fetch will be a full one. "
+              f"Add a LAST_MODIFIED_TIME() formula field named '{last_modified_field}' to enable incremental fetch.")
+    table_state["HighWaterMark"] = new_mark
+    table_state["Fields"] = fields
+    return len(records)
+
+async def fetch_table(client, table_name, output_file, label, table_state=None, fields=None,
+                      last_modified_field=LAST_MODIFIED_FIELD, resume=False):
+    """Fetches one table to a JSON or NDJSON file (incrementally when table_state is given).
+
+    Returns the record count, or None after reporting an error.
+    """
+    print(f"Fetching records from {label} table: {table_name}...")
+    try:
+        if is_ndjson(output_file):
+            count = await stream_table_ndjson(client, table_name, output_file, fields, resume)
+        elif table_state is not None:
+            count = await fetch_table_incremental(client, table_name, output_file, table_state, fields,
+                                                  last_modified_field)
+        else:
+            records = await client.list_records(table_name, fields=fields)
+            with open(output_file, "w") as f:
+                json.dump(records, f, indent=4)
+            count = len(records)
+        print(f"Successfully fetched {count} records from {label} table and saved to {output_file}")
+        return count
+    except requests.exceptions.HTTPError as e:
+        print(f"Error fetching {label} data: {e}")
         if e.response.status_code == 401:
             print("Airtable API Key is likely invalid or expired. Please check.")
-        return
+        elif e.response.status_code == 422 and table_state is not None:
+            print(f"Incremental fetch needs a '{last_modified_field}' field with LAST_MODIFIED_TIME() in {table_name}.")
     except Exception as e:
-        print(f"An unexpected error occurred while fetching Chapters data: {e}")
-        return
+        print(f"An unexpected error occurred while fetching {label} data: {e}")
+    return None
+
+async def fetch_tables_async(chapters_file, segments_file, api_key=None, base_id=AIRTABLE_BASE_ID,
+                             chapters_table=CHAPTERS_TABLE_NAME, segments_table=TEXT_SEGMENTS_TABLE_NAME,
+                             api_url=None, state_file=None, last_modified_field=LAST_MODIFIED_FIELD, fields=None,
+                             requests_per_second=AIRTABLE_REQUESTS_PER_SECOND, max_in_flight=4, resume=False):
+    """Fetches both tables concurrently over one pooled, rate-limited client.
+
+    fields maps table name to the field names to request (see CONSUMER_FIELDS);
+    tables not in it are fetched whole. Files named .ndjson(.gz) are streamed
+    page by page, and resume continues an interrupted NDJSON fetch.
+    """
+    if state_file and (is_ndjson(chapters_file) or is_ndjson(segments_file)):
+        print("Error: Incremental fetch merges into JSON files; it cannot be combined with NDJSON output.")
+        return None
+    state = load_fetch_state(state_file, base_id) if state_file else None
+    fields = fields or {}
+    client = AsyncAirtableClient(api_key or AIRTABLE_API_KEY, base_id, requests_per_second=requests_per_second,
+                                 max_in_flight=max_in_flight, api_url=api_url)
+
+    async def fetch_one(table_name, output_file, label):
+        table_state = state["Tables"].setdefault(table_name, {}) if state is not None else None
+        count = await fetch_table(client, table_name, output_file, label, table_state, fields.get(table_name),
+                                  last_modified_field, resume)
+        if count is not None and state is not None:
+            # Saved per table, and only once its file is written
+            save_fetch_state(state, state_file)
+        return count
 
-    print(f"Fetching records from Text Segments table: {TEXT_SEGMENTS_TABLE_NAME}...")
     try:
-        segment_records = fetch_all_records(AIRTABLE_BASE_ID, TEXT_SEGMENTS_TABLE_NAME)
-        with open(OUTPUT_SEGMENTS_FILE, "w") as f:
-            json.dump(segment_records, f, indent=4)
-        print(f"Successfully fetched {len(segment_records)} records from Text Segments table and saved to {OUTPUT_SEGMENTS_FILE}")
-    except requests.exceptions.HTTPError as e:
-        print(f"Error fetching Text Segments data: {e}")
-    except Exception as e:
-        print(f"An unexpected error occurred while fetching Text Segments data: {e}")
+        counts = await asyncio.gather(fetch_one(chapters_table, chapters_file, "Chapters"),
+                                      fetch_one(segments_table, segments_file, "Text Segments"))
+    finally:
+        client.close()
+    if None in counts:
+        return None
+    return tuple(counts)
+
+def fetch_tables(chapters_file, segments_file, api_key=None, base_id=AIRTABLE_BASE_ID,
+                 chapters_table=CHAPTERS_TABLE_NAME, segments_table=TEXT_SEGMENTS_TABLE_NAME, api_url=None,
+                 state_file=None, last_modified_field=LAST_MODIFIED_FIELD, **options):
+    """Fetches the Chapters and Text Segments tables to JSON files; returns (chapters, segments) or None on error.
+
+    With state_file, each table is fetched incrementally against the high-water
+    mark stored there and merged into its existing file.
+    """
+    return asyncio.run(fetch_tables_async(chapters_file, segments_file, api_key, base_id, chapters_table,
+                                          segments_table, api_url, state_file, last_modified_field, **options))
+
+def main():
+    parser = argparse.ArgumentParser(description="Fetch the Chapters and Text Segments tables from Airtable.")
+    parser.add_argument("--api_url", help="Airtable API base URL (default: $AIRTABLE_API_URL or the public API)")
+    parser.add_argument("--chapters_file", default=OUTPUT_CHAPTERS_FILE, help="Output file for the Chapters table (.json, .ndjson or .ndjson.gz)")
+    parser.add_argument("--segments_file", default=OUTPUT_SEGMENTS_FILE, help="Output file for the Text Segments table (.json, .ndjson or .ndjson.gz)")
+    parser.add_argument("--incremental", action="store_true", help="Only fetch records modified since the last fetch and merge them")
+    parser.add_argument("--last_modified_field", default=LAST_MODIFIED_FIELD, help="LAST_MODIFIED_TIME() formula field used for incremental fetch")
+    parser.add_argument("--state_file", help="Fetch state file (default: .airtable_fetch_state.json next to the chapters file)")
+    parser.add_argument("--resume", action="store_true", help="Continue an interrupted NDJSON (.ndjson/.ndjson.gz) fetch from its last page")
+    parser.add_argument("--fields_for", choices=sorted(CONSUMER_FIELDS), help="Only fetch the fields this consumer reads")
+    parser.add_argument("--requests_per_second", type=float, default=AIRTABLE_REQUESTS_PER_SECOND, help="Per-base request rate limit")
+    args = parser.parse_args()
+    state_file = None
+    if args.incremental:
+        state_file = args.state_file or os.path.join(os.path.dirname(os.path.abspath(args.chapters_file)), FETCH_STATE_FILENAME)
+    fetch_tables(args.chapters_file, args.segments_file, AIRTABLE_API_KEY, AIRTABLE_BASE_ID, api_url=args.api_url,
+                 state_file=state_file, last_modified_field=args.last_modified_field,
+                 fields=consumer_fields(args.fields_for), requests_per_second=args.requests_per_second,
+                 resume=args.resume)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+"""
+Iterative loading of large record files.
+
+iter_records yields one record at a time from:
+
+- a JSON array of records (the fetched Airtable files),
+- an object wrapping such an array (segmenter output: {"ChapterID": ...,
+  "Segments": [...]}); the other top-level members before the array are
+  available through the `header` dict,
+- NDJSON (.ndjson / .jsonl), optionally gzipped (.gz).
+
+Only one record is decoded at a time, and `fields` drops everything a caller
+does not read, so memory stays bounded by the largest record rather than the
+file. Uses json.JSONDecoder.raw_decode on a sliding buffer; no third-party
+parser is needed.
+"""
+import gzip
+import json
+
+CHUNK_SIZE = 1 << 16
+NDJSON_SUFFIXES = (".ndjson", ".jsonl", ".ndjson.gz", ".jsonl.gz")
+_WHITESPACE = " \t\n\r"
+_DELIMITERS = _WHITESPACE + ",]}:"
+_decoder = json.JSONDecoder()
+
+
+def open_text(path):
+    """Opens a (possibly gzipped) text file for reading."""
+    path = str(path)
+    if path.endswith(".gz"):
+        return gzip.open(path, 'rt', encoding='utf-8')
+    return open(path, 'r', encoding='utf-8')
+
+
+def project(record, fields):
+    """Keeps only the named fields: inside "fields" for Airtable records, at the top level otherwise."""
+    if fields is None:
+        return record
+    inner = record.get("fields")
+    if isinstance(inner, dict):
+        projected = {name: value for name, value in record.items() if name != "fields"}
+        projected["fields"] = {name: inner[name] for name in fields if name in inner}
+        return projected
+    return {name: record[name] for name in fields if name in record}
+
+
+class _Buffer:
+    """A read-ahead window over a text stream for raw_decode."""
+
+    def __init__(self, f):
+        self.f = f
+        self.text = ""
+        self.pos = 0
+        self.eof = False
+
+    def fill(self):
+        """Reads another chunk (at least as large as the pending text); returns False at EOF."""
+        if self.eof:
+            return False
+        if self.pos > CHUNK_SIZE:
+            self.text = self.text[self.pos:]
+            self.pos = 0
+        chunk = self.f.read(max(CHUNK_SIZE, len(self.text) - self.pos))
+        if not chunk:
+            self.eof = True
+            return False
+        self.text += chunk
+        return True
+
+    def peek(self):
+        """Returns the next non-whitespace character (without consuming it), or "" at EOF."""
+        while True:
+            while self.pos < len(self.text) and self.text[self.pos] in _WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.text):
+                return self.text[self.pos]
+            if not self.fill():
+                return ""
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise json.JSONDecodeError(f"Expected {char!r}", self.text, self.pos)
+        self.pos += 1
+
+    def value(self):
+        """Decodes the next complete JSON value."""
+        self.peek()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.text, self.pos)
+            except json.JSONDecodeError:
+                if self.fill():
+                    continue
+                raise
+            # A number cut at the buffer edge ("12" of "12.5") decodes early; only accept it at a delimiter
+            if (end == len(self.text) or self.text[end] not in _DELIMITERS) and self.fill():
+                continue
+            self.pos = end
+            return value
+
+    def array(self):
+        """Yields the elements of the array starting at the current position."""
+        self.expect("[")
+        if self.peek() == "]":
+            self.pos += 1
+            return
+        while True:
+            yield self.value()
+            separator = self.peek()
+            self.pos += 1
+            if separator == "]":
+                return
+            if separator != ",":
+                raise json.JSONDecodeError("Expected ',' or ']'", self.text, self.pos - 1)
+
+
+def iter_records(path, fields=None, key=None, header=None):
+    """Yields the records of a JSON array, object-wrapped array or NDJSON file, one at a time.
+
+    For an object, records come from the member named `key` (default: the
+    first array-valued member); members before it are decoded into `header`
+    when a dict is given. `fields` projects each record (see project).
+    """
+    with open_text(path) as f:
+        if str(path).endswith(NDJSON_SUFFIXES):
+            for line in f:
+                if line.strip():
+                    yield project(json.loads(line), fields)
+            return
+        buffer = _Buffer(f)
+        first = buffer.peek()
+        if first == "[":
+            for record in buffer.array():
+                yield project(record, fields)
+            return
+        buffer.expect("{")
+        while buffer.peek() not in ("}", ""):
+            name = buffer.value()
+            buffer.expect(":")
+            if (key is None and buffer.peek() == "[") or name == key:
+                for record in buffer.array():
+                    yield project(record, fields)
+                return
+            value = buffer.value()
+            if header is not None:
+                header[name] = value
+            if buffer.peek() == ",":
+                buffer.pos += 1
+
+
+def load_header(path, key="Segments"):
+    """Returns the top-level members that precede the `key` array (e.g. ChapterID) without reading the array."""
+    header = {}
+    records = iter_records(path, key=key, header=header)
+    try:
+        next(records, None)
+    finally:
+        records.close()
+    return header
@@ -7,7 +7,9 @@ A unified command-line interface for managing novel generation workflows.
 import argparse
 import sys
 import os
+import glob
 import json
+import time
 from pathlib import Path
 
 # Import existing scripts (optional - only when needed)
@@ -16,6 +18,16 @@ try:
 except ImportError:
     segmenter_script = None
 
+try:
+    import segment_model
+except ImportError:
+    segment_model = None
+
+try:
+    import manuscript_db
+except ImportError:
+    manuscript_db = None
+
 try:
     import airtable_uploader
 except ImportError:
@@ -31,11 +43,31 @@ try:
 except ImportError:
     chapter_assembler = None
 
+try:
+    import corpus_scanner
+except ImportError:
+    corpus_scanner = None
+
+try:
+    import tag_matrix
+except ImportError:
+    tag_matrix = None
+
+try:
+    import pacing_analysis
+except ImportError:
+    pacing_analysis = None
+
 try:
     import generate_analytics_script
 except ImportError:
     generate_analytics_script = None
 
+try:
+    import extract_options_script
+except ImportError:
+    extract_options_script = None
+
 
 class ManuscriptCLI:
     """Main CLI controller for manuscript workflow."""
@@ -63,6 +95,33 @@ class ManuscriptCLI:
             json.dump(self.config, f, indent=2)
         print(f"✓ Configuration saved to {self.config_file}")
     
+    def character_index(self):
+        """Build the character/alias index from config["known_characters"]."""
+        return segmenter_script.load_character_index(self.config.get("known_characters"))
+    
+    def database_path(self, args):
+        """SQLite mirror path: --db, then config["database"], then manuscript.db in the output directory."""
+        return Path(getattr(args, "db", None) or self.config.get("database") or
+                    Path(self.config.get("default_output_dir", ".")) / manuscript_db.DEFAULT_DB_FILENAME)
+    
+    def mirror_segment_files(self, args, files):
+        """Imports segmenter output files into the SQLite mirror unless --no-db was given."""
+        if getattr(args, "no_db", False) or manuscript_db is None:
+            return
+        db_path = self.database_path(args)
+        db_path.parent.mkdir(parents=True, exist_ok=True)
+        conn = manuscript_db.connect(db_path)
+        try:
+            for path, chapter_id in files:
+                manuscript_db.import_segment_file(conn, path, chapter_id)
+        finally:
+            conn.close()
+        print(f"✓ Mirrored to {db_path}")
+    
+    def airtable_api_url(self, args):
+        """Airtable API base URL: --api-url, then config["airtable_api_url"], then $AIRTABLE_API_URL."""
+        return getattr(args, "api_url", None) or self.config.get("airtable_api_url") or None
+    
     def cmd_init(self, args):
         """Initialize manuscript project configuration."""
         print("📚 Manuscript Workflow Initialization")
@@ -74,6 +133,8 @@ class ManuscriptCLI:
             self.config["airtable_base_id"] = args.airtable_base
         if args.output_dir:
             self.config["default_output_dir"] = args.output_dir
+        if args.airtable_url:
+            self.config["airtable_api_url"] = args.airtable_url
         
         self.save_config()
         
@@ -94,6 +155,21 @@ class ManuscriptCLI:
             print(f"❌ Error: Input file not found: {input_file}")
             return 1
         
+        if args.stream and args.incremental:
+            print("❌ Error: --stream and --incremental cannot be combined")
+            return 1
+        
+        if args.stream:
+            output_file = Path(args.output) if args.output else \
+                         Path(self.config["default_output_dir"]) / f"{args.chapter_id}_segments.ndjson"
+            output_file.parent.mkdir(parents=True, exist_ok=True)
+            count = segmenter_script.stream_segment_file(input_file, output_file, args.chapter_id,
+                                                         self.character_index(), args.compact)
+            print(f"✓ Streamed {count} segments")
+            print(f"✓ Saved to {output_file}")
+            self.mirror_segment_files(args, [(output_file, args.chapter_id)])
+            return 0
+        
         output_file = Path(args.output) if args.output else \
                      Path(self.config["default_output_dir"]) / f"{args.chapter_id}_segments.json"
         
@@ -101,19 +177,72 @@ class ManuscriptCLI:
         with open(input_file, 'r', encoding='utf-8') as f:
             chapter_content = f.read()
         
-        segmented_data = segmenter_script.segment_chapter(chapter_content, args.chapter_id)
-        
-        chapter_output = {
-            "ChapterID": args.chapter_id,
-            "Segments": segmented_data
-        }
+        # The manifest is written on every run so a later --incremental run can reuse it
+        manifest_file = segmenter_script.manifest_path_for(output_file)
+        manifest = segmenter_script.load_manifest(manifest_file) if args.incremental else None
+        segmented_data, manifest, stats = segmenter_script.segment_chapter_incremental(
+            chapter_content, args.chapter_id, manifest, self.character_index(), as_segments=True)
         
         output_file.parent.mkdir(parents=True, exist_ok=True)
         with open(output_file, 'w', encoding='utf-8') as f:
-            json.dump(chapter_output, f, indent=4, ensure_ascii=False)
+            segment_model.dump_chapter(args.chapter_id, segmented_data, f, args.compact)
         
+        segmenter_script.save_manifest(manifest, manifest_file)
         print(f"✓ Segmented {len(segmented_data)} segments")
+        if args.incremental:
+            print(f"  Re-tagged {stats['Tagged']}, reused {stats['Reused']} unchanged")
         print(f"✓ Saved to {output_file}")
+        self.mirror_segment_files(args, [(output_file, args.chapter_id)])
+        return 0
+    
+    def cmd_segment_all(self, args):
+        """Segment many chapter files in parallel."""
+        input_files = []
+        for pattern in args.inputs:
+            if Path(pattern).is_dir():
+                input_files.extend(p for p in Path(pattern).iterdir()
+                                   if p.suffix.lower() in ('.txt', '.md'))
+            else:
+                input_files.extend(Path(p) for p in glob.glob(pattern))
+        input_files = sorted(set(input_files))
+        if not input_files:
+            print(f"❌ Error: No chapter files matched {' '.join(args.inputs)}")
+            return 1
+        
+        jobs = []
+        seen_ids = {}
+        output_dir = Path(args.output) if args.output else Path(self.config["default_output_dir"])
+        output_dir.mkdir(parents=True, exist_ok=True)
+        for input_file in input_files:
+            chapter_id = segmenter_script.chapter_id_from_filename(input_file)
+            if chapter_id in seen_ids:
+                print(f"❌ Error: {input_file} and {seen_ids[chapter_id]} both map to chapter ID {chapter_id}")
+                return 1
+            seen_ids[chapter_id] = input_file
+            jobs.append((input_file, output_dir / f"{chapter_id}_segments.json", chapter_id))
+        jobs.sort(key=lambda job: job[2])
+        
+        workers = args.jobs or os.cpu_count()
+        print(f"📄 Segmenting {len(jobs)} chapters with {workers} worker(s)...")
+        
+        started = time.perf_counter()
+        total_segments = 0
+        total_bytes = 0
+        for stats in segmenter_script.segment_files(jobs, workers, self.config.get("known_characters"),
+                                                    args.compact):
+            rate = stats["Segments"] / stats["Seconds"] if stats["Seconds"] else 0
+            print(f"  {stats['ChapterID']:<10} {stats['Segments']:>6} segments  {stats['Words']:>8} words  "
+                  f"{stats['Seconds']:7.2f}s  {rate:9.0f} segments/s")
+            total_segments += stats["Segments"]
+            total_bytes += stats["Bytes"]
+        elapsed = time.perf_counter() - started
+        
+        print(f"✓ Segmented {len(jobs)} chapters ({total_segments} segments) in {elapsed:.2f}s")
+        if elapsed:
+            print(f"  Throughput: {total_segments / elapsed:.0f} segments/s, "
+                  f"{total_bytes / elapsed / 1e6:.2f} MB/s")
+        print(f"✓ Saved to {output_dir}")
+        self.mirror_segment_files(args, [(output_file, chapter_id) for _, output_file, chapter_id in jobs])
         return 0
     
     def cmd_upload(self, args):
@@ -134,9 +263,51 @@ class ManuscriptCLI:
             print(f"❌ Error: Input file not found: {input_file}")
             return 1
         
-        print(f"✓ Uploading from {input_file}")
-        # Note: airtable_uploader would need to be refactored to be callable as a function
-        print("⚠️  Upload functionality requires airtable_uploader.py to be refactored")
+        files = airtable_uploader.staging_files(input_file) if input_file.is_dir() else [str(input_file)]
+        if not files:
+            print(f"❌ Error: No segment files (*_segmented_granular.json, *_segments.json, *_segments.ndjson) "
+                  f"in {input_file}")
+            return 1
+        tables = (self.config.get("chapters_table", "Chapters"), self.config.get("segments_table", "Text Segments"))
+        options = {"max_in_flight": args.max_in_flight, "max_chapters": args.max_chapters,
+                   "max_retries": args.max_retries, "api_url": self.airtable_api_url(args)}
+        state_dir = input_file if input_file.is_dir() else input_file.parent
+        
+        if args.sync:
+            state_file = args.state_file or str(state_dir / airtable_uploader.SYNC_STATE_FILENAME)
+            print(f"✓ Syncing {len(files)} file(s) from {input_file}")
+            totals = airtable_uploader.sync_files(
+                self.config["airtable_api_key"], self.config["airtable_base_id"], *tables,
+                files, state_file, **options)
+            if totals is None:
+                print("❌ Error: Sync could not start; nothing was sent")
+                return 1
+            print(f"✓ {totals['created']} created, {totals['updated']} updated, {totals['deleted']} deleted")
+            print(f"✓ Sync state saved to {state_file}")
+            if totals["failed"] or totals["failed_files"]:
+                print(f"❌ {totals['failed']} segments and {totals['failed_files']} files failed; "
+                      f"re-run the sync to retry them")
+                return 1
+            return 0
+        
+        journal_file = args.journal or str(state_dir / airtable_uploader.JOURNAL_FILENAME)
+        if args.resume and not Path(journal_file).exists():
+            print(f"❌ Error: No upload journal to resume: {journal_file}")
+            return 1
+        
+        print(f"✓ {'Resuming upload of' if args.resume else 'Uploading'} {len(files)} file(s) from {input_file}")
+        totals = airtable_uploader.upload_files(
+            self.config["airtable_api_key"], self.config["airtable_base_id"], *tables,
+            files, journal_file=journal_file, resume=args.resume, **options)
+        if totals is None:
+            print("❌ Error: Upload could not start; nothing was sent")
+            return 1
+        print(f"✓ Uploaded {totals['segments']} segments across {totals['chapters']} chapters")
+        print(f"✓ Journal saved to {journal_file}")
+        if totals["failed"] or totals["failed_files"]:
+            print(f"❌ {totals['failed']} segments and {totals['failed_files']} files failed; "
+                  f"re-run with --resume to send only those")
+            return 1
         return 0
     
     def cmd_fetch(self, args):
@@ -153,24 +324,377 @@ class ManuscriptCLI:
         output_dir = Path(args.output) if args.output else Path(self.config["default_output_dir"])
         output_dir.mkdir(parents=True, exist_ok=True)
         
-        print(f"✓ Fetching to {output_dir}")
-        print("⚠️  Fetch functionality requires fetch_airtable_data.py to be refactored")
+        if args.incremental and args.format == 'ndjson':
+            print("❌ Error: --incremental merges into JSON files and cannot be combined with --format ndjson")
+            return 1
+        extension = ".json" if args.format == 'json' else ".ndjson.gz" if args.gzip else ".ndjson"
+        chapters_file = output_dir / f"airtable_chapters_data{extension}"
+        segments_file = output_dir / f"airtable_segments_data{extension}"
+        state_file = output_dir / fetch_airtable_data.FETCH_STATE_FILENAME if args.incremental else None
+        print(f"✓ {'Incrementally fetching' if args.incremental else 'Fetching'} to {output_dir}")
+        tables = (self.config.get("chapters_table", "Chapters"), self.config.get("segments_table", "Text Segments"))
+        projection = fetch_airtable_data.consumer_fields(args.fields_for, *tables)
+        counts = fetch_airtable_data.fetch_tables(
+            chapters_file, segments_file, self.config["airtable_api_key"], self.config["airtable_base_id"],
+            *tables, api_url=self.airtable_api_url(args), state_file=state_file and str(state_file),
+            last_modified_field=self.config.get("last_modified_field", fetch_airtable_data.LAST_MODIFIED_FIELD),
+            fields=projection,
+            max_in_flight=args.max_in_flight, resume=args.resume)
+        if counts is None:
+            return 1
+        print(f"✓ Fetched {counts[0]} chapters and {counts[1]} segments")
+        if not args.no_db and manuscript_db is not None:
+            db_path = self.database_path(args)
+            conn = manuscript_db.connect(db_path)
+            try:
+                # A projected fetch only updates its fields; the mirror keeps everything else
+                manuscript_db.import_airtable_files(conn, chapters_file, segments_file,
+                                                    segment_fields=projection and projection[tables[1]])
+            finally:
+                conn.close()
+            print(f"✓ {'Merged ' + args.fields_for + ' fields into' if projection else 'Mirrored to'} {db_path}")
         return 0
     
+    def fetched_data_files(self, args):
+        """Chapters and segments files written by manuscript fetch, from --data-dir or the output directory."""
+        data_dir = Path(getattr(args, "data_dir", None) or self.config["default_output_dir"])
+        for extension in (".json", ".ndjson", ".ndjson.gz"):
+            chapters_file = data_dir / f"airtable_chapters_data{extension}"
+            if chapters_file.exists():
+                return chapters_file, data_dir / f"airtable_segments_data{extension}"
+        return data_dir / "airtable_chapters_data.json", data_dir / "airtable_segments_data.json"
+    
+    def manuscript_index(self, args):
+        """Loads the chapter index from the SQLite mirror (--from-db) or the fetched files; None on error."""
+        if args.from_db:
+            db_path = self.database_path(args)
+            if not db_path.exists():
+                print(f"❌ Error: No database at {db_path}")
+                return None
+            conn = manuscript_db.connect(db_path)
+            try:
+                return chapter_assembler.ManuscriptIndex.from_db(conn)
+            finally:
+                conn.close()
+        chapters_file, segments_file = self.fetched_data_files(args)
+        try:
+            return chapter_assembler.ManuscriptIndex.from_files(chapters_file, segments_file)
+        except (FileNotFoundError, json.JSONDecodeError) as e:
+            print(f"❌ Error: Could not load fetched data ({e}). Run: manuscript fetch")
+            return None
+    
+    def export_database(self, args):
+        """Opens the SQLite mirror to stream an export from; None on error.
+
+        Unless --from-db is given, fetched data files newer than the mirror
+        (or without one) are first imported into it, streamed in batches.
+        """
+        db_path = self.database_path(args)
+        files = None if args.from_db else self.fetched_data_files(args)
+        if files and files[0].exists() and files[1].exists():
+            db_files = [db_path, Path(f"{db_path}-wal")]
+            mirrored = max((p.stat().st_mtime for p in db_files if p.exists()), default=None)
+            if mirrored is not None and max(p.stat().st_mtime for p in files) <= mirrored:
+                files = None
+        elif not db_path.exists():
+            print(f"❌ Error: No database at {db_path} and no fetched data. Run: manuscript fetch")
+            return None
+        else:
+            files = None
+        db_path.parent.mkdir(parents=True, exist_ok=True)
+        conn = manuscript_db.connect(db_path)
+        if files:
+            try:
+                chapters, segments = manuscript_db.import_airtable_files(conn, *files)
+            except (OSError, json.JSONDecodeError) as e:
+                conn.close()
+                print(f"❌ Error: Could not load fetched data ({e}). Run: manuscript fetch")
+                return None
+            print(f"✓ Mirrored {chapters} chapters and {segments} segments from {files[0].parent} to {db_path}")
+        return conn
+    
+    def chapter_cache(self, args):
+        """Rendered-chapter cache (config "chapter_cache_dir" / "chapter_cache_mb"), or None with --no-cache."""
+        if getattr(args, "no_cache", False):
+            return None
+        directory = self.config.get("chapter_cache_dir") or \
+                    Path(self.config["default_output_dir"]) / chapter_assembler.DEFAULT_CACHE_DIRNAME
+        max_bytes = int(self.config.get("chapter_cache_mb", 0) * 1024 * 1024) or chapter_assembler.DEFAULT_CACHE_BYTES
+        return chapter_assembler.ChapterCache(directory, max_bytes)
+    
+    def report_cache(self, cache):
+        if cache is not None:
+            cache.save()
+            print(f"✓ Chapter cache: {cache.hits} unchanged, {cache.misses} rendered")
+    
     def cmd_assemble(self, args):
-        """Assemble chapter from segments."""
-        print(f"📖 Assembling chapter {args.chapter_id}...")
+        """Assemble chapters from segments."""
+        if not args.chapter_ids and not args.all:
+            print("❌ Error: Give one or more chapter IDs, or --all")
+            return 1
+        print(f"📖 Assembling {'all chapters' if args.all else ', '.join(args.chapter_ids)}...")
+        
+        index = self.manuscript_index(args)
+        if index is None:
+            return 1
+        
+        chapter_ids = None if args.all else args.chapter_ids
+        single_file = args.output and chapter_ids and len(chapter_ids) == 1
+        output_dir = Path(args.output if args.output and not single_file else self.config["default_output_dir"])
+        output_dir.mkdir(parents=True, exist_ok=True)
+        
+        cache = self.chapter_cache(args)
+        assembled = 0
+        missing = []
+        for chapter_id in chapter_ids or index.chapter_ids():
+            text, num_segments = index.render(chapter_id, cache)
+            if text is None:
+                missing.append(chapter_id)
+                continue
+            output_file = Path(args.output) if single_file else output_dir / f"{chapter_id}_current_text.md"
+            output_file.parent.mkdir(parents=True, exist_ok=True)
+            with open(output_file, 'w', encoding='utf-8') as f:
+                f.write(text)
+            print(f"  {chapter_id:<10} {num_segments:>6} segments -> {output_file}")
+            assembled += 1
+        
+        self.report_cache(cache)
+        if missing:
+            print(f"❌ Chapters not found: {', '.join(missing)}")
+        print(f"✓ Assembled {assembled} chapter(s)")
+        return 1 if missing else 0
+    
+    def cmd_export(self, args):
+        """Export the whole manuscript to one Markdown or plain-text file."""
+        text_format = args.format or ('txt' if args.output and args.output.endswith('.txt') else 'md')
+        output_file = Path(args.output) if args.output else \
+                     Path(self.config["default_output_dir"]) / f"manuscript.{text_format}"
+        print(f"📚 Exporting manuscript to {output_file}...")
+        
+        if args.from_db and args.from_files:
+            print("❌ Error: --from-db and --from-files cannot be combined")
+            return 1
+        cache = self.chapter_cache(args)
+        conn = None
+        if args.from_files or manuscript_db is None:
+            # Indexes the whole book in memory
+            index = self.manuscript_index(args)
+            if index is None:
+                return 1
+            chapters = index.iter_chapters()
+        else:
+            conn = self.export_database(args)
+            if conn is None:
+                return 1
+            chapters = chapter_assembler.iter_db_chapters(conn, content_hashes=cache is not None)
+        
+        output_file.parent.mkdir(parents=True, exist_ok=True)
+        started = time.perf_counter()
+        try:
+            with open(output_file, 'w', encoding='utf-8', buffering=1024 * 1024) as f:
+                num_chapters, num_segments, words = chapter_assembler.export_manuscript(
+                    chapters, f, text_format, args.front_matter, args.title, cache)
+        finally:
+            if conn is not None:
+                conn.close()
         
-        # This would call chapter_assembler functionality
-        print("⚠️  Assemble functionality requires chapter_assembler.py to be refactored")
+        self.report_cache(cache)
+        print(f"✓ Exported {num_chapters} chapters, {num_segments} segments, {words} words "
+              f"in {time.perf_counter() - started:.2f}s")
+        print(f"✓ Saved to {output_file}")
+        return 0
+    
+    def cmd_cache(self, args):
+        """Show or invalidate the rendered-chapter cache."""
+        cache = self.chapter_cache(args)
+        if args.action == 'invalidate':
+            removed = cache.invalidate(set(args.chapter_ids) if args.chapter_ids else None)
+            cache.save()
+            print(f"✓ Invalidated {removed} cached chapter render(s)"
+                  f"{' for ' + ', '.join(args.chapter_ids) if args.chapter_ids else ''}")
+            return 0
+        chapters = {entry.get("Chapter") for entry in cache.entries.values()}
+        print(f"Chapter cache: {cache.directory}")
+        print(f"  {len(cache.entries)} render(s) of {len(chapters)} chapter(s), "
+              f"{cache.size() / 1024 / 1024:.1f} of {cache.max_bytes / 1024 / 1024:.0f} MB")
         return 0
     
+    def staging_files(self, args):
+        """(staging directory, [(chapter_id, path)]) for --staging-dir, config staging_dir or the output directory.
+
+        Prints an error and returns no files if there are none.
+        """
+        staging_dir = Path(args.staging_dir or self.config.get("staging_dir") or self.config["default_output_dir"])
+        if not staging_dir.is_dir():
+            print(f"❌ Error: Directory not found: {staging_dir}")
+            return staging_dir, []
+        files = corpus_scanner.staging_files(staging_dir, corpus_scanner.SEGMENT_FILE_SUFFIXES)
+        if not files:
+            print(f"❌ Error: No segment files in {staging_dir}")
+        return staging_dir, files
+    
     def cmd_analytics(self, args):
-        """Generate analytics from Airtable data."""
-        print(f"📊 Generating analytics...")
+        """Generate the summary analytics and multi-select option reports in one pass over the segment files."""
+        staging_dir, files = self.staging_files(args)
+        if not files:
+            return 1
+        workers = args.jobs or os.cpu_count()
+        print(f"📊 Generating analytics from {len(files)} chapter file(s) in {staging_dir} "
+              f"with {workers} worker(s)...")
+        
+        summary = generate_analytics_script.SummaryAnalytics()
+        options = extract_options_script.MultiselectOptions()
+        chapter_stats = corpus_scanner.ChapterStats()
+        aggregators = [summary, options, chapter_stats]
+        if args.pacing:
+            pacing = pacing_analysis.PacingSeries()
+            aggregators.append(pacing)
+        started = time.perf_counter()
+        read, decoded = corpus_scanner.scan_corpus(files, aggregators, incremental=not args.no_cache, workers=workers)
+        elapsed = time.perf_counter() - started
+        
+        output_file = Path(args.output) if args.output else staging_dir / "airtable_summary_analytics.md"
+        output_file.parent.mkdir(parents=True, exist_ok=True)
+        if output_file.suffix == '.json':
+            report = {
+                "Chapters": {chapter_id: {"Segments": count, "Words": chapter_stats.words[chapter_id]}
+                             for chapter_id, count in sorted(chapter_stats.segments.items())},
+                "Tags": {field: dict(counter.most_common()) for field, counter in summary.tags.counts.items()},
+                "Options": {field: sorted(values) for field, values in options.options.items()},
+            }
+            with open(output_file, 'w', encoding='utf-8') as f:
+                json.dump(report, f, indent=2, ensure_ascii=False)
+        else:
+            with open(output_file, 'w', encoding='utf-8') as f:
+                f.write(summary.report())
+            options_file = output_file.parent / "required_airtable_multiselect_options.md"
+            with open(options_file, 'w', encoding='utf-8') as f:
+                f.write(options.report())
+            print(f"✓ Saved multi-select options to {options_file}")
+        if args.pacing:
+            pacing_dir = output_file.parent / "pacing"
+            pacing_analysis.write_series(pacing, pacing_dir)
+            print(f"✓ Saved pacing series of {len(pacing.chapters)} chapter(s) to {pacing_dir}")
         
-        # This would call generate_analytics_script functionality
-        print("⚠️  Analytics functionality requires generate_analytics_script.py to be refactored")
+        print(f"✓ Scanned {read} file(s) ({decoded} changed), {chapter_stats.total_segments()} segments, "
+              f"{sum(chapter_stats.words.values())} words in {elapsed:.2f}s")
+        print(f"✓ Saved to {output_file}")
+        return 0 if read == len(files) else 1
+    
+    def cmd_pacing(self, args):
+        """Per-segment pacing series (words, dialogue, modes, tags with rolling and cumulative stats) per chapter."""
+        if args.window < 1:
+            print("❌ Error: --window must be at least 1")
+            return 1
+        staging_dir, files = self.staging_files(args)
+        if not files:
+            return 1
+        output_dir = Path(args.output) if args.output else staging_dir / "pacing"
+        print(f"📈 Computing pacing series for {len(files)} chapter file(s) in {staging_dir}...")
+        
+        pacing = pacing_analysis.PacingSeries()
+        started = time.perf_counter()
+        read, decoded = corpus_scanner.scan_corpus(files, [pacing], incremental=not args.no_cache,
+                                                   workers=args.jobs or os.cpu_count())
+        paths = pacing_analysis.write_series(pacing, output_dir, args.format, args.window, args.book)
+        segments = sum(len(rows) for rows in pacing.chapters.values())
+        print(f"✓ {len(pacing.chapters)} chapter series, {segments} segments "
+              f"({decoded} file(s) re-read) in {time.perf_counter() - started:.2f}s")
+        print(f"✓ Saved {len(paths)} file(s) to {output_dir}")
+        return 0 if read == len(files) else 1
+    
+    def cmd_tags(self, args):
+        """Tag counts, distributions and co-occurrence from the segment x tag matrix."""
+        needs_tag = args.what in ('cooccur', 'segments')
+        tag = None
+        if needs_tag:
+            if not args.values or ':' not in args.values[0]:
+                print(f"❌ Error: tags {args.what} needs a tag as Field:Value (e.g. DialogueTone:Tense)")
+                return 1
+            tag = tuple(args.values[0].split(':', 1))
+        if args.what in ('chapters', 'cooccurrence') and not args.values:
+            print(f"❌ Error: tags {args.what} needs a field (e.g. MysteryTags)")
+            return 1
+        staging_dir, files = self.staging_files(args)
+        if not files:
+            return 1
+        
+        started = time.perf_counter()
+        cache_path = None if args.rebuild else staging_dir / tag_matrix.MATRIX_CACHE_FILENAME
+        matrix, cached = tag_matrix.load_matrix(files, cache_path, workers=args.jobs or os.cpu_count())
+        if args.rebuild:
+            matrix.save(staging_dir / tag_matrix.MATRIX_CACHE_FILENAME, tag_matrix.corpus_key(files))
+        print(f"✓ {len(matrix)} segments x {len(matrix.labels)} tags "
+              f"({'cached' if cached else 'scanned'}, {time.perf_counter() - started:.2f}s)", file=sys.stderr)
+        
+        field = args.values[0] if args.values and not needs_tag else None
+        if args.what == 'counts':
+            result = [[f"{name}:{value}", count] for (name, value), count in matrix.counts(field)]
+        elif args.what == 'distribution':
+            result = [[f"{name}:{value}", round(share, 4)] for (name, value), share in matrix.distribution(field)]
+        elif args.what == 'cooccur':
+            result = [[f"{name}:{value}", count] for (name, value), count in matrix.cooccurring(*tag, within=args.within)]
+        elif args.what == 'segments':
+            result = [[chapter_id, position] for chapter_id, position in matrix.segments(*tag)]
+        elif args.what == 'chapters':
+            chapter_ids, labels, rows = matrix.chapter_histogram(field, normalize=args.normalize)
+            values = [value for _, value in labels]
+            if args.json:
+                print(json.dumps({chapter_id: dict(zip(values, row)) for chapter_id, row in zip(chapter_ids, rows)},
+                                 indent=2, ensure_ascii=False))
+                return 0
+            print("  " + f"{'Chapter':<10}" + "".join(f"{value[:12]:>13}" for value in values))
+            for chapter_id, row in zip(chapter_ids, rows):
+                cells = "".join(f"{count:>13.3f}" if args.normalize else f"{count:>13}" for count in row)
+                print(f"  {chapter_id:<10}{cells}")
+            return 0
+        else:
+            labels_a, labels_b, rows = matrix.cooccurrence(args.values[0], args.values[1] if len(args.values) > 1 else None)
+            result = [[f"{a[0]}:{a[1]}", f"{b[0]}:{b[1]}", count]
+                      for a, row in zip(labels_a, rows) for b, count in zip(labels_b, row) if count and a != b]
+            result.sort(key=lambda item: -item[2])
+        
+        if args.json:
+            print(json.dumps(result, indent=2, ensure_ascii=False))
+            return 0
+        for item in result[:args.limit] if args.limit else result:
+            print("  " + "  ".join(f"{value:<40}" if isinstance(value, str) else f"{value:>8}" for value in item))
+        print(f"✓ {len(result)} result(s)")
+        return 0
+    
+    def cmd_query(self, args):
+        """Query the local SQLite mirror."""
+        db_path = self.database_path(args)
+        if not db_path.exists():
+            print(f"❌ Error: No database at {db_path}. Run segment or fetch first.")
+            return 1
+        if args.what != 'chapters' and not args.value:
+            print(f"❌ Error: query {args.what} needs a value")
+            return 1
+        
+        conn = manuscript_db.connect(db_path)
+        try:
+            if args.what == 'chapters':
+                rows = manuscript_db.chapters(conn)
+            elif args.what == 'chapter':
+                rows = manuscript_db.chapter_segments(conn, args.value)
+            elif args.what == 'tag':
+                rows = manuscript_db.segments_with_tag(conn, args.value, args.field)
+            else:
+                rows = manuscript_db.segments_with_character(conn, args.value)
+        finally:
+            conn.close()
+        
+        if args.json:
+            print(json.dumps([dict(row) for row in rows], indent=2, ensure_ascii=False))
+            return 0
+        for row in rows:
+            if args.what == 'chapters':
+                print(f"  {row['chapter_id']:<10} {row['title'] or '':<40} {row['word_count'] or 0:>8} words")
+            else:
+                text = (row['text'] or '').replace('\n', ' ')
+                print(f"  {row['segment_id']:<20} {text[:70]}")
+        print(f"✓ {len(rows)} result(s)")
         return 0
     
     def cmd_status(self, args):
@@ -190,6 +714,19 @@ class ManuscriptCLI:
                 print(f"  - {f.name}")
             if len(json_files) > 5:
                 print(f"  ... and {len(json_files) - 5} more")
+        
+        if manuscript_db is None:
+            return 0
+        db_path = self.database_path(args)
+        if db_path.exists():
+            conn = manuscript_db.connect(db_path)
+            try:
+                db_counts = manuscript_db.counts(conn)
+            finally:
+                conn.close()
+            print(f"\nDatabase: {db_path}")
+            print(f"  {db_counts['chapters']} chapters, {db_counts['segments']} segments, "
+                  f"{db_counts['segment_tags']} tags, {db_counts['segment_characters']} character mentions")
         return 0
 
 
@@ -206,11 +743,21 @@ Examples:
   # Segment a chapter
   manuscript segment chapter01.txt CH001
   
+  # Segment a whole directory of chapters in parallel
+  manuscript segment-all chapters/
+  
+  # Look up segments in the local database
+  manuscript query chapter CH042
+  manuscript query tag RedHerring
+  
   # Check project status
   manuscript status
         """
     )
     
+    parser.add_argument('--api-url', help='Airtable API base URL, e.g. a local mock_airtable_server.py '
+                                          '(default: config airtable_api_url or $AIRTABLE_API_URL)')
+    
     subparsers = parser.add_subparsers(dest='command', help='Available commands')
     
     # Init command
@@ -218,29 +765,149 @@ Examples:
     init_parser.add_argument('--airtable-key', help='Airtable API key')
     init_parser.add_argument('--airtable-base', help='Airtable base ID')
     init_parser.add_argument('--output-dir', help='Default output directory')
+    init_parser.add_argument('--airtable-url', help='Airtable API base URL (for a local mock server)')
     
     # Segment command
     segment_parser = subparsers.add_parser('segment', help='Segment a chapter')
     segment_parser.add_argument('input', help='Input chapter file')
     segment_parser.add_argument('chapter_id', help='Chapter ID (e.g., CH001)')
     segment_parser.add_argument('-o', '--output', help='Output JSON file')
+    segment_parser.add_argument('--stream', action='store_true',
+                                help='Stream segments to an NDJSON file without loading the whole chapter')
+    segment_parser.add_argument('--compact', action='store_true',
+                                help='Omit empty fields and indentation from the output')
+    segment_parser.add_argument('--incremental', action='store_true',
+                                help='Only re-tag new or edited paragraphs and keep SegmentIDs stable')
+    segment_parser.add_argument('--db', help='SQLite mirror to update (default: manuscript.db in the output directory)')
+    segment_parser.add_argument('--no-db', action='store_true', help='Do not update the SQLite mirror')
+    
+    # Segment-all command
+    segment_all_parser = subparsers.add_parser('segment-all', help='Segment many chapters in parallel')
+    segment_all_parser.add_argument('inputs', nargs='+',
+                                    help='Chapter files, directories or glob patterns (e.g. "chapters/*.txt")')
+    segment_all_parser.add_argument('-o', '--output', help='Output directory')
+    segment_all_parser.add_argument('-j', '--jobs', type=int,
+                                    help='Worker processes (default: all CPU cores)')
+    segment_all_parser.add_argument('--compact', action='store_true',
+                                    help='Omit empty fields and indentation from the output')
+    segment_all_parser.add_argument('--db', help='SQLite mirror to update (default: manuscript.db in the output directory)')
+    segment_all_parser.add_argument('--no-db', action='store_true', help='Do not update the SQLite mirror')
     
     # Upload command
     upload_parser = subparsers.add_parser('upload', help='Upload segments to Airtable')
-    upload_parser.add_argument('input', help='Input JSON file with segments')
+    upload_parser.add_argument('input', help='Input JSON file with segments, or a staging directory')
+    upload_parser.add_argument('--max-in-flight', type=int, default=4,
+                               help='Maximum concurrent API requests (default: 4)')
+    upload_parser.add_argument('--max-chapters', type=int, default=4,
+                               help='Maximum chapters uploaded concurrently (default: 4)')
+    upload_parser.add_argument('--sync', action='store_true',
+                               help='Only send new, changed and deleted segments since the last sync')
+    upload_parser.add_argument('--state-file', help='Sync state file (default: next to the input)')
+    upload_parser.add_argument('--max-retries', type=int, default=5,
+                               help='Retries per request on rate-limit and server errors (default: 5)')
+    upload_parser.add_argument('--journal', help='Upload journal file (default: next to the input)')
+    upload_parser.add_argument('--resume', action='store_true',
+                               help='Resume the journaled upload, sending only batches that did not complete')
     
     # Fetch command
     fetch_parser = subparsers.add_parser('fetch', help='Fetch data from Airtable')
     fetch_parser.add_argument('-o', '--output', help='Output directory')
+    fetch_parser.add_argument('--incremental', action='store_true',
+                              help='Only download records modified since the last fetch and merge them into the local files')
+    fetch_parser.add_argument('--fields-for', choices=['assembler'],
+                              help='Only download the fields this consumer reads (e.g. assembler)')
+    fetch_parser.add_argument('--max-in-flight', type=int, default=4,
+                              help='Maximum concurrent API requests (default: 4)')
+    fetch_parser.add_argument('--format', choices=['json', 'ndjson'], default='json',
+                              help='json writes one array per table; ndjson streams each page to disk as it arrives')
+    fetch_parser.add_argument('--gzip', action='store_true', help='Gzip-compress NDJSON output')
+    fetch_parser.add_argument('--resume', action='store_true',
+                              help='Continue an interrupted NDJSON fetch from its last completed page')
+    fetch_parser.add_argument('--db', help='SQLite mirror to update (default: manuscript.db in the output directory)')
+    fetch_parser.add_argument('--no-db', action='store_true', help='Do not update the SQLite mirror')
     
     # Assemble command
-    assemble_parser = subparsers.add_parser('assemble', help='Assemble chapter from segments')
-    assemble_parser.add_argument('chapter_id', help='Chapter ID to assemble')
-    assemble_parser.add_argument('-o', '--output', help='Output file')
+    assemble_parser = subparsers.add_parser('assemble', help='Assemble chapters from segments')
+    assemble_parser.add_argument('chapter_ids', nargs='*', metavar='chapter_id', help='Chapter IDs to assemble')
+    assemble_parser.add_argument('--all', action='store_true', help='Assemble every chapter')
+    assemble_parser.add_argument('-o', '--output',
+                                 help='Output file for a single chapter, otherwise an output directory')
+    assemble_parser.add_argument('--data-dir', help='Directory with the fetched data (default: output directory)')
+    assemble_parser.add_argument('--from-db', action='store_true', help='Read segments from the SQLite mirror')
+    assemble_parser.add_argument('--db', help='SQLite mirror (default: manuscript.db in the output directory)')
+    assemble_parser.add_argument('--no-cache', action='store_true', help='Re-render every chapter, bypassing the cache')
+    
+    # Export command
+    export_parser = subparsers.add_parser('export', help='Export the whole manuscript in Chapter Number order')
+    export_parser.add_argument('-o', '--output', help='Output file (default: manuscript.md in the output directory)')
+    export_parser.add_argument('--format', choices=['md', 'txt'], help='Markdown or plain text (default: from the file extension)')
+    export_parser.add_argument('--front-matter', action='store_true',
+                               help='Add word and segment counts under each chapter heading')
+    export_parser.add_argument('--title', help='Book title heading')
+    export_parser.add_argument('--data-dir', help='Directory with the fetched data (default: output directory)')
+    export_parser.add_argument('--from-db', action='store_true',
+                               help='Stream from the SQLite mirror as is, without importing newer fetched data')
+    export_parser.add_argument('--from-files', action='store_true',
+                               help='Index the fetched data files in memory instead of streaming from the mirror')
+    export_parser.add_argument('--db', help='SQLite mirror (default: manuscript.db in the output directory)')
+    export_parser.add_argument('--no-cache', action='store_true', help='Re-render every chapter, bypassing the cache')
+    
+    # Cache command
+    cache_parser = subparsers.add_parser('cache', help='Show or invalidate the rendered-chapter cache')
+    cache_parser.add_argument('action', choices=['stats', 'invalidate'], nargs='?', default='stats',
+                              help='Show cache size (default), or drop cached renders')
+    cache_parser.add_argument('chapter_ids', nargs='*', metavar='chapter_id',
+                              help='Chapters to invalidate (default: all)')
     
     # Analytics command
     analytics_parser = subparsers.add_parser('analytics', help='Generate analytics')
-    analytics_parser.add_argument('-o', '--output', help='Output file')
+    analytics_parser.add_argument('-o', '--output',
+                                  help='Report file; .json for machine-readable output (default: in the staging directory)')
+    analytics_parser.add_argument('--staging-dir',
+                                  help='Directory with segment files (default: config staging_dir, then output directory)')
+    analytics_parser.add_argument('-j', '--jobs', type=int,
+                                  help='Worker processes (default: one per CPU; 1 scans in this process)')
+    analytics_parser.add_argument('--pacing', action='store_true',
+                                  help='Also write per-chapter pacing series (CSV) from the same scan')
+    analytics_parser.add_argument('--no-cache', action='store_true',
+                                  help='Re-read every file instead of reusing per-chapter aggregates of unchanged files')
+    
+    # Pacing command
+    pacing_parser = subparsers.add_parser('pacing', help='Pacing time-series over segment order')
+    pacing_parser.add_argument('-o', '--output', help='Output directory (default: pacing/ in the staging directory)')
+    pacing_parser.add_argument('--format', choices=['csv', 'json'], default='csv',
+                               help='One CSV per chapter, or a single pacing.json')
+    pacing_parser.add_argument('--window', type=int, default=5, help='Rolling window in segments (default: 5)')
+    pacing_parser.add_argument('--book', action='store_true', help='Also write one series across the whole book')
+    pacing_parser.add_argument('--staging-dir',
+                               help='Directory with segment files (default: config staging_dir, then output directory)')
+    pacing_parser.add_argument('-j', '--jobs', type=int, help='Worker processes (default: one per CPU)')
+    pacing_parser.add_argument('--no-cache', action='store_true',
+                               help='Re-read every file instead of reusing per-chapter aggregates of unchanged files')
+    
+    # Tags command
+    tags_parser = subparsers.add_parser('tags', help='Tag distributions and co-occurrence from the segment x tag matrix')
+    tags_parser.add_argument('what', choices=['counts', 'distribution', 'cooccur', 'cooccurrence', 'chapters', 'segments'],
+                             help='counts/distribution [FIELD], cooccur FIELD:VALUE, cooccurrence FIELD [FIELD], '
+                                  'chapters FIELD (per-chapter histogram), segments FIELD:VALUE')
+    tags_parser.add_argument('values', nargs='*', help='Field or Field:Value arguments')
+    tags_parser.add_argument('--within', help='For cooccur: only tags of this field (e.g. MysteryTags)')
+    tags_parser.add_argument('--normalize', action='store_true', help='For chapters: shares instead of counts')
+    tags_parser.add_argument('--limit', type=int, default=25, help='Rows to print (0 for all; default: 25)')
+    tags_parser.add_argument('--staging-dir',
+                             help='Directory with segment files (default: config staging_dir, then output directory)')
+    tags_parser.add_argument('-j', '--jobs', type=int, help='Worker processes when the matrix has to be rebuilt')
+    tags_parser.add_argument('--rebuild', action='store_true', help='Rescan instead of using the cached matrix')
+    tags_parser.add_argument('--json', action='store_true', help='Print results as JSON')
+    
+    # Query command
+    query_parser = subparsers.add_parser('query', help='Query the local SQLite mirror')
+    query_parser.add_argument('what', choices=['chapters', 'chapter', 'tag', 'character'],
+                              help='chapters, segments of a chapter, segments with a tag, or with a character')
+    query_parser.add_argument('value', nargs='?', help='Chapter ID, tag or character name')
+    query_parser.add_argument('--field', help='Restrict a tag query to one multi-select field (e.g. MysteryTags)')
+    query_parser.add_argument('--db', help='SQLite mirror (default: manuscript.db in the output directory)')
+    query_parser.add_argument('--json', action='store_true', help='Print results as JSON')
     
     # Status command
     status_parser = subparsers.add_parser('status', help='Show project status')
@@ -257,10 +924,16 @@ Examples:
     command_map = {
         'init': cli.cmd_init,
         'segment': cli.cmd_segment,
+        'segment-all': cli.cmd_segment_all,
         'upload': cli.cmd_upload,
         'fetch': cli.cmd_fetch,
         'assemble': cli.cmd_assemble,
+        'export': cli.cmd_export,
+        'cache': cli.cmd_cache,
         'analytics': cli.cmd_analytics,
+        'pacing': cli.cmd_pacing,
+        'tags': cli.cmd_tags,
+        'query': cli.cmd_query,
         'status': cli.cmd_status,
     }
     
@@ -0,0 +1,348 @@
+#!/usr/bin/env python3
+"""
+Local SQLite mirror of the Chapters and Text Segments tables.
+
+Segments from the segmenter (SegmentID, CharactersInSegment, ...) and records
+fetched from Airtable ("Segment ID", "Chapter Link", ...) are normalized into
+the same tables, with multi-select tags and characters in indexed join
+tables. Lookups such as "segments of CH042 in order" or "all RedHerring
+segments" are then index reads instead of a full JSON parse:
+
+    conn = connect("output/manuscript.db")
+    import_segment_file(conn, "output/CH042_segments.json")
+    chapter_segments(conn, "CH042")
+    segments_with_tag(conn, "RedHerring")
+"""
+import json
+import sqlite3
+from itertools import chain
+
+from json_stream import NDJSON_SUFFIXES, iter_records, load_header
+from segment_model import compact_segment
+
+DEFAULT_DB_FILENAME = "manuscript.db"
+
+# Multi-select fields, named the same in segmenter output and in Airtable
+TAG_FIELDS = ["SecondaryNarrativeModes", "DialogueTone", "PlotFunctionTags", "MysteryTags", "CharacterArcTags",
+              "WorldBuildingTags", "StructuralOntologyTags", "AuthorialIntentTags"]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS chapters (
+    chapter_id TEXT PRIMARY KEY,
+    record_id TEXT,
+    chapter_number INTEGER,
+    title TEXT,
+    status TEXT,
+    word_count INTEGER
+);
+CREATE TABLE IF NOT EXISTS segments (
+    segment_id TEXT PRIMARY KEY,
+    record_id TEXT,
+    chapter_id TEXT,
+    segment_order INTEGER,
+    text TEXT,
+    narrative_mode TEXT,
+    dialogue_speaker TEXT,
+    location TEXT,
+    time_reference TEXT,
+    data TEXT
+);
+CREATE TABLE IF NOT EXISTS segment_tags (
+    segment_id TEXT NOT NULL,
+    field TEXT NOT NULL,
+    tag TEXT NOT NULL,
+    PRIMARY KEY (segment_id, field, tag)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS segment_characters (
+    segment_id TEXT NOT NULL,
+    character TEXT NOT NULL,
+    PRIMARY KEY (segment_id, character)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_chapters_record ON chapters (record_id);
+CREATE INDEX IF NOT EXISTS idx_segments_chapter_order ON segments (chapter_id, segment_order);
+CREATE INDEX IF NOT EXISTS idx_segment_tags_tag ON segment_tags (tag, field);
+CREATE INDEX IF NOT EXISTS idx_segment_characters_character ON segment_characters (character);
+"""
+
+SEGMENT_COLUMNS = ["segment_id", "record_id", "chapter_id", "segment_order", "text", "narrative_mode",
+                   "dialogue_speaker", "location", "time_reference"]
+
+# Text Segments fields stored in their own segments column
+RECORD_COLUMNS = {"Chapter Link": "chapter_id", "Segment Order": "segment_order", "Segment Text": "text",
+                  "Narrative Mode": "narrative_mode", "LocationInSegment": "location",
+                  "TimeReferenceInSegment": "time_reference"}
+
+
+def connect(path):
+    """Opens (creating if needed) the mirror database; rows come back as sqlite3.Row."""
+    conn = sqlite3.connect(str(path))
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def _chapter_number(chapter_id):
+    try:
+        return int(str(chapter_id).replace("CH", ""))
+    except ValueError:
+        return None
+
+
+def _replace_segments(conn, rows, tags, characters):
+    """Writes normalized segment rows and their join-table rows, replacing earlier versions."""
+    segment_ids = [(row[0],) for row in rows]
+    conn.executemany("DELETE FROM segment_tags WHERE segment_id = ?", segment_ids)
+    conn.executemany("DELETE FROM segment_characters WHERE segment_id = ?", segment_ids)
+    conn.executemany(f"INSERT OR REPLACE INTO segments ({', '.join(SEGMENT_COLUMNS)}, data) "
+                     f"VALUES ({', '.join('?' * (len(SEGMENT_COLUMNS) + 1))})", rows)
+    conn.executemany("INSERT OR IGNORE INTO segment_tags (segment_id, field, tag) VALUES (?, ?, ?)", tags)
+    conn.executemany("INSERT OR IGNORE INTO segment_characters (segment_id, character) VALUES (?, ?)", characters)
+
+
+def _upsert_chapter(conn, chapter_id, record_id=None, chapter_number=None, title=None, status=None,
+                    word_count=None):
+    # Values the source does not know (None) keep what is already stored
+    conn.execute(
+        "INSERT INTO chapters (chapter_id, record_id, chapter_number, title, status, word_count) "
+        "VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT (chapter_id) DO UPDATE SET "
+        "record_id = COALESCE(excluded.record_id, record_id), "
+        "chapter_number = COALESCE(excluded.chapter_number, chapter_number), "
+        "title = COALESCE(excluded.title, title), "
+        "status = COALESCE(excluded.status, status), "
+        "word_count = COALESCE(excluded.word_count, word_count)",
+        (chapter_id, record_id, chapter_number, title, status, word_count))
+
+
+def _delete_chapter_segments(conn, chapter_id, unfetched_only=False):
+    """Deletes a chapter's segments; with unfetched_only, only those missing from temp.fetched_segments."""
+    condition = "chapter_id = ?"
+    if unfetched_only:
+        condition += " AND segment_id NOT IN (SELECT segment_id FROM temp.fetched_segments)"
+    for table in ("segment_tags", "segment_characters"):
+        conn.execute(f"DELETE FROM {table} WHERE segment_id IN "
+                     f"(SELECT segment_id FROM segments WHERE {condition})", (chapter_id,))
+    conn.execute(f"DELETE FROM segments WHERE {condition}", (chapter_id,))
+
+
+def import_segments(conn, chapter_id, segments, batch_size=1000):
+    """Replaces a chapter's segments with segmenter output (full or compact dicts).
+
+    segments may be any iterable (e.g. a streamed NDJSON file); rows are
+    written in batches within one transaction.
+    """
+    rows, tags, characters = [], [], []
+    word_count = 0
+    segment_count = 0
+    with conn:
+        _delete_chapter_segments(conn, chapter_id)
+        for seg in segments:
+            segment_id = seg["SegmentID"]
+            text = seg.get("SegmentText", "")
+            word_count += len(text.split())
+            rows.append((segment_id, None, chapter_id, seg.get("SegmentOrder"), text,
+                         seg.get("PrimaryNarrativeMode", "Narration-Action"), seg.get("DialogueSpeaker"),
+                         seg.get("LocationInSegment"), seg.get("TimeReferenceInSegment"),
+                         json.dumps(compact_segment(seg), ensure_ascii=False)))
+            for field in TAG_FIELDS:
+                tags.extend((segment_id, field, tag) for tag in seg.get(field) or [])
+            characters.extend((segment_id, name) for name in seg.get("CharactersInSegment") or [])
+            segment_count += 1
+            if len(rows) >= batch_size:
+                _replace_segments(conn, rows, tags, characters)
+                rows.clear()
+                tags.clear()
+                characters.clear()
+        _replace_segments(conn, rows, tags, characters)
+        _upsert_chapter(conn, chapter_id, chapter_number=_chapter_number(chapter_id), word_count=word_count)
+    return segment_count
+
+
+def import_segment_file(conn, path, chapter_id=None):
+    """Imports a segmenter output file: a chapter JSON (full or compact) or a streamed NDJSON file."""
+    path = str(path)
+    if path.endswith(NDJSON_SUFFIXES):
+        segments = iter_records(path)
+        if chapter_id is None:
+            # Only the first segment is read ahead for its chapter ID
+            first = next(segments, None)
+            if first is not None:
+                chapter_id = first["SegmentID"].split("_SEG")[0]
+                segments = chain([first], segments)
+    else:
+        chapter_id = chapter_id or load_header(path).get("ChapterID")
+        segments = iter_records(path, key="Segments")
+    return import_segments(conn, chapter_id, segments)
+
+
+def _merge_segments(conn, records, segment_fields):
+    """Upserts (segment_id, record_id, chapter_id, fields) records, changing only the projected segment_fields.
+
+    Columns, data members, tags and characters of fields outside the
+    projection keep their stored values.
+    """
+    columns = [RECORD_COLUMNS[name] for name in segment_fields if name in RECORD_COLUMNS]
+    segment_ids = [record[0] for record in records]
+    stored = {}
+    for start in range(0, len(segment_ids), 500):
+        chunk = segment_ids[start:start + 500]
+        stored.update(conn.execute(f"SELECT segment_id, data FROM segments WHERE segment_id IN "
+                                   f"({', '.join('?' * len(chunk))})", chunk).fetchall())
+    rows, tags, characters = [], [], []
+    for segment_id, record_id, chapter_id, fields in records:
+        data = json.loads(stored.get(segment_id) or "{}")
+        for name in segment_fields:
+            # Airtable omits empty fields, so a projected field that is absent was cleared
+            if name in fields:
+                data[name] = fields[name]
+            else:
+                data.pop(name, None)
+        values = {column: fields.get(name) for name, column in RECORD_COLUMNS.items()}
+        values["chapter_id"] = chapter_id
+        rows.append((segment_id, record_id, *[values[column] for column in columns],
+                     json.dumps(data, ensure_ascii=False)))
+        for field in TAG_FIELDS:
+            if field in segment_fields:
+                tags.extend((segment_id, field, tag) for tag in fields.get(field) or [])
+        names = fields.get("CharactersInSegment") or []
+        characters.extend((segment_id, name) for name in names if isinstance(name, str))
+
+    conn.executemany(
+        f"INSERT INTO segments (segment_id, record_id, {''.join(c + ', ' for c in columns)}data) "
+        f"VALUES ({', '.join('?' * (len(columns) + 3))}) ON CONFLICT (segment_id) DO UPDATE SET "
+        f"record_id = excluded.record_id, {''.join(f'{c} = excluded.{c}, ' for c in columns)}data = excluded.data",
+        rows)
+    for field in TAG_FIELDS:
+        if field in segment_fields:
+            conn.executemany("DELETE FROM segment_tags WHERE segment_id = ? AND field = ?",
+                             [(segment_id, field) for segment_id in segment_ids])
+    conn.executemany("INSERT OR IGNORE INTO segment_tags (segment_id, field, tag) VALUES (?, ?, ?)", tags)
+    if "CharactersInSegment" in segment_fields:
+        conn.executemany("DELETE FROM segment_characters WHERE segment_id = ?", [(i,) for i in segment_ids])
+        conn.executemany("INSERT OR IGNORE INTO segment_characters (segment_id, character) VALUES (?, ?)", characters)
+
+
+def import_airtable_records(conn, chapter_records, segment_records, batch_size=1000, segment_fields=None):
+    """Mirrors fetched Chapters and Text Segments records; returns (chapters, segments).
+
+    Chapters are upserted by Chapter ID. Every chapter that has fetched
+    segments gets its segment set replaced, so segments deleted in Airtable
+    disappear locally too. segment_records may be any iterable (e.g. a
+    streamed NDJSON file); it is written in batches.
+
+    segment_fields names the fields of a projected fetch (see
+    fetch_airtable_data.CONSUMER_FIELDS). Only those are updated; the other
+    stored fields, tags and characters are kept, and segments missing from
+    the fetch are deleted from their chapter.
+    """
+    chapter_ids = {}
+    with conn:
+        for record in chapter_records:
+            fields = record.get("fields", {})
+            chapter_id = fields.get("Chapter ID")
+            if not chapter_id:
+                continue
+            chapter_ids[record["id"]] = chapter_id
+            _upsert_chapter(conn, chapter_id, record["id"], fields.get("Chapter Number"),
+                            fields.get("Chapter Title"), fields.get("Chapter Status"), fields.get("Word Count"))
+
+    replaced = set()
+    segment_count = 0
+    rows, tags, characters = [], [], []
+    merged = []
+    if segment_fields is not None:
+        conn.execute("CREATE TEMP TABLE IF NOT EXISTS fetched_segments (segment_id TEXT PRIMARY KEY)")
+        conn.execute("DELETE FROM temp.fetched_segments")
+
+    def flush():
+        with conn:
+            if segment_fields is not None:
+                replaced.update(record[2] for record in merged if record[2])
+                conn.executemany("INSERT OR IGNORE INTO temp.fetched_segments VALUES (?)",
+                                 [(record[0],) for record in merged])
+                _merge_segments(conn, merged, segment_fields)
+                merged.clear()
+                return
+            for chapter_id in {row[2] for row in rows} - replaced:
+                if chapter_id:
+                    _delete_chapter_segments(conn, chapter_id)
+                    replaced.add(chapter_id)
+            _replace_segments(conn, rows, tags, characters)
+        rows.clear()
+        tags.clear()
+        characters.clear()
+
+    for record in segment_records:
+        fields = record.get("fields", {})
+        segment_id = fields.get("Segment ID") or record["id"]
+        links = fields.get("Chapter Link") or []
+        chapter_id = chapter_ids.get(links[0]) if links else None
+        segment_count += 1
+        if segment_fields is not None:
+            merged.append((segment_id, record["id"], chapter_id, fields))
+            if len(merged) >= batch_size:
+                flush()
+            continue
+        rows.append((segment_id, record["id"], chapter_id, fields.get("Segment Order"), fields.get("Segment Text"),
+                     fields.get("Narrative Mode"), None, fields.get("LocationInSegment"),
+                     fields.get("TimeReferenceInSegment"), json.dumps(fields, ensure_ascii=False)))
+        for field in TAG_FIELDS:
+            tags.extend((segment_id, field, tag) for tag in fields.get(field) or [])
+        names = fields.get("CharactersInSegment") or []
+        characters.extend((segment_id, name) for name in names if isinstance(name, str))
+        if len(rows) >= batch_size:
+            flush()
+    flush()
+    if segment_fields is not None:
+        with conn:
+            for chapter_id in replaced:
+                _delete_chapter_segments(conn, chapter_id, unfetched_only=True)
+            conn.execute("DELETE FROM temp.fetched_segments")
+    return len(chapter_ids), segment_count
+
+
+def import_airtable_files(conn, chapters_file, segments_file, segment_fields=None):
+    """Mirrors fetched table files (JSON arrays or NDJSON, optionally gzipped); see import_airtable_records."""
+    return import_airtable_records(conn, iter_records(chapters_file), iter_records(segments_file),
+                                   segment_fields=segment_fields)
+
+
+# --- Queries ---
+
+def chapters(conn):
+    """All chapters in Chapter Number order."""
+    return conn.execute("SELECT * FROM chapters ORDER BY chapter_number IS NULL, chapter_number, chapter_id").fetchall()
+
+
+def chapter_segments(conn, chapter_id):
+    """A chapter's segments in Segment Order."""
+    return conn.execute(f"SELECT {', '.join(SEGMENT_COLUMNS)} FROM segments WHERE chapter_id = ? "
+                        f"ORDER BY segment_order", (chapter_id,)).fetchall()
+
+
+def segments_with_tag(conn, tag, field=None):
+    """Segments carrying a tag (optionally only in one multi-select field), in manuscript order."""
+    query = (f"SELECT DISTINCT {', '.join('s.' + c for c in SEGMENT_COLUMNS)} FROM segment_tags t "
+             f"JOIN segments s ON s.segment_id = t.segment_id "
+             f"LEFT JOIN chapters c ON c.chapter_id = s.chapter_id WHERE t.tag = ?")
+    params = [tag]
+    if field:
+        query += " AND t.field = ?"
+        params.append(field)
+    query += " ORDER BY c.chapter_number, s.chapter_id, s.segment_order"
+    return conn.execute(query, params).fetchall()
+
+
+def segments_with_character(conn, name):
+    """Segments a character appears in, in manuscript order."""
+    return conn.execute(
+        f"SELECT {', '.join('s.' + c for c in SEGMENT_COLUMNS)} FROM segment_characters sc "
+        f"JOIN segments s ON s.segment_id = sc.segment_id "
+        f"LEFT JOIN chapters c ON c.chapter_id = s.chapter_id WHERE sc.character = ? "
+        f"ORDER BY c.chapter_number, s.chapter_id, s.segment_order", (name,)).fetchall()
+
+
+def counts(conn):
+    return {table: conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+            for table in ("chapters", "segments", "segment_tags", "segment_characters")}
@@ -0,0 +1,355 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the Airtable REST endpoints this project uses.
+
+Serves /v0/<base>/<table> from memory:
+
+    GET     list records (pageSize, offset pagination, fields[], maxRecords,
+            filterByFormula for {Field}='value', IS_AFTER/IS_BEFORE/IS_SAME
+            on a date field, and NOT(...) of those)
+    POST    batch create (up to 10 records)
+    PATCH   batch update (up to 10 records; a null field clears it)
+    DELETE  batch delete (records[]=<id>, up to 10)
+
+Latency, a per-base rate limit (429 with Retry-After), random 5xx errors and
+writes that are applied but answered with a 504 (a lost response) can be
+configured to exercise the upload and fetch paths offline:
+
+    python mock_airtable_server.py --port 8787 --latency 0.05 --rate_limit 5
+    AIRTABLE_API_URL=http://127.0.0.1:8787/v0 manuscript upload staging/
+
+Every record carries a "Last Modified" field, stamped on create and update
+like a LAST_MODIFIED_TIME() formula field. Tables are created on first use.
+--data preloads a JSON file of {"<base>": {"<table>": [records]}}; on exit
+the store can be dumped with --dump.
+"""
+import argparse
+import itertools
+import json
+import random
+import re
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, unquote, urlsplit
+
+MAX_PAGE_SIZE = 100
+MAX_BATCH_SIZE = 10
+
+_STRING = r"""(?:'((?:[^'\\]|\\.)*)'|"((?:[^"\\]|\\.)*)")"""
+_MATCH_FORMULA = re.compile(r"^\{([^}]+)\}\s*=\s*" + _STRING + "$")
+_DATE_FORMULA = re.compile(r"^(IS_AFTER|IS_BEFORE|IS_SAME)\(\s*\{([^}]+)\}\s*,\s*" + _STRING + r"\s*\)$")
+_NOT_FORMULA = re.compile(r"^NOT\((.*)\)$", re.S)
+
+
+class MockError(Exception):
+    """An Airtable-style error response."""
+
+    def __init__(self, status, error_type, message, headers=None):
+        super().__init__(message)
+        self.status = status
+        self.error_type = error_type
+        self.headers = headers or {}
+
+
+def timestamp():
+    return datetime.now(timezone.utc).isoformat(timespec='milliseconds').replace('+00:00', 'Z')
+
+
+def _parse_time(value):
+    return datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+
+
+def _string_value(single, double):
+    return re.sub(r"\\(.)", r"\1", single if single is not None else double)
+
+
+def formula_predicate(formula):
+    """Returns a record -> bool function for the supported filterByFormula subset."""
+    formula = formula.strip()
+    match = _NOT_FORMULA.match(formula)
+    if match:
+        inner = formula_predicate(match.group(1))
+        return lambda record: not inner(record)
+    match = _MATCH_FORMULA.match(formula)
+    if match:
+        field, value = match.group(1), _string_value(*match.groups()[1:])
+        return lambda record: str(record["fields"].get(field, "")) == value
+    match = _DATE_FORMULA.match(formula)
+    if match:
+        function, field = match.group(1), match.group(2)
+        try:
+            moment = _parse_time(_string_value(*match.groups()[2:]))
+        except ValueError:
+            raise MockError(422, "INVALID_FILTER_BY_FORMULA", f"Invalid date in formula: {formula}")
+        compare = {"IS_AFTER": lambda t: t > moment, "IS_BEFORE": lambda t: t < moment,
+                   "IS_SAME": lambda t: t == moment}[function]
+        return lambda record: field in record["fields"] and compare(_parse_time(record["fields"][field]))
+    raise MockError(422, "INVALID_FILTER_BY_FORMULA", f"Unsupported formula: {formula}")
+
+
+class MockAirtable:
+    """In-memory bases with Airtable-like request semantics and fault injection."""
+
+    def __init__(self, latency=0.0, latency_jitter=0.0, rate_limit=None, retry_after=1,
+                 error_rate=0.0, seed=None, last_modified_field="Last Modified", lost_response_rate=0.0):
+        self.latency = latency
+        self.latency_jitter = latency_jitter
+        self.rate_limit = rate_limit
+        self.retry_after = retry_after
+        self.error_rate = error_rate
+        self.lost_response_rate = lost_response_rate
+        self.last_modified_field = last_modified_field
+        self.bases = {}
+        self.stats = {"requests": 0, "throttled": 0, "errors": 0, "lost": 0}
+        self._random = random.Random(seed)
+        self._ids = itertools.count(1)
+        self._recent = {}
+        self._lock = threading.Lock()
+
+    def table(self, base_id, table_name):
+        return self.bases.setdefault(base_id, {}).setdefault(table_name, {})
+
+    def load(self, data):
+        """Preloads {"<base>": {"<table>": [records]}}; records without an id get one."""
+        with self._lock:
+            for base_id, tables in data.items():
+                for table_name, records in tables.items():
+                    table = self.table(base_id, table_name)
+                    for record in records:
+                        record = self._new_record(record.get("fields", {}), record.get("id"),
+                                                  record.get("createdTime"))
+                        table[record["id"]] = record
+
+    def dump(self):
+        with self._lock:
+            return {base_id: {name: list(table.values()) for name, table in tables.items()}
+                    for base_id, tables in self.bases.items()}
+
+    def _new_record(self, fields, record_id=None, created_time=None):
+        record = {
+            "id": record_id or f"rec{next(self._ids):014d}",
+            "createdTime": created_time or timestamp(),
+            "fields": {name: value for name, value in fields.items() if value is not None},
+        }
+        if self.last_modified_field:
+            record["fields"].setdefault(self.last_modified_field, record["createdTime"])
+        return record
+
+    def _admit(self, base_id):
+        """Applies latency, the per-base rate limit and error injection to one request."""
+        delay = self.latency + (self._random.uniform(0, self.latency_jitter) if self.latency_jitter else 0)
+        if delay:
+            time.sleep(delay)
+        with self._lock:
+            self.stats["requests"] += 1
+            if self.rate_limit:
+                now = time.monotonic()
+                recent = self._recent.setdefault(base_id, deque())
+                while recent and now - recent[0] >= 1.0:
+                    recent.popleft()
+                if len(recent) >= self.rate_limit:
+                    self.stats["throttled"] += 1
+                    raise MockError(429, "RATE_LIMIT_REACHED",
+                                    "Rate limit exceeded. Please try again later",
+                                    {"Retry-After": str(self.retry_after)})
+                recent.append(now)
+            if self.error_rate and self._random.random() < self.error_rate:
+                self.stats["errors"] += 1
+                raise MockError(self._random.choice([500, 502, 503]), "SERVER_ERROR", "Injected server error")
+
+    def handle(self, method, base_id, table_name, params, body):
+        """Serves one request; returns the JSON response body or raises MockError."""
+        self._admit(base_id)
+        if method == "GET":
+            return self.list_records(base_id, table_name, params)
+        records = (body or {}).get("records")
+        if method == "DELETE":
+            records = [value for name, value in params if name in ("records[]", "records")]
+        if not isinstance(records, list) or not records:
+            raise MockError(422, "INVALID_REQUEST_MISSING_FIELDS", "Could not find field \"records\" in the request")
+        if len(records) > MAX_BATCH_SIZE:
+            raise MockError(422, "INVALID_RECORDS", f"A maximum of {MAX_BATCH_SIZE} records is allowed per request")
+        with self._lock:
+            response = self._write(method, self.table(base_id, table_name), records)
+            if self.lost_response_rate and self._random.random() < self.lost_response_rate:
+                self.stats["lost"] += 1
+                raise MockError(504, "SERVER_ERROR", "Injected error after the write was applied")
+            return response
+
+    def _write(self, method, table, records):
+        """Applies a batch create, update or delete to a table; call with the lock held."""
+        if method == "POST":
+            created = [self._new_record(record.get("fields", {})) for record in records]
+            for record in created:
+                table[record["id"]] = record
+            return {"records": created}
+        missing = [r if method == "DELETE" else r.get("id") for r in records
+                   if (r if method == "DELETE" else r.get("id")) not in table]
+        if missing:
+            raise MockError(404, "NOT_FOUND", f"Record not found: {missing[0]}")
+        if method == "PATCH":
+            updated = []
+            for record in records:
+                fields = table[record["id"]]["fields"]
+                for name, value in record.get("fields", {}).items():
+                    if value is None:
+                        fields.pop(name, None)
+                    else:
+                        fields[name] = value
+                if self.last_modified_field:
+                    fields[self.last_modified_field] = timestamp()
+                updated.append(table[record["id"]])
+            return {"records": updated}
+        if method == "DELETE":
+            for record_id in records:
+                del table[record_id]
+            return {"records": [{"id": record_id, "deleted": True} for record_id in records]}
+        raise MockError(405, "METHOD_NOT_ALLOWED", f"Unsupported method {method}")
+
+    def list_records(self, base_id, table_name, params):
+        page_size = MAX_PAGE_SIZE
+        max_records = None
+        offset = 0
+        fields = []
+        predicate = None
+        for name, value in params:
+            if name == "pageSize":
+                page_size = int(value)
+                if not 1 <= page_size <= MAX_PAGE_SIZE:
+                    raise MockError(422, "INVALID_PAGE_SIZE", f"pageSize must be between 1 and {MAX_PAGE_SIZE}")
+            elif name == "maxRecords":
+                max_records = int(value)
+            elif name == "offset":
+                try:
+                    offset = int(value.rsplit("/", 1)[-1])
+                except ValueError:
+                    raise MockError(422, "LIST_RECORDS_ITERATOR_NOT_AVAILABLE", "Invalid offset")
+            elif name in ("fields[]", "fields"):
+                fields.append(value)
+            elif name == "filterByFormula":
+                predicate = formula_predicate(value)
+        with self._lock:
+            records = list(self.table(base_id, table_name).values())
+        if predicate:
+            records = [record for record in records if predicate(record)]
+        if max_records is not None:
+            records = records[:max_records]
+        page = records[offset:offset + page_size]
+        if fields:
+            page = [dict(record, fields={name: record["fields"][name] for name in fields
+                                         if name in record["fields"]}) for record in page]
+        response = {"records": page}
+        if offset + page_size < len(records):
+            response["offset"] = f"itr{base_id}/{offset + page_size}"
+        return response
+
+
+class MockAirtableHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # Keep-alive, like the real API
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def _dispatch(self):
+        url = urlsplit(self.path)
+        parts = [unquote(part) for part in url.path.strip("/").split("/")]
+        length = int(self.headers.get("Content-Length") or 0)
+        raw_body = self.rfile.read(length) if length else b""
+        try:
+            if not self.headers.get("Authorization", "").startswith("Bearer "):
+                raise MockError(401, "AUTHENTICATION_REQUIRED", "Authentication required")
+            if len(parts) != 3 or parts[0] != "v0":
+                raise MockError(404, "NOT_FOUND", "Could not find what you are looking for")
+            body = json.loads(raw_body) if raw_body else None
+            params = parse_qsl(url.query, keep_blank_values=True)
+            status, payload, headers = 200, self.server.mock.handle(self.command, parts[1], parts[2], params, body), {}
+        except MockError as e:
+            status, headers = e.status, e.headers
+            payload = {"error": {"type": e.error_type, "message": str(e)}}
+        except ValueError as e:
+            status, headers = 422, {}
+            payload = {"error": {"type": "INVALID_REQUEST_UNKNOWN", "message": str(e)}}
+        data = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    do_GET = do_POST = do_PATCH = do_DELETE = _dispatch
+
+
+class MockAirtableServer(ThreadingHTTPServer):
+    """HTTP front end for a MockAirtable; start() serves it on a background thread."""
+
+    daemon_threads = True
+
+    def __init__(self, host="127.0.0.1", port=0, mock=None, verbose=False):
+        super().__init__((host, port), MockAirtableHandler)
+        self.mock = mock or MockAirtable()
+        self.verbose = verbose
+        self._thread = None
+
+    @property
+    def api_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v0"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a local mock of the Airtable REST API.")
+    parser.add_argument("--host", default="127.0.0.1", help="Interface to listen on")
+    parser.add_argument("--port", type=int, default=8787, help="Port to listen on (0 picks a free one)")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds added to every request")
+    parser.add_argument("--latency_jitter", type=float, default=0.0, help="Extra random latency, up to this many seconds")
+    parser.add_argument("--rate_limit", type=int, default=5, help="Requests per second per base before 429 (0 disables)")
+    parser.add_argument("--retry_after", type=int, default=1, help="Retry-After seconds sent with 429 responses")
+    parser.add_argument("--error_rate", type=float, default=0.0, help="Probability of an injected 5xx response")
+    parser.add_argument("--lost_response_rate", type=float, default=0.0, help="Probability that a write is applied but answered with a 504")
+    parser.add_argument("--seed", type=int, help="Random seed for latency jitter and error injection")
+    parser.add_argument("--last_modified_field", default="Last Modified", help="Field stamped on every create and update")
+    parser.add_argument("--data", help="JSON file to preload: {base: {table: [records]}}")
+    parser.add_argument("--dump", help="Write the store to this JSON file on exit")
+    parser.add_argument("--verbose", action="store_true", help="Log every request")
+    args = parser.parse_args()
+
+    mock = MockAirtable(latency=args.latency, latency_jitter=args.latency_jitter, rate_limit=args.rate_limit or None,
+                        retry_after=args.retry_after, error_rate=args.error_rate, seed=args.seed,
+                        last_modified_field=args.last_modified_field, lost_response_rate=args.lost_response_rate)
+    if args.data:
+        with open(args.data, 'r', encoding='utf-8') as f:
+            mock.load(json.load(f))
+    server = MockAirtableServer(args.host, args.port, mock, verbose=args.verbose)
+    print(f"Mock Airtable API listening on {server.api_url}")
+    print(f"Point the tools at it with AIRTABLE_API_URL={server.api_url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(f"\n{mock.stats['requests']} requests, {mock.stats['throttled']} throttled, "
+              f"{mock.stats['errors']} injected errors, {mock.stats['lost']} lost responses.")
+        if args.dump:
+            with open(args.dump, 'w', encoding='utf-8') as f:
+                json.dump(mock.dump(), f, indent=4, ensure_ascii=False)
+            print(f"Store written to {args.dump}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+Pacing time-series over segment order.
+
+PacingSeries is a corpus_scanner aggregator that turns each chapter's
+ordered segment stream into numeric per-segment features:
+
+- words: SegmentText word count
+- dialogue: 1 for Dialogue segments (or segments with a DialogueSpeaker)
+- mode:<mode>: one-hot PrimaryNarrativeMode
+- tags:<field>: number of tags in each multi-select field
+
+series() then adds, for every feature, a trailing rolling mean over
+`window` segments and a running (cumulative) sum, per chapter or across
+the whole book. Rolling means are differences of the cumulative sums, so
+everything is linear in the number of segments; with NumPy the sums are
+np.cumsum over the feature array, otherwise itertools.accumulate per
+column, with identical results. write_series writes them as CSV or JSON.
+"""
+import csv
+import json
+import os
+from itertools import accumulate
+
+from corpus_scanner import MULTI_SELECT_FIELDS, Aggregator, multi_select_values
+from segment_model import SEGMENT_SCHEMA
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+DEFAULT_WINDOW = 5
+DEFAULT_MODE = dict(SEGMENT_SCHEMA)["PrimaryNarrativeMode"]
+
+
+class PacingSeries(Aggregator):
+    """Per-segment pacing features by chapter: (order, words, mode, dialogue, tag counts per field)."""
+
+    def __init__(self, tag_fields=MULTI_SELECT_FIELDS):
+        self.tag_fields = list(tag_fields)
+        self.fields = (["SegmentOrder", "SegmentText", "PrimaryNarrativeMode", "Narrative Mode", "DialogueSpeaker"]
+                       + self.tag_fields)
+        self.chapters = {}
+        self._rows = None
+
+    def partial(self, chapter_id):
+        partial = PacingSeries(self.tag_fields)
+        partial._rows = partial.chapters[chapter_id] = []
+        return partial
+
+    def add(self, segment):
+        # Compact segmenter output omits the default mode; staging files use the Airtable field name
+        mode = segment.get("PrimaryNarrativeMode") or segment.get("Narrative Mode") or DEFAULT_MODE
+        order = segment.get("SegmentOrder")
+        self._rows.append([
+            order if isinstance(order, (int, float)) else None,
+            len((segment.get("SegmentText") or "").split()),
+            mode,
+            1 if mode == "Dialogue" or segment.get("DialogueSpeaker") else 0,
+            [len(multi_select_values(segment.get(field))) for field in self.tag_fields],
+        ])
+
+    def merge(self, other):
+        for chapter_id, rows in other.chapters.items():
+            self.chapters.setdefault(chapter_id, []).extend(rows)
+
+    def dump(self):
+        return self.chapters
+
+    def load(self, state):
+        for chapter_id, rows in state.items():
+            self.chapters[chapter_id] = rows
+
+    def signature(self):
+        return f"PacingSeries:{json.dumps(self.tag_fields)}"
+
+    def modes(self):
+        """Narrative modes in first-seen order, the one-hot columns shared by every chapter's series."""
+        return list(dict.fromkeys(row[2] for rows in self.chapters.values() for row in rows))
+
+    def features(self, chapter_ids=None):
+        """(chapter IDs, orders, feature names, feature rows) of the chapters' segments in Segment Order."""
+        modes = self.modes()
+        names = ["words", "dialogue"] + [f"mode:{mode}" for mode in modes] + [f"tags:{field}" for field in self.tag_fields]
+        chapters, orders, features = [], [], []
+        for chapter_id in chapter_ids or self.chapters:
+            # Stable sort: segments without a SegmentOrder keep their file position, after the ordered ones
+            rows = sorted(self.chapters.get(chapter_id, []), key=lambda row: (row[0] is None, row[0] or 0))
+            for order, words, mode, dialogue, tag_counts in rows:
+                chapters.append(chapter_id)
+                orders.append(order)
+                features.append([words, dialogue] + [int(mode == m) for m in modes] + tag_counts)
+        return chapters, orders, names, features
+
+    def series(self, chapter_ids=None, window=DEFAULT_WINDOW):
+        """Per-segment columns: chapter, order, position, each feature, <feature>_rolling and <feature>_cumulative.
+
+        Rolling means are over the trailing `window` segments (fewer at the
+        start). One series covers the given chapters in order; call once per
+        chapter for chapter-level series.
+        """
+        if window < 1:
+            raise ValueError(f"window must be at least 1, got {window}")
+        chapters, orders, names, features = self.features(chapter_ids)
+        count = len(features)
+        divisors = [min(i + 1, window) for i in range(count)]
+        if np is not None and count:
+            values = np.asarray(features, dtype=np.int64)
+            cumulative = np.cumsum(values, axis=0)
+            lagged = np.zeros_like(cumulative)
+            lagged[window:] = cumulative[:-window] if window < count else 0
+            rolling = (cumulative - lagged) / np.asarray(divisors, dtype=np.float64)[:, None]
+            value_columns, rolling_columns, cumulative_columns = values.T.tolist(), rolling.T.tolist(), cumulative.T.tolist()
+        else:
+            value_columns = [list(column) for column in zip(*features)] or [[] for _ in names]
+            cumulative_columns = [list(accumulate(column)) for column in value_columns]
+            rolling_columns = [[(sums[i] - (sums[i - window] if i >= window else 0)) / divisors[i] for i in range(count)]
+                               for sums in cumulative_columns]
+        columns = {"chapter": chapters, "order": orders, "position": list(range(1, count + 1))}
+        for name, values in zip(names, value_columns):
+            columns[name] = values
+        for name, values in zip(names, rolling_columns):
+            columns[f"{name}_rolling"] = values
+        for name, values in zip(names, cumulative_columns):
+            columns[f"{name}_cumulative"] = values
+        return columns
+
+
+def write_csv(columns, path):
+    """Writes series columns as CSV, one row per segment."""
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(columns)
+        writer.writerows(zip(*columns.values()))
+
+
+def write_series(pacing, output_dir, text_format="csv", window=DEFAULT_WINDOW, book=False):
+    """Writes one series per chapter (plus the whole book with book=True) to output_dir; returns the files written.
+
+    CSV gives <chapter>_pacing.csv files; JSON a single pacing.json of
+    {chapter: {column: values}}.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    series = {chapter_id: pacing.series([chapter_id], window) for chapter_id in pacing.chapters}
+    if book:
+        series["book"] = pacing.series(None, window)
+    if text_format == "json":
+        path = os.path.join(output_dir, "pacing.json")
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({"Window": window, "Series": series}, f, ensure_ascii=False)
+        return [path]
+    paths = []
+    for name, columns in series.items():
+        path = os.path.join(output_dir, f"{name}_pacing.csv")
+        write_csv(columns, path)
+        paths.append(path)
+    return paths
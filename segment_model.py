@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+"""
+Compact in-memory and on-disk representation of tagged text segments.
+
+The segmenter's full schema has 23 keys per segment, most of them empty lists
+or None. Segment keeps only the populated ones: the multi-select tag lists,
+whose values come from the tagger's fixed keyword sets, are folded into a
+single integer bitmask over an interned (field, value) vocabulary. Lists of
+names (characters, addressees, clues) are open-ended, so they are kept as
+tuples of interned strings instead of growing the vocabulary. Other fields
+are stored only when they differ from their default. The compact serializer
+omits every empty field; expand_segment restores the full schema view from
+either form.
+"""
+import json
+import sys
+
+# Full segment schema in output order, with each field's default value
+SEGMENT_SCHEMA = [
+    ("SegmentID", None),
+    ("SegmentOrder", None),
+    ("SegmentText", ""),
+    ("PrimaryNarrativeMode", "Narration-Action"),
+    ("SecondaryNarrativeModes", []),
+    ("DialogueSpeaker", None),
+    ("DialogueAddressees", []),
+    ("DialogueContext", None),
+    ("DialogueTone", []),
+    ("PlotFunctionTags", []),
+    ("MysteryTags", []),
+    ("CharacterArcTags", []),
+    ("WorldBuildingTags", []),
+    ("StructuralOntologyTags", []),
+    ("AuthorialIntentTags", []),
+    ("ThematicKeywordsRaw", ""),
+    ("CharactersInSegment", []),
+    ("CharacterPOVHolder", None),
+    ("LocationInSegment", None),
+    ("TimeReferenceInSegment", None),
+    ("ClueReferenceInSegment", []),
+    ("SegmentNotes", "Initial granular segmentation."),
+]
+
+SEGMENT_FIELDS = [name for name, _ in SEGMENT_SCHEMA]
+LIST_FIELDS = [name for name, default in SEGMENT_SCHEMA if default == []]
+# List fields holding names rather than tags; stored as tuples, not vocabulary bits
+OPEN_LIST_FIELDS = ["DialogueAddressees", "CharactersInSegment", "ClueReferenceInSegment"]
+TAG_FIELDS = [name for name in LIST_FIELDS if name not in OPEN_LIST_FIELDS]
+_DEFAULTS = dict(SEGMENT_SCHEMA)
+
+
+class TagVocabulary:
+    """Interns (field, value) tag pairs as small integers (bit positions)."""
+
+    def __init__(self):
+        self._bits = {}
+        self._pairs = []
+
+    def bit(self, field, value):
+        key = (field, value)
+        bit = self._bits.get(key)
+        if bit is None:
+            bit = self._bits[key] = len(self._pairs)
+            self._pairs.append(key)
+        return bit
+
+    def mask(self, field, values):
+        mask = 0
+        for value in values:
+            mask |= 1 << self.bit(field, value)
+        return mask
+
+    def values(self, mask):
+        """Returns {field: sorted values} for the bits set in mask."""
+        found = {}
+        while mask:
+            low = mask & -mask
+            field, value = self._pairs[low.bit_length() - 1]
+            found.setdefault(field, []).append(value)
+            mask ^= low
+        for values in found.values():
+            values.sort()
+        return found
+
+    def __len__(self):
+        return len(self._pairs)
+
+
+# Shared by every Segment in the process so equal tags cost one entry
+TAG_VOCABULARY = TagVocabulary()
+
+
+class Segment:
+    """A tagged segment that only stores its populated fields."""
+
+    __slots__ = ("segment_id", "order", "text", "tag_mask", "extras")
+
+    def __init__(self, segment_id, order, text, tag_mask=0, extras=None):
+        self.segment_id = segment_id
+        self.order = order
+        self.text = text
+        self.tag_mask = tag_mask
+        self.extras = extras
+
+    @classmethod
+    def from_dict(cls, data, vocabulary=TAG_VOCABULARY):
+        """Builds a Segment from a full or compact segment dict."""
+        tag_mask = 0
+        extras = None
+        for name, value in data.items():
+            if name in ("SegmentID", "SegmentOrder", "SegmentText"):
+                continue
+            if name in TAG_FIELDS and isinstance(value, list):
+                if value:
+                    tag_mask |= vocabulary.mask(name, value)
+            elif name in OPEN_LIST_FIELDS and isinstance(value, list):
+                if value:
+                    if extras is None:
+                        extras = {}
+                    # Sorted and deduplicated, as the tag bitmask returns its values
+                    extras[name] = tuple(sorted({sys.intern(v) if isinstance(v, str) else v for v in value}))
+            elif name not in _DEFAULTS or value != _DEFAULTS[name]:
+                if extras is None:
+                    extras = {}
+                extras[name] = sys.intern(value) if isinstance(value, str) and len(value) < 64 else value
+        return cls(data.get("SegmentID"), data.get("SegmentOrder"), data.get("SegmentText", ""),
+                   tag_mask, extras)
+
+    def to_compact(self, vocabulary=TAG_VOCABULARY):
+        """Returns a dict with only the populated fields, in schema order."""
+        populated = {"SegmentID": self.segment_id, "SegmentOrder": self.order}
+        if self.text:
+            populated["SegmentText"] = self.text
+        tags = vocabulary.values(self.tag_mask)
+        extras = self.extras or {}
+        for name in SEGMENT_FIELDS[3:]:
+            if name in tags:
+                populated[name] = tags[name]
+            elif name in extras:
+                value = extras[name]
+                populated[name] = list(value) if name in OPEN_LIST_FIELDS else value
+        # Fields outside the schema are kept, after the known ones
+        for name, value in extras.items():
+            if name not in _DEFAULTS:
+                populated[name] = value
+        return populated
+
+    def to_dict(self, vocabulary=TAG_VOCABULARY):
+        """Returns the full schema view, as segment_chapter produces it."""
+        return expand_segment(self.to_compact(vocabulary))
+
+    def __eq__(self, other):
+        if not isinstance(other, Segment):
+            return NotImplemented
+        return self.to_compact() == other.to_compact()
+
+    def __repr__(self):
+        return f"Segment({self.segment_id!r}, order={self.order})"
+
+
+def compact_segment(segment):
+    """Drops the fields of a segment dict that hold their schema default."""
+    return {name: value for name, value in segment.items()
+            if name in ("SegmentID", "SegmentOrder") or name not in _DEFAULTS or value != _DEFAULTS[name]}
+
+
+def expand_segment(segment):
+    """Restores the full schema view of a compact (or already full) segment dict."""
+    full = {}
+    for name, default in SEGMENT_SCHEMA:
+        value = segment.get(name, default)
+        full[name] = list(value) if isinstance(value, list) else value
+    for name, value in segment.items():
+        if name not in full:
+            full[name] = value
+    return full
+
+
+def dump_chapter(chapter_id, segments, f, compact=True):
+    """Writes a chapter's segments; compact output omits empty fields and indentation."""
+    if compact:
+        chapter_output = {
+            "ChapterID": chapter_id,
+            "Segments": [s.to_compact() if isinstance(s, Segment) else compact_segment(s) for s in segments]
+        }
+        json.dump(chapter_output, f, ensure_ascii=False, separators=(",", ":"))
+    else:
+        chapter_output = {
+            "ChapterID": chapter_id,
+            "Segments": [s.to_dict() if isinstance(s, Segment) else s for s in segments]
+        }
+        json.dump(chapter_output, f, indent=4, ensure_ascii=False)
+
+
+def load_chapter(path, as_segments=False):
+    """Loads a chapter file in either form; returns (chapter_id, segments).
+
+    Segments are returned as full-schema dicts, or as compact Segment objects
+    when as_segments is set.
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    raw_segments = data.get("Segments", [])
+    if as_segments:
+        segments = [Segment.from_dict(s) for s in raw_segments]
+    else:
+        segments = [expand_segment(s) for s in raw_segments]
+    return data.get("ChapterID"), segments
@@ -2,7 +2,14 @@
 import json
 import re
 import argparse
+import difflib
+import hashlib
 import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from segment_model import Segment, compact_segment, dump_chapter, expand_segment
+from tagging_engine import CharacterIndex, PhraseMatcher
 
 # Basic keyword lists for heuristic tagging (can be expanded significantly)
 DIALOGUE_VERBS = ["said", "asked", "replied", "exclaimed", "whispered", "muttered", "shouted", "cried", "gasped"]
@@ -12,134 +19,422 @@ DESCRIPTION_ADJECTIVES = ["beautiful", "dark", "vast", "tiny", "old", "new", "re
 SATIRICAL_KEYWORDS = ["bureaucracy", "corporate", "hero", "engineer", "mech", "manual", "cost-cutting", "marketing-driven"]
 HUMOROUS_KEYWORDS = ["funny", "laugh", "joke", "ridiculous", "absurd"]
 
-# Simplified character list for example (in a real system, this would be managed externally)
+CLUE_KEYWORDS = ["clue", "evidence"]
+DEDUCTION_KEYWORDS = ["detective", "investigation"]
+
+# Whole-word markers (matched case-insensitively)
+CAUSAL_MARKERS = ["because", "therefore", "thus", "as a result"]
+FLASHBACK_MARKERS = ["previously", "earlier", "before that", "remembered when"]
+TIME_MARKERS = ["day", "night", "morning", "evening", "hour", "minute", "monday", "tuesday", "january", "february"]
+
+# Example locations (matched case-sensitively)
+WORLD_LOCATIONS = ["Aethelburg", "Neo-London"]
+
+# Simplified character list for example, used when no cast list is configured
+# (the CLI passes config["known_characters"], which may include aliases)
 KNOWN_CHARACTERS = ["Hanson", "FLANT", "Vance", "Director Thorne"]
 
-def identify_characters_in_text(text, known_chars):
-    present_chars = []
-    for char_name in known_chars:
-        if re.search(r'\b' + re.escape(char_name) + r'\b', text, re.IGNORECASE):
-            present_chars.append(char_name)
-    return present_chars
+DEFAULT_CHARACTER_INDEX = CharacterIndex.from_config(KNOWN_CHARACTERS)
 
-def segment_chapter(chapter_text, chapter_id):
-    """Segments chapter text into paragraphs and assigns granular tags based on revised schema."""
-    segments = []
-    # Split by one or more newline characters, effectively treating paragraphs as segments
-    paragraphs = re.split(r'\n\s*\n+', chapter_text.strip())
-    
+def load_character_index(known_characters=None):
+    """Builds a CharacterIndex from a config cast list, falling back to KNOWN_CHARACTERS."""
+    if not known_characters:
+        return DEFAULT_CHARACTER_INDEX
+    return CharacterIndex.from_config(known_characters)
+
+def load_config_characters(config_path):
+    """Reads the known_characters list from a manuscript CLI config file, if present."""
+    if not config_path or not os.path.exists(config_path):
+        return None
+    with open(config_path, 'r', encoding='utf-8') as f:
+        return json.load(f).get("known_characters")
+
+def identify_characters_in_text(text, character_index=None):
+    """Returns the sorted canonical names of all characters mentioned in text.
+
+    character_index may also be a known_characters list (or mapping), as
+    older callers pass; an index is then built from it for the call.
+    """
+    if isinstance(character_index, (list, tuple, dict)):
+        character_index = CharacterIndex.from_config(character_index)
+    elif character_index is None:
+        character_index = DEFAULT_CHARACTER_INDEX
+    return character_index.characters_in(text)
+
+def build_heuristic_matcher():
+    """Compiles every keyword list and marker used by segment_chapter into one matcher."""
+    matcher = PhraseMatcher()
+    for label, keywords in (("dialogue_verb", DIALOGUE_VERBS),
+                            ("interior_state", INTERIOR_STATE_VERBS),
+                            ("description", DESCRIPTION_ADJECTIVES),
+                            ("satirical", SATIRICAL_KEYWORDS),
+                            ("humorous", HUMOROUS_KEYWORDS),
+                            ("clue", CLUE_KEYWORDS),
+                            ("deduction", DEDUCTION_KEYWORDS)):
+        for keyword in keywords:
+            matcher.add(keyword, label)
+    for label, markers in (("causal", CAUSAL_MARKERS),
+                           ("flashback", FLASHBACK_MARKERS),
+                           ("time", TIME_MARKERS)):
+        for marker in markers:
+            matcher.add(marker, label, whole_word=True)
+    for location in WORLD_LOCATIONS:
+        matcher.add(location, "location", case_sensitive=True)
+    return matcher.compile()
+
+HEURISTIC_MATCHER = build_heuristic_matcher()
+
+def split_paragraphs(chapter_text):
+    """Splits chapter text into paragraphs (blank-line separated)."""
+    return re.split(r'\n\s*\n+', chapter_text.strip())
+
+def iter_paragraphs(lines):
+    """Yields paragraphs lazily from an iterable of lines, such as an open file.
+
+    Produces the same paragraphs as split_paragraphs without holding more than
+    one paragraph in memory.
+    """
+    buffer = []
+    for line in lines:
+        if line.strip():
+            buffer.append(line)
+        elif buffer:
+            yield "".join(buffer)
+            buffer = []
+    if buffer:
+        yield "".join(buffer)
+
+def apply_positional_tags(segment, i, chapter_id):
+    """Sets the fields that depend on where the paragraph sits in the chapter."""
+    segment["SegmentOrder"] = i + 1
+    plot_tags = [tag for tag in segment["PlotFunctionTags"] if tag != "IncitingIncident"]
+    # These are very hard to automate without full plot understanding. Placeholder.
+    if i < 5 and chapter_id.endswith("01"): # First few segments of first chapter
+        plot_tags.append("IncitingIncident") # Highly speculative
+    segment["PlotFunctionTags"] = sorted(set(plot_tags))
+
+def tag_segment(text_to_analyze, i, chapter_id, character_index=None):
+    """Builds the tagged segment record for the i-th (0-based) paragraph of a chapter."""
+    character_index = character_index or DEFAULT_CHARACTER_INDEX
+    segment = {
+        "SegmentID": f"{chapter_id}_SEG{i+1:05d}",
+        "SegmentOrder": i + 1,
+        "SegmentText": text_to_analyze,
+        "PrimaryNarrativeMode": "Narration-Action", # Default
+        "SecondaryNarrativeModes": [],
+        "DialogueSpeaker": None,
+        "DialogueAddressees": [],
+        "DialogueContext": None,
+        "DialogueTone": [],
+        "PlotFunctionTags": [],
+        "MysteryTags": [],
+        "CharacterArcTags": [],
+        "WorldBuildingTags": [],
+        "StructuralOntologyTags": [],
+        "AuthorialIntentTags": [],
+        "ThematicKeywordsRaw": "", # Placeholder, could be extracted with NLP
+        "CharactersInSegment": identify_characters_in_text(text_to_analyze, character_index),
+        "CharacterPOVHolder": None, # Complex to determine automatically
+        "LocationInSegment": None, # Placeholder, requires context or NLP
+        "TimeReferenceInSegment": None, # Placeholder, requires context or NLP
+        "ClueReferenceInSegment": [],
+        "SegmentNotes": "Initial granular segmentation."
+    }
+
+    # --- Heuristic Tagging Logic ---
+    # All keyword and marker hits for the paragraph, found in a single pass
+    hits = HEURISTIC_MATCHER.labels(text_to_analyze)
+
+    # 1. Primary Narrative Mode & Dialogue details
+    is_dialogue = False
+    dialogue_match = re.match(r'^["“](.*?)["”](?:\s*(\w+)\s*(?:to\s*(\w+))?\s*(said|asked|replied|exclaimed|whispered|muttered|shouted|cried|gasped))?', text_to_analyze, re.IGNORECASE)
+    if dialogue_match:
+        is_dialogue = True
+        segment["PrimaryNarrativeMode"] = "Dialogue"
+        #dialogue_content = dialogue_match.group(1)
+        speaker_candidate = dialogue_match.group(2)
+        #addressee_candidate = dialogue_match.group(3) # Often not present
+        #verb = dialogue_match.group(4)
+        if speaker_candidate and character_index.resolve(speaker_candidate):
+             segment["DialogueSpeaker"] = character_index.resolve(speaker_candidate)
+        # Basic tone based on verb (very simplistic)
+        # if verb in ["shouted", "exclaimed"]: segment["DialogueTone"].append("Emotional") 
+
+    elif "dialogue_verb" in hits and (text_to_analyze.count('"') >= 2 or text_to_analyze.count('“') >=2 ):
+         is_dialogue = True # Likely dialogue even if not matching the simple regex
+         segment["PrimaryNarrativeMode"] = "Dialogue"
+
+    if not is_dialogue:
+        if "interior_state" in hits:
+            segment["PrimaryNarrativeMode"] = "Narration-InteriorState"
+        elif len(text_to_analyze.split()) > 20 and "description" in hits: # Arbitrary length for description
+            segment["PrimaryNarrativeMode"] = "Narration-Description"
+        elif text_to_analyze.isupper() and len(text_to_analyze.split()) < 10: # Heuristic for e.g. location/time headers
+            segment["PrimaryNarrativeMode"] = "Meta-Narration"
+            segment["StructuralOntologyTags"].append("TimeMarkerExplicit" if "time" in hits else "LocationMarkerExplicit")
+        # Default is Narration-Action or Narration-Exposition (hard to distinguish simply)
+
+    # 2. Authorial Intent Tags (from narrative_design.md concepts)
+    if "satirical" in hits:
+        segment["AuthorialIntentTags"].append("SatiricalElement")
+    if "humorous" in hits:
+        segment["AuthorialIntentTags"].append("HumorousElement")
+
+    # 3. Mystery Tags (Example)
+    if "clue" in hits:
+        segment["MysteryTags"].append("ClueDeployment") # Could be analysis too
+    if "deduction" in hits:
+        segment["MysteryTags"].append("DeductionByCharacter")
+
+    # 4. Structural Ontology Tags (from narrative_ontology.py concepts - very basic examples)
+    if "causal" in hits:
+        segment["StructuralOntologyTags"].append("CausalLink-Consequence")
+    if "flashback" in hits:
+        segment["StructuralOntologyTags"].append("FlashbackMarker")
+
+    # 5. WorldBuilding Tags
+    if "location" in hits: # Example locations
+        segment["WorldBuildingTags"].append("SettingDescriptionPhysical")
+        if not segment["LocationInSegment"]:
+             segment["LocationInSegment"] = text_to_analyze # Simplistic assignment
+
+    # 6. Character Arc Tags
+    if segment["PrimaryNarrativeMode"] == "Narration-InteriorState" and segment["CharactersInSegment"]:
+        segment["CharacterArcTags"].append("InternalStruggleDemonstrated")
+    if is_dialogue and len(segment["CharactersInSegment"]) >=2:
+        segment["CharacterArcTags"].append("RelationshipDevelopment") # or conflict
+
+    # 7. Plot Function Tags
+    apply_positional_tags(segment, i, chapter_id)
+
+    # Remove duplicates from tag lists
+    for key in segment:
+        if isinstance(segment[key], list):
+            segment[key] = sorted(list(set(segment[key])))
+
+    return segment
+
+def iter_segments(paragraphs, chapter_id, character_index=None):
+    """Yields a tagged segment for each non-empty paragraph as soon as it is tagged."""
     for i, para_text in enumerate(paragraphs):
         text_to_analyze = para_text.strip()
         if not text_to_analyze:
             continue
-        
-        segment = {
-            "SegmentID": f"{chapter_id}_SEG{i+1:05d}",
-            "SegmentOrder": i + 1,
-            "SegmentText": text_to_analyze,
-            "PrimaryNarrativeMode": "Narration-Action", # Default
-            "SecondaryNarrativeModes": [],
-            "DialogueSpeaker": None,
-            "DialogueAddressees": [],
-            "DialogueContext": None,
-            "DialogueTone": [],
-            "PlotFunctionTags": [],
-            "MysteryTags": [],
-            "CharacterArcTags": [],
-            "WorldBuildingTags": [],
-            "StructuralOntologyTags": [],
-            "AuthorialIntentTags": [],
-            "ThematicKeywordsRaw": "", # Placeholder, could be extracted with NLP
-            "CharactersInSegment": identify_characters_in_text(text_to_analyze, KNOWN_CHARACTERS),
-            "CharacterPOVHolder": None, # Complex to determine automatically
-            "LocationInSegment": None, # Placeholder, requires context or NLP
-            "TimeReferenceInSegment": None, # Placeholder, requires context or NLP
-            "ClueReferenceInSegment": [],
-            "SegmentNotes": "Initial granular segmentation."
-        }
-
-        # --- Heuristic Tagging Logic ---
-
-        # 1. Primary Narrative Mode & Dialogue details
-        is_dialogue = False
-        dialogue_match = re.match(r'^["“](.*?)["”](?:\s*(\w+)\s*(?:to\s*(\w+))?\s*(said|asked|replied|exclaimed|whispered|muttered|shouted|cried|gasped))?', text_to_analyze, re.IGNORECASE)
-        if dialogue_match:
-            is_dialogue = True
-            segment["PrimaryNarrativeMode"] = "Dialogue"
-            #dialogue_content = dialogue_match.group(1)
-            speaker_candidate = dialogue_match.group(2)
-            #addressee_candidate = dialogue_match.group(3) # Often not present
-            #verb = dialogue_match.group(4)
-            if speaker_candidate and speaker_candidate in KNOWN_CHARACTERS:
-                 segment["DialogueSpeaker"] = speaker_candidate
-            # Basic tone based on verb (very simplistic)
-            # if verb in ["shouted", "exclaimed"]: segment["DialogueTone"].append("Emotional") 
-
-        elif any(verb in text_to_analyze.lower() for verb in DIALOGUE_VERBS) and (text_to_analyze.count('"') >= 2 or text_to_analyze.count('“') >=2 ):
-             is_dialogue = True # Likely dialogue even if not matching the simple regex
-             segment["PrimaryNarrativeMode"] = "Dialogue"
-
-        if not is_dialogue:
-            if any(verb in text_to_analyze.lower() for verb in INTERIOR_STATE_VERBS):
-                segment["PrimaryNarrativeMode"] = "Narration-InteriorState"
-            elif len(text_to_analyze.split()) > 20 and any(adj in text_to_analyze.lower() for adj in DESCRIPTION_ADJECTIVES): # Arbitrary length for description
-                segment["PrimaryNarrativeMode"] = "Narration-Description"
-            elif text_to_analyze.isupper() and len(text_to_analyze.split()) < 10: # Heuristic for e.g. location/time headers
-                segment["PrimaryNarrativeMode"] = "Meta-Narration"
-                segment["StructuralOntologyTags"].append("TimeMarkerExplicit" if re.search(r'\b(day|night|morning|evening|hour|minute|monday|tuesday|january|february)\b', text_to_analyze, re.IGNORECASE) else "LocationMarkerExplicit")
-            # Default is Narration-Action or Narration-Exposition (hard to distinguish simply)
-
-        # 2. Authorial Intent Tags (from narrative_design.md concepts)
-        if any(keyword in text_to_analyze.lower() for keyword in SATIRICAL_KEYWORDS):
-            segment["AuthorialIntentTags"].append("SatiricalElement")
-        if any(keyword in text_to_analyze.lower() for keyword in HUMOROUS_KEYWORDS):
-            segment["AuthorialIntentTags"].append("HumorousElement")
-
-        # 3. Mystery Tags (Example)
-        if "clue" in text_to_analyze.lower() or "evidence" in text_to_analyze.lower():
-            segment["MysteryTags"].append("ClueDeployment") # Could be analysis too
-        if "detective" in text_to_analyze.lower() or "investigation" in text_to_analyze.lower():
-            segment["MysteryTags"].append("DeductionByCharacter")
-
-        # 4. Structural Ontology Tags (from narrative_ontology.py concepts - very basic examples)
-        if re.search(r'\b(because|therefore|thus|as a result)\b', text_to_analyze, re.IGNORECASE):
-            segment["StructuralOntologyTags"].append("CausalLink-Consequence")
-        if re.search(r'\b(previously|earlier|before that|remembered when)\b', text_to_analyze, re.IGNORECASE):
-            segment["StructuralOntologyTags"].append("FlashbackMarker")
-
-        # 5. WorldBuilding Tags
-        if "Aethelburg" in text_to_analyze or "Neo-London" in text_to_analyze: # Example locations
-            segment["WorldBuildingTags"].append("SettingDescriptionPhysical")
-            if not segment["LocationInSegment"]:
-                 segment["LocationInSegment"] = text_to_analyze # Simplistic assignment
-
-        # 6. Character Arc Tags
-        if segment["PrimaryNarrativeMode"] == "Narration-InteriorState" and segment["CharactersInSegment"]:
-            segment["CharacterArcTags"].append("InternalStruggleDemonstrated")
-        if is_dialogue and len(segment["CharactersInSegment"]) >=2:
-            segment["CharacterArcTags"].append("RelationshipDevelopment") # or conflict
-
-        # 7. Plot Function Tags
-        # These are very hard to automate without full plot understanding. Placeholder.
-        if i < 5 and chapter_id.endswith("01"): # First few segments of first chapter
-            segment["PlotFunctionTags"].append("IncitingIncident") # Highly speculative
-
-        # Remove duplicates from tag lists
-        for key in segment:
-            if isinstance(segment[key], list):
-                segment[key] = sorted(list(set(segment[key])))
+        yield tag_segment(text_to_analyze, i, chapter_id, character_index)
+
+def segment_chapter(chapter_text, chapter_id, character_index=None, as_segments=False):
+    """Segments chapter text into paragraphs and assigns granular tags based on revised schema.
+
+    With as_segments, the chapter is kept as compact Segment objects (each
+    full dict only lives while its paragraph is tagged) instead of dicts.
+    """
+    # Split by one or more newline characters, effectively treating paragraphs as segments
+    paragraphs = split_paragraphs(chapter_text)
+    segments = iter_segments(paragraphs, chapter_id, character_index)
+    if as_segments:
+        return [Segment.from_dict(segment) for segment in segments]
+    return list(segments)
 
+# --- Incremental re-segmentation ---
+# A manifest stored next to the output keeps each paragraph's content hash with
+# its tagged segment. Re-running only tags new or edited paragraphs and keeps
+# SegmentIDs stable when paragraphs are inserted, moved or removed. Every
+# non-streaming run writes the manifest (a full run through
+# segment_chapter_incremental without one), so the first --incremental run
+# after it already reuses tags and IDs.
+
+def paragraph_hash(text):
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+def tagger_fingerprint(character_index=None):
+    """Hash of everything the tags depend on; cached tags are discarded when it changes."""
+    keyword_lists = [DIALOGUE_VERBS, INTERIOR_STATE_VERBS, DESCRIPTION_ADJECTIVES, SATIRICAL_KEYWORDS,
+                     HUMOROUS_KEYWORDS, CLUE_KEYWORDS, DEDUCTION_KEYWORDS, CAUSAL_MARKERS,
+                     FLASHBACK_MARKERS, TIME_MARKERS, WORLD_LOCATIONS]
+    payload = json.dumps([keyword_lists, (character_index or DEFAULT_CHARACTER_INDEX).fingerprint()])
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+def manifest_path_for(output_file):
+    return os.path.splitext(str(output_file))[0] + ".manifest.json"
+
+def load_manifest(manifest_file):
+    """Returns the saved manifest, or None when there is none yet."""
+    if not os.path.exists(manifest_file):
+        return None
+    with open(manifest_file, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def save_manifest(manifest, manifest_file):
+    with open(manifest_file, 'w', encoding='utf-8') as f:
+        # Entries may hold Segment objects (see segment_chapter_incremental), saved in compact form
+        json.dump(manifest, f, ensure_ascii=False, default=Segment.to_compact)
+
+def segment_chapter_incremental(chapter_text, chapter_id, manifest=None, character_index=None, as_segments=False):
+    """Re-segments a chapter, reusing the tags of paragraphs unchanged since the manifest.
+
+    Returns (segments, new_manifest, stats); with as_segments, segments are
+    Segment objects shared with the manifest entries. Unchanged paragraphs keep their
+    SegmentID and cached tags; a paragraph edited in place keeps its SegmentID
+    but is re-tagged; new paragraphs get fresh IDs that are never reused.
+    """
+    fingerprint = tagger_fingerprint(character_index)
+    paragraphs = [(i, text.strip()) for i, text in enumerate(split_paragraphs(chapter_text)) if text.strip()]
+    new_hashes = [paragraph_hash(text) for _, text in paragraphs]
+
+    if manifest and manifest.get("ChapterID") != chapter_id:
+        manifest = None
+    old_entries = manifest.get("Paragraphs", []) if manifest else []
+    next_number = max([i + 1 for i, _ in paragraphs], default=0) + 1
+    if manifest:
+        next_number = manifest.get("NextSegmentNumber", next_number)
+    tags_reusable = bool(manifest) and manifest.get("TaggerFingerprint") == fingerprint
+
+    # For each new paragraph: (SegmentID to keep or None, cached segment or None)
+    assignments = [(None, None)] * len(paragraphs)
+    if old_entries:
+        matcher = difflib.SequenceMatcher(None, [e["Hash"] for e in old_entries], new_hashes, autojunk=False)
+        for op, old_lo, old_hi, new_lo, new_hi in matcher.get_opcodes():
+            if op == "equal":
+                for k in range(new_hi - new_lo):
+                    cached = old_entries[old_lo + k]["Segment"]
+                    assignments[new_lo + k] = (cached["SegmentID"], cached if tags_reusable else None)
+            elif op == "replace":
+                # Paragraphs edited in place keep their IDs
+                for k in range(min(old_hi - old_lo, new_hi - new_lo)):
+                    assignments[new_lo + k] = (old_entries[old_lo + k]["Segment"]["SegmentID"], None)
+    elif not manifest:
+        # First run: positional IDs, exactly as segment_chapter assigns them
+        assignments = [(f"{chapter_id}_SEG{i+1:05d}", None) for i, _ in paragraphs]
+
+    segments = []
+    entries = []
+    stats = {"Reused": 0, "Tagged": 0}
+    for (i, text), text_hash, (segment_id, cached) in zip(paragraphs, new_hashes, assignments):
+        if cached is not None:
+            segment = expand_segment(cached)
+            apply_positional_tags(segment, i, chapter_id)
+            stats["Reused"] += 1
+        else:
+            segment = tag_segment(text, i, chapter_id, character_index)
+            stats["Tagged"] += 1
+        if segment_id is None:
+            segment_id = f"{chapter_id}_SEG{next_number:05d}"
+            next_number += 1
+        segment["SegmentID"] = segment_id
+        segment = Segment.from_dict(segment) if as_segments else segment
         segments.append(segment)
-    return segments
+        entries.append({"Hash": text_hash, "Segment": segment if as_segments else compact_segment(segment)})
+
+    new_manifest = {
+        "ChapterID": chapter_id,
+        "TaggerFingerprint": fingerprint,
+        "NextSegmentNumber": next_number,
+        "Paragraphs": entries,
+    }
+    return segments, new_manifest, stats
+
+def write_segments_ndjson(segments, f, compact=False):
+    """Writes each segment as one JSON line as it arrives; returns the number written."""
+    count = 0
+    for segment in segments:
+        if compact:
+            segment = compact_segment(segment)
+        f.write(json.dumps(segment, ensure_ascii=False) + "\n")
+        count += 1
+    return count
+
+def stream_segment_file(input_file, output_file, chapter_id, character_index=None, compact=False):
+    """Segments input_file into NDJSON at output_file without loading either fully into memory."""
+    with open(input_file, 'r', encoding='utf-8') as f_in, open(output_file, 'w', encoding='utf-8') as f_out:
+        segments = iter_segments(iter_paragraphs(f_in), chapter_id, character_index)
+        return write_segments_ndjson(segments, f_out, compact)
+
+def chapter_id_from_filename(path):
+    """Derives a chapter ID from a file name, e.g. chapter_01.txt or ch1.md -> CH001."""
+    stem = os.path.splitext(os.path.basename(path))[0]
+    match = re.search(r'(?:chapter|ch)[\s_-]*(\d+)', stem, re.IGNORECASE)
+    if match:
+        return f"CH{int(match.group(1)):03d}"
+    return re.sub(r'\W+', '_', stem).strip('_').upper()
+
+def segment_file(input_file, output_file, chapter_id, character_index=None, compact=False):
+    """Segments one chapter file into a JSON output file and its manifest; returns throughput stats."""
+    started = time.perf_counter()
+    with open(input_file, 'r', encoding='utf-8') as f:
+        chapter_content = f.read()
+    segmented_data, manifest, _ = segment_chapter_incremental(chapter_content, chapter_id, None, character_index,
+                                                              as_segments=True)
+    with open(output_file, 'w', encoding='utf-8') as f:
+        dump_chapter(chapter_id, segmented_data, f, compact)
+    save_manifest(manifest, manifest_path_for(output_file))
+    return {
+        "ChapterID": chapter_id,
+        "Input": str(input_file),
+        "Output": str(output_file),
+        "Segments": len(segmented_data),
+        "Words": len(chapter_content.split()),
+        "Bytes": len(chapter_content.encode('utf-8')),
+        "Seconds": time.perf_counter() - started,
+    }
+
+# Per-process character index, built once by the pool initializer
+_worker_character_index = None
+
+def _init_segment_worker(known_characters):
+    global _worker_character_index
+    _worker_character_index = load_character_index(known_characters)
+
+def _segment_file_job(job):
+    input_file, output_file, chapter_id, compact = job
+    return segment_file(input_file, output_file, chapter_id, _worker_character_index, compact)
+
+def segment_files(jobs, workers=None, known_characters=None, compact=False):
+    """Segments (input_file, output_file, chapter_id) jobs across a process pool.
+
+    Yields the stats of each job in the order the jobs were given, regardless of
+    which worker finishes first. workers=1 runs everything in this process.
+    """
+    jobs = list(jobs)
+    if workers == 1:
+        character_index = load_character_index(known_characters)
+        for input_file, output_file, chapter_id in jobs:
+            yield segment_file(input_file, output_file, chapter_id, character_index, compact)
+        return
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_segment_worker,
+                             initargs=(known_characters,)) as pool:
+        yield from pool.map(_segment_file_job, [(*job, compact) for job in jobs])
 
 def main():
     parser = argparse.ArgumentParser(description="Segment a novel chapter into text segments and apply granular tags.")
     parser.add_argument("input_file", help="Path to the input chapter text file (.md or .txt)")
     parser.add_argument("output_file", help="Path to the output JSON file for segmented data")
     parser.add_argument("chapter_id", help="Unique ID for the chapter (e.g., CH001)")
+    parser.add_argument("--config", default=os.path.expanduser("~/.manuscript/config.json"), help="Manuscript config file providing known_characters")
+    parser.add_argument("--stream", action="store_true", help="Read the input lazily and write one segment per line (NDJSON) as it is tagged")
+    parser.add_argument("--compact", action="store_true", help="Omit empty fields and indentation from the output")
+    parser.add_argument("--incremental", action="store_true", help="Reuse tags of unchanged paragraphs from the manifest next to the output file and keep SegmentIDs stable")
     
     args = parser.parse_args()
+    if args.stream and args.incremental:
+        parser.error("--incremental needs the whole chapter and cannot be combined with --stream")
     
+    try:
+        character_index = load_character_index(load_config_characters(args.config))
+    except Exception as e:
+        print(f"Error reading config file: {e}")
+        return
+
+    if args.stream:
+        try:
+            os.makedirs(os.path.dirname(args.output_file) or ".", exist_ok=True)
+            count = stream_segment_file(args.input_file, args.output_file, args.chapter_id, character_index, args.compact)
+            print(f"Successfully streamed {count} segments of chapter {args.chapter_id} to {args.output_file}")
+        except FileNotFoundError:
+            print(f"Error: Input file {args.input_file} not found.")
+        except Exception as e:
+            print(f"Error streaming segments: {e}")
+        return
+
     try:
         with open(args.input_file, 'r', encoding='utf-8') as f:
             chapter_content = f.read()
@@ -149,22 +444,27 @@ def main():
     except Exception as e:
         print(f"Error reading input file: {e}")
         return
-        
-    segmented_data = segment_chapter(chapter_content, args.chapter_id)
-    
-    chapter_output = {
-        "ChapterID": args.chapter_id,
-        "Segments": segmented_data
-    }
+
+    manifest_file = manifest_path_for(args.output_file)
+    manifest = None
+    if args.incremental:
+        try:
+            manifest = load_manifest(manifest_file)
+        except Exception as e:
+            print(f"Warning: Could not read manifest {manifest_file}, re-tagging everything: {e}")
+    segmented_data, manifest, stats = segment_chapter_incremental(chapter_content, args.chapter_id, manifest,
+                                                                  character_index, as_segments=True)
+    if args.incremental:
+        print(f"Re-tagged {stats['Tagged']} paragraphs, reused {stats['Reused']} unchanged")
     
     try:
         os.makedirs(os.path.dirname(args.output_file), exist_ok=True)
         with open(args.output_file, 'w', encoding='utf-8') as f:
-            json.dump(chapter_output, f, indent=4, ensure_ascii=False)
+            dump_chapter(args.chapter_id, segmented_data, f, args.compact)
+        save_manifest(manifest, manifest_file)
         print(f"Successfully segmented chapter {args.chapter_id} and saved to {args.output_file}")
     except Exception as e:
         print(f"Error writing output file: {e}")
 
 if __name__ == "__main__":
     main()
-
@@ -0,0 +1,325 @@
+#!/usr/bin/env python3
+"""
+Segment x tag incidence matrix for distribution and co-occurrence analytics.
+
+TagMatrix is a corpus_scanner aggregator: one scan records which
+(field, value) tags every segment carries, with the segment's chapter and
+position in index arrays. Questions such as "which MysteryTags co-occur
+with DialogueTone:Tense" or "tag distribution per chapter" are then
+whole-column operations instead of loops over segment dicts:
+
+    matrix = TagMatrix()
+    scan_corpus(staging_files("airtable_staging/"), [matrix])
+    matrix.cooccurring("DialogueTone", "Tense", field="MysteryTags")
+    matrix.chapter_histogram("MysteryTags", normalize=True)
+
+With NumPy the incidence is a boolean array and queries are array
+reductions and matrix products. Without it, each tag column is a Python
+int used as a bitset over segments (as segment_model does for tag masks),
+and counts are popcounts of ANDed columns. Both give the same results.
+save()/load() cache a built matrix, so later queries skip the scan.
+"""
+import base64
+import gzip
+import hashlib
+import json
+import os
+
+from corpus_scanner import MULTI_SELECT_FIELDS, PARTIALS_VERSION, Aggregator, multi_select_values, scan_corpus
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+MATRIX_CACHE_FILENAME = ".tag_matrix.npz" if np is not None else ".tag_matrix.json.gz"
+
+
+def corpus_key(files):
+    """Identifies a set of chapter files by name, size and mtime, for validating a saved matrix."""
+    stats = []
+    for chapter_id, path in files:
+        stat = os.stat(path)
+        stats.append([chapter_id, os.path.basename(path), stat.st_size, stat.st_mtime_ns])
+    return hashlib.sha256(json.dumps([PARTIALS_VERSION, stats]).encode('utf-8')).hexdigest()
+
+
+class TagMatrix(Aggregator):
+    """Segment x (field, value) incidence, with per-segment chapter and position index arrays.
+
+    Tags are stored sparsely while scanning (the segment rows of each
+    column), which keeps partials small to merge, pickle and cache; the
+    dense array or bitsets used by queries are built on first use.
+    """
+
+    def __init__(self, multi_fields=MULTI_SELECT_FIELDS, single_fields=()):
+        self.multi_fields = list(multi_fields)
+        self.single_fields = list(single_fields)
+        self.fields = ["SegmentOrder"] + self.single_fields + self.multi_fields
+        self.labels = []           # column -> (field, value)
+        self.column_index = {}     # (field, value) -> column
+        self.column_rows = []      # column -> segment rows carrying the tag
+        self.chapter_ids = []
+        self.chapter_index = []    # segment -> index into chapter_ids
+        self.positions = []        # segment -> SegmentOrder (or position in its chapter)
+        self._chapter = None
+        self._incidence = None
+        self._bits = None
+        self._chapter_bits = None
+
+    def __len__(self):
+        return len(self.chapter_index)
+
+    def _column(self, label):
+        column = self.column_index.get(label)
+        if column is None:
+            column = self.column_index[label] = len(self.labels)
+            self.labels.append(label)
+            self.column_rows.append([])
+        return column
+
+    def _rows(self):
+        """column_rows, rebuilt from the dense array or bitsets of a matrix read by load_file."""
+        if self.column_rows is None:
+            if self._incidence is not None:
+                self.column_rows = [np.flatnonzero(self._incidence[:, column]).tolist()
+                                    for column in range(len(self.labels))]
+            else:
+                self.column_rows = [[index * 8 + bit for index, byte in enumerate(bits.to_bytes(len(self) // 8 + 1,
+                                                                                              'little')) if byte
+                                     for bit in range(8) if byte >> bit & 1] for bits in self._bits]
+        return self.column_rows
+
+    def _chapter_number(self, chapter_id):
+        if chapter_id not in self.chapter_ids:
+            self.chapter_ids.append(chapter_id)
+        return self.chapter_ids.index(chapter_id)
+
+    # --- Aggregator ---
+
+    def partial(self, chapter_id):
+        partial = TagMatrix(self.multi_fields, self.single_fields)
+        partial._chapter = partial._chapter_number(chapter_id)
+        return partial
+
+    def add(self, segment):
+        row = len(self.chapter_index)
+        self.chapter_index.append(self._chapter)
+        # Partials hold one chapter, so the row is also the segment's position in it
+        order = segment.get("SegmentOrder")
+        self.positions.append(order if isinstance(order, int) else row + 1)
+        for field in self.single_fields:
+            value = segment.get(field)
+            if value and isinstance(value, str):
+                self.column_rows[self._column((field, value))].append(row)
+        for field in self.multi_fields:
+            for value in dict.fromkeys(multi_select_values(segment.get(field))):
+                self.column_rows[self._column((field, value))].append(row)
+
+    def merge(self, other):
+        offset = len(self.chapter_index)
+        chapters = [self._chapter_number(chapter_id) for chapter_id in other.chapter_ids]
+        self.chapter_index.extend(chapters[c] for c in other.chapter_index)
+        self.positions.extend(other.positions)
+        for label, rows in zip(other.labels, other._rows()):
+            self._rows()[self._column(label)].extend(row + offset for row in rows)
+        self._incidence = self._bits = self._chapter_bits = None
+
+    def dump(self):
+        return {"Chapters": self.chapter_ids, "ChapterIndex": self.chapter_index, "Positions": self.positions,
+                "Columns": [[field, value, rows] for (field, value), rows in zip(self.labels, self._rows())]}
+
+    def load(self, state):
+        self.chapter_ids = list(state["Chapters"])
+        self.chapter_index = list(state["ChapterIndex"])
+        self.positions = list(state["Positions"])
+        self.labels, self.column_index, self.column_rows = [], {}, []
+        for field, value, rows in state["Columns"]:
+            self.column_rows[self._column((field, value))].extend(rows)
+
+    def signature(self):
+        return f"TagMatrix:{json.dumps([self.single_fields, self.multi_fields])}"
+
+    # --- Backends ---
+
+    def incidence(self):
+        """The segments x columns boolean array (NumPy only)."""
+        if self._incidence is None:
+            incidence = np.zeros((len(self), len(self.labels)), dtype=bool)
+            for column, rows in enumerate(self._rows()):
+                incidence[rows, column] = True
+            self._incidence = incidence
+        return self._incidence
+
+    def bitsets(self):
+        """Each column as an int with bit i set when segment i carries the tag."""
+        if self._bits is None:
+            size = len(self) // 8 + 1
+            bits = []
+            for rows in self._rows():
+                column = bytearray(size)
+                for row in rows:
+                    column[row >> 3] |= 1 << (row & 7)
+                bits.append(int.from_bytes(column, 'little'))
+            self._bits = bits
+        return self._bits
+
+    def _chapter_bitsets(self):
+        if self._chapter_bits is None:
+            size = len(self) // 8 + 1
+            chapters = [bytearray(size) for _ in self.chapter_ids]
+            for row, chapter in enumerate(self.chapter_index):
+                chapters[chapter][row >> 3] |= 1 << (row & 7)
+            self._chapter_bits = [int.from_bytes(chapter, 'little') for chapter in chapters]
+        return self._chapter_bits
+
+    # --- Queries ---
+
+    def columns(self, field=None):
+        """Column numbers of a field's tags (all columns by default)."""
+        return [column for column, (name, _) in enumerate(self.labels) if field is None or name == field]
+
+    def counts(self, field=None):
+        """[((field, value), segments carrying it)] in descending count order."""
+        columns = self.columns(field)
+        if np is not None:
+            totals = self.incidence()[:, columns].sum(axis=0).tolist() if columns else []
+        else:
+            bits = self.bitsets()
+            totals = [bits[column].bit_count() for column in columns]
+        return sorted(zip([self.labels[column] for column in columns], totals), key=lambda item: -item[1])
+
+    def distribution(self, field):
+        """[((field, value), share of the field's tag occurrences)], largest first."""
+        counts = self.counts(field)
+        total = sum(count for _, count in counts)
+        return [(label, count / total if total else 0.0) for label, count in counts]
+
+    def cooccurrence(self, field_a=None, field_b=None):
+        """(row labels, column labels, counts) where counts[i][j] = segments carrying both tags."""
+        columns_a, columns_b = self.columns(field_a), self.columns(field_b)
+        if np is not None:
+            incidence = self.incidence()
+            a = incidence[:, columns_a].astype(np.int64)
+            b = incidence[:, columns_b].astype(np.int64)
+            counts = (a.T @ b).tolist()
+        else:
+            bits = self.bitsets()
+            counts = [[(bits[i] & bits[j]).bit_count() for j in columns_b] for i in columns_a]
+        return [self.labels[i] for i in columns_a], [self.labels[j] for j in columns_b], counts
+
+    def cooccurring(self, field, value, within=None):
+        """[((field, value), segments shared with the given tag)] for tags of `within` (any field), largest first."""
+        column = self.column_index.get((field, value))
+        if column is None:
+            return []
+        columns = [c for c in self.columns(within) if c != column]
+        if np is not None:
+            incidence = self.incidence()
+            shared = incidence[incidence[:, column]][:, columns].sum(axis=0).tolist() if columns else []
+        else:
+            bits = self.bitsets()
+            shared = [(bits[column] & bits[c]).bit_count() for c in columns]
+        result = [(self.labels[c], count) for c, count in zip(columns, shared) if count]
+        return sorted(result, key=lambda item: -item[1])
+
+    def chapter_histogram(self, field=None, normalize=False):
+        """(chapter IDs, column labels, counts[chapter][column]); normalize turns each chapter row into shares."""
+        columns = self.columns(field)
+        if np is not None:
+            histogram = np.zeros((len(self.chapter_ids), len(columns)), dtype=np.int64)
+            if len(self):
+                np.add.at(histogram, np.asarray(self.chapter_index), self.incidence()[:, columns].astype(np.int64))
+            if normalize:
+                totals = histogram.sum(axis=1, keepdims=True)
+                histogram = np.divide(histogram, totals, out=np.zeros(histogram.shape), where=totals > 0)
+            rows = histogram.tolist()
+        else:
+            bits = self.bitsets()
+            rows = [[(chapter & bits[column]).bit_count() for column in columns]
+                    for chapter in self._chapter_bitsets()]
+            if normalize:
+                rows = [[count / sum(row) if sum(row) else 0.0 for count in row] for row in rows]
+        return list(self.chapter_ids), [self.labels[column] for column in columns], rows
+
+    def segments(self, field, value):
+        """(chapter ID, position) of every segment carrying a tag."""
+        column = self.column_index.get((field, value))
+        if column is None:
+            return []
+        return [(self.chapter_ids[self.chapter_index[row]], self.positions[row]) for row in self._rows()[column]]
+
+    # --- Cache ---
+
+    def save(self, path, key=None):
+        """Writes the matrix to path: the dense array as packed bits in an .npz with NumPy, else the column bitsets."""
+        temp_file = f"{path}.tmp"
+        if np is not None:
+            with open(temp_file, 'wb') as f:
+                np.savez_compressed(
+                    f, incidence=np.packbits(self.incidence(), axis=0, bitorder='little'),
+                    segments=np.array(len(self)), chapter_index=np.asarray(self.chapter_index, dtype=np.int32),
+                    positions=np.asarray(self.positions, dtype=np.int64),
+                    meta=np.array(json.dumps({"Key": key, "Chapters": self.chapter_ids, "Labels": self.labels,
+                                              "Fields": [self.single_fields, self.multi_fields]})))
+        else:
+            size = len(self) // 8 + 1
+            state = {"Key": key, "Fields": [self.single_fields, self.multi_fields], "Segments": len(self),
+                     "Chapters": self.chapter_ids, "ChapterIndex": self.chapter_index, "Positions": self.positions,
+                     "Labels": self.labels,
+                     "Bits": [base64.b64encode(bits.to_bytes(size, 'little')).decode('ascii') for bits in self.bitsets()]}
+            # Bitsets barely compress; the fastest level is enough for the index arrays
+            with gzip.open(temp_file, 'wb', compresslevel=1) as f:
+                f.write(json.dumps(state).encode('utf-8'))
+        os.replace(temp_file, path)
+
+    @classmethod
+    def load_file(cls, path):
+        """Reads a matrix written by save(); returns (matrix, key)."""
+        if np is not None and str(path).endswith(".npz"):
+            with np.load(path) as data:
+                meta = json.loads(str(data["meta"]))
+                matrix = cls(meta["Fields"][1], meta["Fields"][0])
+                matrix.chapter_ids = meta["Chapters"]
+                matrix.chapter_index = data["chapter_index"].tolist()
+                matrix.positions = data["positions"].tolist()
+                incidence = np.unpackbits(data["incidence"], axis=0, count=int(data["segments"]),
+                                          bitorder='little').astype(bool)
+            for label in meta["Labels"]:
+                matrix._column(tuple(label))
+            matrix.column_rows = None
+            matrix._incidence = incidence
+            return matrix, meta["Key"]
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            state = json.load(f)
+        matrix = cls(state["Fields"][1], state["Fields"][0])
+        matrix.chapter_ids = state["Chapters"]
+        matrix.chapter_index = state["ChapterIndex"]
+        matrix.positions = state["Positions"]
+        for label in state["Labels"]:
+            matrix._column(tuple(label))
+        matrix.column_rows = None
+        matrix._bits = [int.from_bytes(base64.b64decode(bits), 'little') for bits in state["Bits"]]
+        return matrix, state["Key"]
+
+
+def load_matrix(files, cache_path=None, incremental=True, workers=1):
+    """The TagMatrix of the (chapter_id, path) files: from cache_path while none changed, else scanned and saved.
+
+    Returns (matrix, whether it came from the cache).
+    """
+    files = list(files)
+    key = corpus_key(files)
+    if cache_path is not None:
+        try:
+            matrix, saved_key = TagMatrix.load_file(cache_path)
+            if saved_key == key:
+                return matrix, True
+        except Exception as e:
+            if os.path.exists(cache_path):
+                print(f"Warning: Ignoring unreadable tag matrix cache {cache_path}: {e}")
+    matrix = TagMatrix()
+    scan_corpus(files, [matrix], incremental, workers)
+    if cache_path is not None:
+        matrix.save(cache_path, key)
+    return matrix, False
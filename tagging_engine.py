@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+"""
+Compiled multi-pattern matching for the segmenter's heuristic tagging.
+
+Every phrase (keyword, marker word, name) is registered once with a label and
+compiled into a single prefix-trie regular expression. Scanning a paragraph is
+then one pass over its lower-cased text that reports every phrase occurrence,
+instead of one substring or regex scan per keyword.
+"""
+import hashlib
+import json
+import re
+
+_WORD_CHAR = re.compile(r'\w')
+
+
+def _trie_to_pattern(node):
+    """Renders a character trie as a regex alternation, longest branches first."""
+    branches = [re.escape(ch) + _trie_to_pattern(child)
+                for ch, child in sorted(node.items()) if ch != ""]
+    if not branches:
+        return ""
+    if "" in node:
+        # The empty branch goes last so the engine prefers longer phrases.
+        branches.append("")
+    if len(branches) == 1:
+        return branches[0]
+    return "(?:" + "|".join(branches) + ")"
+
+
+def _is_word_char(text, index):
+    return 0 <= index < len(text) and _WORD_CHAR.match(text, index) is not None
+
+
+def _lower_with_offsets(text):
+    """Lower-cases text and maps offsets back when lower() changes its length."""
+    lowered = text.lower()
+    if len(lowered) == len(text):
+        return lowered, None
+    offsets = []
+    for i, ch in enumerate(text):
+        offsets.extend([i] * len(ch.lower()))
+    offsets.append(len(text))
+    return lowered, offsets
+
+
+class PhraseMatcher:
+    """Finds every registered phrase in a text with a single regex pass.
+
+    Phrases are matched against the lower-cased text, like the original
+    `keyword in text.lower()` checks. A phrase can additionally require word
+    boundaries at both ends (the `\\b...\\b` regex markers) or an exact-case
+    match against the original text.
+    """
+
+    def __init__(self):
+        self._rules = {}
+        self._regex = None
+        self._prefixes = {}
+
+    def add(self, phrase, label, whole_word=False, case_sensitive=False):
+        """Registers a phrase; it is reported as `label` when found."""
+        key = phrase.lower()
+        if not key:
+            raise ValueError("Cannot register an empty phrase")
+        original = phrase if case_sensitive else None
+        self._rules.setdefault(key, []).append((label, whole_word, original))
+        self._regex = None
+        return self
+
+    def compile(self):
+        """Builds the combined pattern. Called lazily on first use."""
+        trie = {}
+        for key in self._rules:
+            node = trie
+            for ch in key:
+                node = node.setdefault(ch, {})
+            node[""] = {}
+        # The lookahead matches at every position a phrase starts, so phrases
+        # that overlap or sit inside longer ones are all seen.
+        self._regex = re.compile("(?=(" + _trie_to_pattern(trie) + "))")
+        # The trie regex reports the longest phrase at each position; every
+        # shorter phrase starting at the same position is one of its prefixes.
+        self._prefixes = {}
+        for key in self._rules:
+            expansions = []
+            for length in range(1, len(key) + 1):
+                for label, whole_word, original in self._rules.get(key[:length], ()):
+                    expansions.append((length, label, whole_word, original))
+            self._prefixes[key] = expansions
+        return self
+
+    def _accepts(self, text, start, end, whole_word, original):
+        # Word boundaries are judged on the original text, as `\b` would be
+        if whole_word and (_is_word_char(text, start - 1) == _is_word_char(text, start) or
+                           _is_word_char(text, end - 1) == _is_word_char(text, end)):
+            return False
+        return original is None or text[start:end] == original
+
+    def _scan(self, text, skip_labels=None):
+        if not self._rules:
+            return
+        if self._regex is None:
+            self.compile()
+        lowered, offsets = _lower_with_offsets(text)
+        for match in self._regex.finditer(lowered):
+            start = match.start()
+            for length, label, whole_word, original in self._prefixes[match.group(1)]:
+                if skip_labels is not None and label in skip_labels:
+                    continue
+                if offsets is None:
+                    orig_start, orig_end = start, start + length
+                else:
+                    orig_start, orig_end = offsets[start], offsets[start + length]
+                if (not whole_word and original is None) or \
+                        self._accepts(text, orig_start, orig_end, whole_word, original):
+                    yield orig_start, orig_end, label
+
+    def finditer(self, text):
+        """Yields (start, end, label) for every phrase occurrence in text."""
+        return self._scan(text)
+
+    def labels(self, text):
+        """Returns the set of labels found anywhere in text."""
+        found = set()
+        # Labels already found are skipped rather than re-verified
+        for _, _, label in self._scan(text, skip_labels=found):
+            found.add(label)
+        return found
+
+
+class CharacterIndex:
+    """Gazetteer of character (and place) names with aliases.
+
+    All names and aliases are compiled into one PhraseMatcher, so finding every
+    mention in a paragraph is a single pass no matter how long the cast list is.
+    Matching is whole-word and case-insensitive; mentions are reported under the
+    canonical name.
+    """
+
+    def __init__(self):
+        self._matcher = PhraseMatcher()
+        self._names = {}
+        self._surface_forms = {}
+
+    @classmethod
+    def from_config(cls, known_characters):
+        """Builds an index from the `known_characters` config value.
+
+        Accepts a list whose entries are either plain names or objects like
+        {"name": "Director Thorne", "aliases": ["Thorne"]}, or a mapping of
+        canonical name to a list of aliases.
+        """
+        index = cls()
+        if isinstance(known_characters, dict):
+            entries = [{"name": name, "aliases": aliases or []}
+                       for name, aliases in known_characters.items()]
+        else:
+            entries = known_characters or []
+        for entry in entries:
+            if isinstance(entry, str):
+                index.add(entry)
+            else:
+                index.add(entry["name"], entry.get("aliases", []))
+        return index
+
+    def add(self, name, aliases=()):
+        """Registers a canonical name and its aliases."""
+        self._names.setdefault(name, None)
+        for surface in [name, *aliases]:
+            self._surface_forms.setdefault(surface, name)
+            self._matcher.add(surface, name, whole_word=True)
+        return self
+
+    @property
+    def names(self):
+        return list(self._names)
+
+    def __len__(self):
+        return len(self._names)
+
+    def fingerprint(self):
+        """Returns a stable hash of the names and aliases, for cache invalidation."""
+        forms = json.dumps(sorted(self._surface_forms.items()), ensure_ascii=False)
+        return hashlib.sha1(forms.encode('utf-8')).hexdigest()
+
+    def resolve(self, surface):
+        """Returns the canonical name for an exact name or alias, else None."""
+        return self._surface_forms.get(surface)
+
+    def find_mentions(self, text):
+        """Returns (start, end, canonical_name) for every mention, in text order."""
+        return sorted(self._matcher.finditer(text))
+
+    def characters_in(self, text):
+        """Returns the sorted canonical names mentioned in text."""
+        return sorted(self._matcher.labels(text))
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+airtable_uploader.sync_files against the mock Airtable API: the first sync
+creates (or adopts) every segment, later ones send only creates, changed
+fields and deletes, and failed creates are adopted by Segment ID instead of
+being sent twice. Run with: python -m pytest -q
+"""
+import json
+from collections import Counter
+
+import airtable_uploader
+from conftest import BASE_ID, CHAPTERS_TABLE, SEGMENTS_TABLE, segment_records, write_chapter
+
+OPTIONS = {"requests_per_second": 100}
+
+
+def sync(server, files, state_file, **options):
+    return airtable_uploader.sync_files("key", BASE_ID, CHAPTERS_TABLE, SEGMENTS_TABLE, [str(f) for f in files],
+                                        str(state_file), api_url=server.api_url, **dict(OPTIONS, **options))
+
+
+def sync_until_clean(server, files, state_file, attempts=10, **options):
+    """Re-runs the sync until nothing fails, as a user would; returns the totals of the last run."""
+    for _ in range(attempts):
+        totals = sync(server, files, state_file, **options)
+        if totals is not None and not totals["failed"]:
+            return totals
+    raise AssertionError("sync kept failing")
+
+
+def segment_ids(server):
+    return Counter(record["fields"]["Segment ID"] for record in segment_records(server))
+
+
+def test_sync_sends_only_changes(airtable, tmp_path):
+    server = airtable()
+    files = [write_chapter(tmp_path, 1, 25), write_chapter(tmp_path, 2, 12)]
+    state_file = tmp_path / "state.json"
+
+    totals = sync(server, files, state_file)
+    assert (totals["created"], totals["updated"], totals["deleted"], totals["failed"]) == (37, 0, 0, 0)
+    state = json.loads(state_file.read_text())
+    assert len(state["Segments"]) == 37
+    assert set(state["Chapters"]) == {"CH1", "CH2"}
+
+    # Unchanged files: only the chapter index is requested
+    requests = server.mock.stats["requests"]
+    totals = sync(server, files, state_file)
+    assert (totals["created"], totals["updated"], totals["deleted"]) == (0, 0, 0)
+    assert server.mock.stats["requests"] == requests + 1
+
+    # One edited, one removed and one new segment
+    data = json.loads(files[0].read_text())
+    data["Segments"][0]["SegmentText"] = "Edited."
+    removed = data["Segments"].pop(5)["SegmentID"]
+    data["Segments"].append({"SegmentID": "CH1_SEG00026", "SegmentOrder": 26, "SegmentText": "New."})
+    files[0].write_text(json.dumps(data))
+    totals = sync(server, files, state_file)
+    assert (totals["created"], totals["updated"], totals["deleted"]) == (1, 1, 1)
+
+    ids = segment_ids(server)
+    assert len(ids) == 37 and max(ids.values()) == 1 and removed not in ids
+    edited = [r for r in segment_records(server) if r["fields"]["Segment ID"] == "CH1_SEG00001"]
+    assert edited[0]["fields"]["Segment Text"] == "Edited."
+
+
+def test_sync_deletes_segments_of_removed_chapter_files(airtable, tmp_path):
+    server = airtable()
+    files = [write_chapter(tmp_path, 1, 8), write_chapter(tmp_path, 2, 5)]
+    state_file = tmp_path / "state.json"
+    sync(server, files, state_file)
+
+    files[1].unlink()
+    totals = sync(server, files[:1], state_file)
+    assert totals["deleted"] == 5
+    assert len(segment_records(server)) == 8
+    state = json.loads(state_file.read_text())
+    assert set(state["Files"]) == {"CH1"} and len(state["Segments"]) == 8
+
+
+def test_first_sync_adopts_existing_segments_and_drops_duplicates(airtable, tmp_path):
+    server = airtable()
+    files = [write_chapter(tmp_path, 1, 15)]
+    # Two plain uploads leave every segment in Airtable twice
+    for _ in range(2):
+        airtable_uploader.upload_files("key", BASE_ID, CHAPTERS_TABLE, SEGMENTS_TABLE, [str(files[0])],
+                                       api_url=server.api_url, **OPTIONS)
+    assert len(segment_records(server)) == 30
+
+    totals = sync(server, files, tmp_path / "state.json")
+    assert (totals["created"], totals["deleted"], totals["failed"]) == (0, 15, 0)
+    assert segment_ids(server) == Counter(f"CH1_SEG{order:05d}" for order in range(1, 16))
+
+
+def test_failed_creates_are_adopted_not_duplicated(airtable, tmp_path):
+    # Server errors before the write, and writes applied but answered with a 504; one request at a
+    # time so the seeded faults hit the same requests on every run
+    server = airtable(error_rate=0.1, lost_response_rate=0.3)
+    files = [write_chapter(tmp_path, 1, 40), write_chapter(tmp_path, 2, 33)]
+    state_file = tmp_path / "state.json"
+    serial = {"max_in_flight": 1, "max_chapters": 1}
+
+    first = sync(server, files, state_file, **serial)
+    assert first is None or first["failed"] > 0
+    sync_until_clean(server, files, state_file, **serial)
+    assert server.mock.stats["lost"] > 0
+
+    ids = segment_ids(server)
+    assert len(ids) == 73 and max(ids.values()) == 1
+    state = json.loads(state_file.read_text())
+    assert len(state["Segments"]) == 73 and state["Unconfirmed"] == []
+    assert {record["id"] for record in segment_records(server)} == {s["id"] for s in state["Segments"].values()}
+
+
+def test_sync_reports_failure_when_it_cannot_start(airtable, tmp_path):
+    server = airtable(error_rate=1.0)
+    state_file = tmp_path / "state.json"
+    assert sync(server, [write_chapter(tmp_path, 1, 3)], state_file, max_retries=1) is None
+    assert server.mock.stats["requests"] == 2
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+airtable_uploader.upload_files and AsyncAirtableClient against the mock
+Airtable API: creates are retried only on 429, every batch outcome is
+journaled, and --resume sends each segment exactly once even when creates
+failed after being applied. Run with: python -m pytest -q
+"""
+import asyncio
+import json
+from collections import Counter
+
+import pytest
+import requests
+
+import airtable_api
+import airtable_uploader
+from conftest import BASE_ID, CHAPTERS_TABLE, SEGMENTS_TABLE, segment_records, write_chapter
+
+# One request at a time, so the seeded faults hit the same requests on every run
+OPTIONS = {"requests_per_second": 100, "max_in_flight": 1, "max_chapters": 1}
+
+
+def upload(server, files, journal_file, resume=False, **options):
+    return airtable_uploader.upload_files("key", BASE_ID, CHAPTERS_TABLE, SEGMENTS_TABLE, [str(f) for f in files],
+                                          journal_file=str(journal_file), resume=resume, api_url=server.api_url,
+                                          **dict(OPTIONS, **options))
+
+
+def journal_entries(journal_file):
+    return [json.loads(line) for line in journal_file.read_text().splitlines()]
+
+
+def run_client(server, coroutine_function, **options):
+    async def run():
+        client = airtable_api.AsyncAirtableClient("key", BASE_ID, api_url=server.api_url, **options)
+        try:
+            return await coroutine_function(client)
+        finally:
+            client.close()
+    return asyncio.run(run())
+
+
+def test_create_is_not_retried_on_server_error(airtable):
+    server = airtable(error_rate=1.0)
+    with pytest.raises(requests.exceptions.HTTPError):
+        run_client(server, lambda client: client.create(SEGMENTS_TABLE, [{"Segment ID": "CH1_SEG00001"}]))
+    assert server.mock.stats["requests"] == 1
+
+    with pytest.raises(requests.exceptions.HTTPError):
+        run_client(server, lambda client: client.list_records(SEGMENTS_TABLE), max_retries=3)
+    assert server.mock.stats["requests"] == 1 + 4
+
+
+def test_create_is_retried_on_rate_limit(airtable, monkeypatch):
+    server = airtable(rate_limit=2, retry_after=1)
+    monkeypatch.setattr(airtable_api, "retry_delay", lambda attempt, response=None: 0.5)
+
+    async def create_five(client):
+        return await asyncio.gather(*(client.create(SEGMENTS_TABLE, [{"Segment ID": f"S{n}"}]) for n in range(5)))
+
+    created = run_client(server, create_five, requests_per_second=100)
+    assert len(created) == 5
+    assert server.mock.stats["throttled"] > 0
+    assert len(segment_records(server)) == 5
+
+
+def test_upload_journals_every_batch(airtable, tmp_path):
+    server = airtable()
+    files = [write_chapter(tmp_path, 1, 23), write_chapter(tmp_path, 2, 7)]
+    journal_file = tmp_path / "journal.jsonl"
+
+    totals = upload(server, files, journal_file)
+    assert (totals["chapters"], totals["segments"], totals["failed"]) == (2, 30, 0)
+    entries = journal_entries(journal_file)
+    done = [entry for entry in entries if entry["Status"] == "done"]
+    assert len(entries) == 2 * len(done) == 8
+    assert sorted(sid for entry in done for sid in entry["SegmentIDs"]) == \
+        sorted(r["fields"]["Segment ID"] for r in segment_records(server))
+    assert all(len(entry["RecordIDs"]) == len(entry["SegmentIDs"]) for entry in done)
+
+
+def test_resume_sends_only_failed_batches(airtable, tmp_path):
+    server = airtable(error_rate=0.3)
+    files = [write_chapter(tmp_path, 1, 60), write_chapter(tmp_path, 2, 45)]
+    journal_file = tmp_path / "journal.jsonl"
+
+    totals = upload(server, files, journal_file, max_retries=0)
+    assert totals is None or totals["failed"] > 0
+    server.mock.error_rate = 0
+    before = len(segment_records(server))
+    totals = upload(server, files, journal_file, resume=True)
+    assert totals["failed"] == 0
+    assert totals["segments"] == 105 - before
+
+    ids = Counter(record["fields"]["Segment ID"] for record in segment_records(server))
+    assert len(ids) == 105 and max(ids.values()) == 1
+    assert len(server.mock.table(BASE_ID, CHAPTERS_TABLE)) == 2
+
+
+def test_resume_skips_creates_that_were_applied(airtable, tmp_path):
+    # Every write is applied but answered with a 504, so no batch is journaled as done
+    server = airtable(lost_response_rate=1.0)
+    server.mock.load({BASE_ID: {CHAPTERS_TABLE: [{"fields": {"Chapter ID": "CH1"}}]}})
+    files = [write_chapter(tmp_path, 1, 34)]
+    journal_file = tmp_path / "journal.jsonl"
+
+    totals = upload(server, files, journal_file)
+    assert (totals["segments"], totals["failed"]) == (0, 34)
+    assert len(segment_records(server)) == 34
+    assert {entry["Status"] for entry in journal_entries(journal_file)} == {"pending", "failed"}
+
+    server.mock.lost_response_rate = 0
+    requests_before = server.mock.stats["requests"]
+    totals = upload(server, files, journal_file, resume=True)
+    assert (totals["segments"], totals["failed"]) == (0, 0)
+    # Chapter index and one listing of Segment IDs; nothing is created again
+    assert server.mock.stats["requests"] == requests_before + 2
+    assert len(segment_records(server)) == 34
+    assert journal_entries(journal_file)[-1]["Reconciled"] is True
+
+    # Once every segment is journaled as done, a resume does not list the segments again
+    requests_before = server.mock.stats["requests"]
+    upload(server, files, journal_file, resume=True)
+    assert server.mock.stats["requests"] == requests_before + 1
+
+
+def test_upload_reports_failure_when_it_cannot_start(airtable, tmp_path):
+    server = airtable(error_rate=1.0)
+    assert upload(server, [write_chapter(tmp_path, 1, 3)], tmp_path / "journal.jsonl", max_retries=0) is None
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+scan_corpus(incremental=True) reuses the partials saved in .<file>.aggregates
+only while the file content and the aggregator configuration are unchanged.
+Run with: python -m pytest -q
+"""
+import json
+import os
+
+import pytest
+
+import corpus_scanner
+from corpus_scanner import ChapterStats, TagCounts, partials_path, scan_corpus, staging_files
+
+
+def write_chapter(directory, number, texts, tags=("Clue Introduction",)):
+    segments = [{"SegmentID": f"CH{number}_SEG{order:05d}", "SegmentText": text, "MysteryTags": list(tags),
+                 "PrimaryNarrativeMode": "Dialogue" if order % 2 else "Narration-Action"}
+                for order, text in enumerate(texts, 1)]
+    path = directory / f"chapter_{number}_segmented_granular.json"
+    path.write_text(json.dumps({"ChapterID": f"CH{number}", "Segments": segments}), encoding="utf-8")
+    return path
+
+
+@pytest.fixture
+def corpus(tmp_path):
+    for number in range(1, 4):
+        write_chapter(tmp_path, number, [f"word {n} " * n for n in range(1, 6 + number)])
+    return tmp_path
+
+
+def aggregators():
+    return [TagCounts(["PrimaryNarrativeMode"], ["MysteryTags"]), ChapterStats()]
+
+
+def scan(directory, incremental=True, workers=1, templates=None):
+    """Scans the corpus with fresh aggregators; returns (decoded, results)."""
+    templates = templates or aggregators()
+    read, decoded = scan_corpus(staging_files(str(directory)), templates, incremental=incremental, workers=workers)
+    assert read == len(staging_files(str(directory)))
+    return decoded, [(a.counts if isinstance(a, TagCounts) else (a.segments, a.words)) for a in templates]
+
+
+def test_unchanged_files_are_not_decoded_again(corpus):
+    decoded, expected = scan(corpus)
+    assert decoded == 3
+    cache = json.loads(open(partials_path(str(corpus / "chapter_1_segmented_granular.json"))).read())
+    assert cache["Version"] == corpus_scanner.PARTIALS_VERSION and len(cache["Partials"]) == 2
+
+    assert scan(corpus) == (0, expected)
+    assert scan(corpus, incremental=False) == (3, expected)
+
+
+def test_touched_but_unchanged_file_is_a_hit(corpus):
+    _, expected = scan(corpus)
+    path = corpus / "chapter_2_segmented_granular.json"
+    os.utime(path, ns=(0, path.stat().st_mtime_ns + 10 ** 9))
+    assert scan(corpus) == (0, expected)
+    # The new mtime is recorded, so the hash is not recomputed next time
+    assert json.loads(open(partials_path(str(path))).read())["MTime"] == path.stat().st_mtime_ns
+
+
+def test_edited_file_is_rescanned(corpus):
+    scan(corpus)
+    write_chapter(corpus, 2, ["one two three"], tags=("Red Herring",))
+    decoded, results = scan(corpus)
+    assert decoded == 1
+    assert results == scan(corpus, incremental=False)[1]
+    counts, (segments, words) = results
+    assert counts["MysteryTags"]["Red Herring"] == 1 and segments["CH2"] == 1 and words["CH2"] == 3
+
+
+def test_only_new_aggregators_are_scanned(corpus):
+    scan(corpus, templates=[ChapterStats()])
+    cache_file = partials_path(str(corpus / "chapter_1_segmented_granular.json"))
+    assert len(json.loads(open(cache_file).read())["Partials"]) == 1
+
+    decoded, results = scan(corpus)
+    assert decoded == 3
+    assert len(json.loads(open(cache_file).read())["Partials"]) == 2
+    assert scan(corpus) == (0, results)
+    # A different configuration of the same aggregator has its own signature
+    assert scan(corpus, templates=[ChapterStats(count_words=False)])[0] == 3
+
+
+def test_stale_or_corrupt_cache_is_ignored(corpus, monkeypatch):
+    _, expected = scan(corpus)
+    open(partials_path(str(corpus / "chapter_1_segmented_granular.json")), "w").write("{not json")
+    assert scan(corpus) == (1, expected)
+
+    monkeypatch.setattr(corpus_scanner, "PARTIALS_VERSION", corpus_scanner.PARTIALS_VERSION + 1)
+    assert scan(corpus) == (3, expected)
+    assert scan(corpus) == (0, expected)
+
+
+def test_parallel_scan_uses_the_same_cache(corpus):
+    _, expected = scan(corpus, workers=2)
+    assert scan(corpus, workers=1) == (0, expected)
+    write_chapter(corpus, 3, ["changed"])
+    assert scan(corpus, workers=2)[0] == 1
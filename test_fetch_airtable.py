@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+"""
+fetch_airtable_data against the mock Airtable API: incremental fetches
+download only records modified since the stored high-water mark and merge
+them into the cached files, and NDJSON (optionally gzipped) output is
+streamed page by page and resumed from its .progress file. Run with:
+python -m pytest -q
+"""
+import asyncio
+import gzip
+import json
+import os
+import zlib
+
+import pytest
+
+import airtable_api
+import fetch_airtable_data
+from conftest import BASE_ID, CHAPTERS_TABLE, SEGMENTS_TABLE
+from json_stream import iter_records
+from mock_airtable_server import MockError
+
+LAST_MODIFIED = fetch_airtable_data.LAST_MODIFIED_FIELD
+OPTIONS = {"requests_per_second": 100}
+
+
+def stamp(second):
+    return f"2024-01-01T00:{second // 60:02d}:{second % 60:02d}.000Z"
+
+
+def load_tables(server, chapters, segments):
+    """Preloads the mock with records last modified in the past, one second apart."""
+    server.mock.load({BASE_ID: {
+        CHAPTERS_TABLE: [{"fields": {"Chapter ID": f"CH{n}", LAST_MODIFIED: stamp(n)}} for n in range(chapters)],
+        SEGMENTS_TABLE: [{"fields": {"Segment ID": f"CH1_SEG{n:05d}", "Segment Text": f"Text {n}.",
+                                     LAST_MODIFIED: stamp(n)}} for n in range(segments)],
+    }})
+
+
+def fetch(server, chapters_file, segments_file, **options):
+    return fetch_airtable_data.fetch_tables(str(chapters_file), str(segments_file), "key", BASE_ID,
+                                           api_url=server.api_url, **dict(OPTIONS, **options))
+
+
+def by_id(records):
+    return {record["id"]: record for record in records}
+
+
+def gzip_members(data):
+    count = 0
+    while data:
+        decompressor = zlib.decompressobj(wbits=31)
+        decompressor.decompress(data)
+        data = decompressor.unused_data
+        count += 1
+    return count
+
+
+def run_client(server, coroutine_function):
+    async def run():
+        client = airtable_api.AsyncAirtableClient("key", BASE_ID, api_url=server.api_url)
+        try:
+            return await coroutine_function(client)
+        finally:
+            client.close()
+    return asyncio.run(run())
+
+
+def test_modified_since_formula_includes_the_boundary(airtable):
+    formula = fetch_airtable_data.modified_since_formula(LAST_MODIFIED, stamp(5))
+    assert formula == "NOT(IS_BEFORE({Last Modified}, '2024-01-01T00:00:05.000Z'))"
+    server = airtable()
+    load_tables(server, 0, 10)
+    records = run_client(server, lambda client: client.list_records(SEGMENTS_TABLE, filter_formula=formula))
+    assert sorted(r["fields"][LAST_MODIFIED] for r in records) == [stamp(n) for n in range(5, 10)]
+
+
+def test_high_water_mark():
+    records = [{"fields": {LAST_MODIFIED: stamp(n)}} for n in (3, 9, 4)] + [{"fields": {}}]
+    assert fetch_airtable_data.high_water_mark(records, LAST_MODIFIED) == stamp(9)
+    assert fetch_airtable_data.high_water_mark(records, LAST_MODIFIED, stamp(12)) == stamp(12)
+    assert fetch_airtable_data.high_water_mark([], LAST_MODIFIED, stamp(2)) == stamp(2)
+    assert fetch_airtable_data.high_water_mark([{"fields": {}}], LAST_MODIFIED) is None
+
+
+def test_merge_records_keeps_order_and_drops_deleted():
+    cached = [{"id": "a", "v": 1}, {"id": "b", "v": 1}, {"id": "c", "v": 1}]
+    changed = [{"id": "d", "v": 2}, {"id": "b", "v": 2}]
+    merged, deleted = fetch_airtable_data.merge_records(cached, changed, {"b", "c", "d"})
+    assert merged == [{"id": "b", "v": 2}, {"id": "c", "v": 1}, {"id": "d", "v": 2}]
+    assert deleted == 1
+
+
+def test_incremental_fetch_merges_changes(airtable, tmp_path, capsys):
+    # Injected 5xx responses are retried by the client and must not change the result
+    server = airtable(error_rate=0.1)
+    load_tables(server, 3, 250)
+    chapters_file, segments_file = tmp_path / "chapters.json", tmp_path / "segments.json"
+    state_file = tmp_path / fetch_airtable_data.FETCH_STATE_FILENAME
+
+    assert fetch(server, chapters_file, segments_file, state_file=str(state_file)) == (3, 250)
+    state = json.loads(state_file.read_text())
+    assert state["Tables"][SEGMENTS_TABLE]["HighWaterMark"] == stamp(249)
+    assert state["Tables"][CHAPTERS_TABLE]["HighWaterMark"] == stamp(2)
+
+    # Two edits, one delete and one new record, stamped now
+    table = server.mock.table(BASE_ID, SEGMENTS_TABLE)
+    ids = list(table)
+
+    async def change(client):
+        await client.update(SEGMENTS_TABLE, [{"id": ids[10], "fields": {"Segment Text": "Edited."}},
+                                             {"id": ids[200], "fields": {"Segment Text": "Edited too."}}])
+        await client.delete(SEGMENTS_TABLE, [ids[50]])
+        return await client.create(SEGMENTS_TABLE, [{"Segment ID": "CH1_SEG00250"}])
+    run_client(server, change)
+    capsys.readouterr()
+
+    assert fetch(server, chapters_file, segments_file, state_file=str(state_file)) == (3, 250)
+    output = capsys.readouterr().out
+    # The boundary record is fetched again along with the three changed ones
+    assert f"{SEGMENTS_TABLE}: 4 changed since {stamp(249)}, 1 deleted." in output
+    assert f"{CHAPTERS_TABLE}: 1 changed since {stamp(2)}, 0 deleted." in output
+
+    merged = json.loads(segments_file.read_text())
+    assert by_id(merged) == by_id(table.values())
+    assert [record["id"] for record in merged][:10] == ids[:10]
+    state = json.loads(state_file.read_text())
+    assert state["Tables"][SEGMENTS_TABLE]["HighWaterMark"] == max(r["fields"][LAST_MODIFIED] for r in merged)
+
+
+def test_incremental_fetch_refetches_when_the_projection_changes(airtable, tmp_path, capsys):
+    server = airtable()
+    load_tables(server, 2, 30)
+    chapters_file, segments_file = tmp_path / "chapters.json", tmp_path / "segments.json"
+    state_file = str(tmp_path / fetch_airtable_data.FETCH_STATE_FILENAME)
+    fetch(server, chapters_file, segments_file, state_file=state_file)
+
+    fields = {SEGMENTS_TABLE: ["Segment ID"]}
+    capsys.readouterr()
+    assert fetch(server, chapters_file, segments_file, state_file=state_file, fields=fields) == (2, 30)
+    assert f"{SEGMENTS_TABLE}: " not in capsys.readouterr().out
+    merged = json.loads(segments_file.read_text())
+    assert all(set(record["fields"]) == {"Segment ID", LAST_MODIFIED} for record in merged)
+
+
+@pytest.mark.parametrize("suffix", [".ndjson", ".ndjson.gz"])
+def test_ndjson_fetch_streams_every_page(airtable, tmp_path, suffix):
+    server = airtable(error_rate=0.1)
+    load_tables(server, 3, 250)
+    chapters_file, segments_file = tmp_path / f"chapters{suffix}", tmp_path / f"segments{suffix}"
+
+    assert fetch(server, chapters_file, segments_file) == (3, 250)
+    assert by_id(iter_records(segments_file)) == by_id(server.mock.table(BASE_ID, SEGMENTS_TABLE).values())
+    assert not os.path.exists(f"{segments_file}.progress")
+    if suffix.endswith(".gz"):
+        # One gzip member per page of 100 records
+        assert gzip_members(segments_file.read_bytes()) == 3
+        assert len(gzip.decompress(segments_file.read_bytes()).splitlines()) == 250
+
+
+@pytest.mark.parametrize("suffix", [".ndjson", ".ndjson.gz"])
+def test_ndjson_fetch_resumes_after_the_last_saved_page(airtable, tmp_path, monkeypatch, suffix):
+    server = airtable()
+    load_tables(server, 3, 250)
+    chapters_file, segments_file = tmp_path / f"chapters{suffix}", tmp_path / f"segments{suffix}"
+    progress_file = f"{segments_file}.progress"
+
+    # The third page of segments keeps failing until the outage ends
+    pages = []
+    outage = {"on": True}
+    handle = server.mock.handle
+
+    def flaky_handle(method, base_id, table_name, params, body):
+        if table_name == SEGMENTS_TABLE and method == "GET":
+            if outage["on"] and len(pages) >= 2:
+                raise MockError(503, "SERVER_ERROR", "Injected outage")
+            pages.append(params)
+        return handle(method, base_id, table_name, params, body)
+    monkeypatch.setattr(server.mock, "handle", flaky_handle)
+
+    assert fetch(server, chapters_file, segments_file) is None
+    progress = json.loads(open(progress_file).read())
+    assert progress["Records"] == 200 and progress["Bytes"] == segments_file.stat().st_size
+    # A page torn by the interruption is cut off on resume
+    with open(segments_file, "ab") as f:
+        f.write(b'{"id": "recTorn", "fie')
+
+    outage["on"] = False
+    assert fetch(server, chapters_file, segments_file, resume=True) == (3, 250)
+    assert len(pages) == 3
+    assert by_id(iter_records(segments_file)) == by_id(server.mock.table(BASE_ID, SEGMENTS_TABLE).values())
+    assert not os.path.exists(progress_file)
+
+
+@pytest.mark.parametrize("saved_fields, fields", [(None, ["Segment ID"]), (["Segment ID"], ["Segment ID"])],
+                         ids=["projection-changed", "offset-expired"])
+def test_ndjson_resume_starts_over(airtable, tmp_path, saved_fields, fields):
+    server = airtable()
+    load_tables(server, 1, 150)
+    chapters_file, segments_file = tmp_path / "chapters.ndjson", tmp_path / "segments.ndjson"
+    segments_file.write_text('{"id": "recStale"}\n')
+    with open(f"{segments_file}.progress", "w") as f:
+        json.dump({"Table": SEGMENTS_TABLE, "Offset": "expired", "Records": 1,
+                   "Bytes": segments_file.stat().st_size, "Fields": saved_fields}, f)
+
+    assert fetch(server, chapters_file, segments_file, resume=True, fields={SEGMENTS_TABLE: fields}) == (1, 150)
+    records = list(iter_records(segments_file))
+    assert len(records) == 150 and all(set(record["fields"]) == {"Segment ID"} for record in records)
+
+
+def test_incremental_fetch_rejects_ndjson_output(airtable, tmp_path):
+    server = airtable()
+    state_file = str(tmp_path / fetch_airtable_data.FETCH_STATE_FILENAME)
+    assert fetch(server, tmp_path / "chapters.json", tmp_path / "segments.ndjson", state_file=state_file) is None
+    assert server.mock.stats["requests"] == 0
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+json_stream.iter_records must yield exactly what json.load sees, for every
+file layout it reads and for any read-ahead chunk size (tiny chunks cut
+strings, escapes and numbers at the buffer edge). Run with: python -m pytest -q
+"""
+import gzip
+import json
+
+import pytest
+
+import json_stream
+from json_stream import iter_records, load_header
+
+RECORDS = [
+    {"id": "rec1", "fields": {"Segment ID": "CH1_SEG00001", "Segment Text": "Plain text.", "Segment Order": 1}},
+    {"id": "rec2", "fields": {"Segment Text": "Quotes \" and \\ backslashes, été — \U0001f50d",
+                              "Score": 12.5, "Big": 12345678901234567890, "Tiny": -1e-7, "Flags": [True, None]}},
+    {"id": "rec3", "fields": {}},
+    {"id": "rec4", "fields": {"Nested": {"a": [1, [2, {"b": "]},{"}]], "c": ""}, "Segment Order": 10}},
+]
+
+
+@pytest.fixture(params=[1, 5, 64, json_stream.CHUNK_SIZE], ids=lambda size: f"chunk{size}")
+def chunk_size(request, monkeypatch):
+    monkeypatch.setattr(json_stream, "CHUNK_SIZE", request.param)
+    return request.param
+
+
+def write(path, text):
+    if str(path).endswith(".gz"):
+        with gzip.open(path, "wt", encoding="utf-8") as f:
+            f.write(text)
+    else:
+        path.write_text(text, encoding="utf-8")
+    return path
+
+
+@pytest.mark.parametrize("name", ["records.json", "records.json.gz"])
+@pytest.mark.parametrize("indent", [None, 4])
+def test_array_roundtrip(tmp_path, chunk_size, name, indent):
+    path = write(tmp_path / name, json.dumps(RECORDS, indent=indent, ensure_ascii=False))
+    assert list(iter_records(path)) == RECORDS
+
+
+def test_object_members_and_header(tmp_path, chunk_size):
+    chapter = {"ChapterID": "CH1", "Meta": {"Tags": ["x"], "Count": 2.0}, "Segments": RECORDS, "After": [1]}
+    path = write(tmp_path / "chapter.json", json.dumps(chapter, indent=4))
+
+    header = {}
+    assert list(iter_records(path, header=header)) == RECORDS
+    assert header == {"ChapterID": "CH1", "Meta": {"Tags": ["x"], "Count": 2.0}}
+    assert load_header(path) == header
+
+    # An array before the named member is decoded into the header, not yielded
+    chapter = {"Order": [3, 1, 2], "ChapterID": "CH2", "Segments": RECORDS}
+    path = write(tmp_path / "chapter.json", json.dumps(chapter))
+    assert list(iter_records(path)) == [3, 1, 2]
+    header = {}
+    assert list(iter_records(path, key="Segments", header=header)) == RECORDS
+    assert header == {"Order": [3, 1, 2], "ChapterID": "CH2"}
+
+
+@pytest.mark.parametrize("name", ["records.ndjson", "records.jsonl", "records.ndjson.gz", "records.jsonl.gz"])
+def test_ndjson_roundtrip(tmp_path, name):
+    text = "".join(json.dumps(record, ensure_ascii=False) + "\n" + ("\n" if i == 1 else "")
+                   for i, record in enumerate(RECORDS))
+    assert list(iter_records(write(tmp_path / name, text))) == RECORDS
+
+
+def test_concatenated_gzip_members(tmp_path):
+    # fetch_airtable_data writes one gzip member per page
+    path = tmp_path / "records.ndjson.gz"
+    path.write_bytes(b"".join(gzip.compress((json.dumps(record) + "\n").encode("utf-8")) for record in RECORDS))
+    assert list(iter_records(path)) == RECORDS
+
+
+def test_field_projection(tmp_path, chunk_size):
+    path = write(tmp_path / "records.json", json.dumps(RECORDS))
+    projected = list(iter_records(path, fields=["Segment Order", "Missing"]))
+    assert projected == [{"id": record["id"], "fields": {name: value for name, value in record["fields"].items()
+                                                         if name == "Segment Order"}} for record in RECORDS]
+
+    segments = [{"SegmentID": "CH1_SEG00001", "SegmentText": "a", "MysteryTags": ["x"]}, {"SegmentText": "b"}]
+    path = write(tmp_path / "chapter.json", json.dumps({"ChapterID": "CH1", "Segments": segments}))
+    assert list(iter_records(path, fields=["SegmentID", "MysteryTags"])) == \
+        [{"SegmentID": "CH1_SEG00001", "MysteryTags": ["x"]}, {}]
+
+
+@pytest.mark.parametrize("text", ["[]", " [ ] ", '{"ChapterID": "CH1", "Segments": []}', '{"ChapterID": "CH1"}', "{}"])
+def test_empty_inputs(tmp_path, chunk_size, text):
+    assert list(iter_records(write(tmp_path / "empty.json", text))) == []
+
+
+@pytest.mark.parametrize("text", ['[{"id": 1} {"id": 2}]', '[{"id": 1},', '{"Segments" [1]}', "nope"])
+def test_malformed_input_raises(tmp_path, chunk_size, text):
+    with pytest.raises(json.JSONDecodeError):
+        list(iter_records(write(tmp_path / "bad.json", text)))
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+tag_matrix and pacing_analysis use NumPy when it is installed and pure
+Python otherwise. These tests run both paths on the same synthetic corpus
+(the pure-Python one by setting the module's np to None) and check that
+they give identical results. Run with: python -m pytest -q
+"""
+import copy
+import json
+import random
+
+import pytest
+
+import pacing_analysis
+import tag_matrix
+from corpus_scanner import MULTI_SELECT_FIELDS, scan_corpus, staging_files
+
+np = pytest.importorskip("numpy")
+
+MODES = ["Dialogue", "Narration-Action", "Narration-InteriorState", "Narration-Description"]
+TAGS = {field: [f"{field[:4]}{n}" for n in range(6)] for field in MULTI_SELECT_FIELDS}
+
+
+@pytest.fixture(scope="module")
+def corpus(tmp_path_factory):
+    """Seven staging files of random segments; one chapter is empty and some segments lack a SegmentOrder."""
+    directory = tmp_path_factory.mktemp("staging")
+    rng = random.Random(7)
+    for chapter in range(1, 8):
+        segments = []
+        for order in range(1, (0 if chapter == 4 else rng.randint(1, 60)) + 1):
+            segment = {
+                "SegmentID": f"CH{chapter}_SEG{order:05d}",
+                "SegmentText": " ".join("word" for _ in range(rng.randint(0, 40))),
+                "Narrative Mode": rng.choice(MODES),
+                "DialogueSpeaker": rng.choice([None, None, "Vance"]),
+            }
+            if rng.random() > 0.1:
+                segment["SegmentOrder"] = order
+            for field, values in TAGS.items():
+                # Lists (with the odd duplicate), single strings and missing fields all occur in staging data
+                kind = rng.random()
+                if kind < 0.6:
+                    segment[field] = rng.sample(values, rng.randint(0, 3)) + rng.sample(values, rng.randint(0, 1))
+                elif kind < 0.7:
+                    segment[field] = rng.choice(values)
+            segments.append(segment)
+        path = directory / f"chapter_{chapter}_segmented_granular.json"
+        path.write_text(json.dumps({"ChapterID": f"CH{chapter}", "Segments": segments}), encoding="utf-8")
+    return staging_files(str(directory))
+
+
+def scanned(corpus, aggregator):
+    scan_corpus(corpus, [aggregator])
+    return aggregator
+
+
+def matrix_queries(matrix):
+    results = {"counts": matrix.counts(), "distribution": matrix.distribution("MysteryTags"),
+               "cooccurrence": matrix.cooccurrence(), "pairs": matrix.cooccurrence("MysteryTags", "DialogueTone"),
+               "histogram": matrix.chapter_histogram("PlotFunctionTags"),
+               "shares": matrix.chapter_histogram(normalize=True)}
+    for field, values in TAGS.items():
+        for value in values[:2]:
+            results[f"{field}:{value}"] = (matrix.cooccurring(field, value),
+                                           matrix.cooccurring(field, value, within="MysteryTags"),
+                                           matrix.segments(field, value))
+    return results
+
+
+def test_tag_matrix_backends_agree(corpus, monkeypatch):
+    matrix = scanned(corpus, tag_matrix.TagMatrix(single_fields=["Narrative Mode"]))
+    with_numpy = matrix_queries(copy.deepcopy(matrix))
+    monkeypatch.setattr(tag_matrix, "np", None)
+    assert matrix_queries(copy.deepcopy(matrix)) == with_numpy
+
+
+def test_tag_matrix_cache_roundtrip(corpus, tmp_path, monkeypatch):
+    matrix = scanned(corpus, tag_matrix.TagMatrix())
+    expected = matrix_queries(copy.deepcopy(matrix))
+
+    matrix.save(tmp_path / "matrix.npz", key="k")
+    loaded, key = tag_matrix.TagMatrix.load_file(tmp_path / "matrix.npz")
+    assert key == "k"
+    assert matrix_queries(copy.deepcopy(loaded)) == expected
+    assert loaded._rows() == matrix.column_rows
+    # An .npz-loaded matrix also answers through the bitset backend
+    monkeypatch.setattr(tag_matrix, "np", None)
+    assert matrix_queries(loaded) == expected
+
+    matrix = scanned(corpus, tag_matrix.TagMatrix())
+    matrix.save(tmp_path / "matrix.json.gz", key="k")
+    loaded, key = tag_matrix.TagMatrix.load_file(tmp_path / "matrix.json.gz")
+    assert key == "k"
+    assert loaded._rows() == matrix.column_rows
+    assert matrix_queries(loaded) == expected
+
+
+def pacing_series(pacing, window):
+    series = [pacing.series([chapter_id], window) for chapter_id in pacing.chapters]
+    return series + [pacing.series(None, window)]
+
+
+@pytest.mark.parametrize("window", [1, 2, 5, 1000])
+def test_pacing_backends_agree(corpus, monkeypatch, window):
+    pacing = scanned(corpus, pacing_analysis.PacingSeries())
+    with_numpy = pacing_series(pacing, window)
+    monkeypatch.setattr(pacing_analysis, "np", None)
+    assert pacing_series(pacing, window) == with_numpy
+
+
+def test_pacing_matches_direct_computation(corpus):
+    pacing = scanned(corpus, pacing_analysis.PacingSeries())
+    columns = pacing.series(None, 3)
+    _, _, names, features = pacing.features()
+    for j, name in enumerate(names):
+        values = [row[j] for row in features]
+        for i in range(len(values)):
+            window = values[max(0, i - 2):i + 1]
+            assert columns[f"{name}_rolling"][i] == sum(window) / len(window)
+            assert columns[f"{name}_cumulative"][i] == sum(values[:i + 1])
+
+
+@pytest.mark.parametrize("numpy_installed", [True, False])
+def test_pacing_rejects_empty_window(corpus, monkeypatch, numpy_installed):
+    pacing = scanned(corpus, pacing_analysis.PacingSeries())
+    if not numpy_installed:
+        monkeypatch.setattr(pacing_analysis, "np", None)
+    for window in (0, -1):
+        with pytest.raises(ValueError):
+            pacing.series(None, window)